@@ -0,0 +1 @@
+"""Бенчмарки каталога курсов (запуск: python -m bench.<модуль>)"""
@@ -0,0 +1,104 @@
+"""Холодный старт: от запуска uvicorn до первого 200 на /readyz.
+
+Каждый прогон - новый процесс на подготовленной базе (миграции и тестовые
+данные делаются заранее, как в продакшене). Кроме полного времени,
+из /metrics берется длительность lifespan (app_startup_seconds). С --target-ms
+скрипт завершается с кодом 1, если медиана выше цели - удобно для CI.
+
+    python -m bench.coldstart --runs 5 --target-ms 3000
+    python -m bench.coldstart --database-url sqlite:///bench-large.db
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from bench.common import ROOT, git_revision
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get(url: str, timeout: float = 1.0):
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.status, response.read().decode()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode()
+
+
+def measure(env: dict, timeout: float) -> dict:
+    """Один запуск: секунды до готовности и длительность lifespan"""
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            if process.poll() is not None:
+                raise SystemExit(f"uvicorn завершился с кодом {process.returncode}")
+            if time.perf_counter() - started > timeout:
+                raise SystemExit(f"/readyz не ответил 200 за {timeout} с")
+            try:
+                status, _ = get(f"http://127.0.0.1:{port}/readyz")
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                status = None
+            if status == 200:
+                ready = time.perf_counter() - started
+                break
+            time.sleep(0.01)
+        _, metrics = get(f"http://127.0.0.1:{port}/metrics")
+        lifespan = next(
+            (float(line.split()[1]) for line in metrics.splitlines() if line.startswith("app_startup_seconds ")),
+            None,
+        )
+        return {"ready_ms": round(ready * 1000, 1), "lifespan_ms": round(lifespan * 1000, 1) if lifespan is not None else None}
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="по умолчанию - временная SQLite с тестовыми данными")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--target-ms", type=float, help="цель для медианы времени до готовности")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite:///{tmp}/coldstart.db"
+        env = dict(os.environ, DATABASE_URL=database_url, AUTO_SEED="0")
+        # Схема и данные - заранее, вне измеряемого старта
+        for command in ("migrate", "seed"):
+            subprocess.run([sys.executable, "main.py", command], cwd=ROOT, env=env, check=True, capture_output=True)
+        runs = [measure(env, args.timeout) for _ in range(args.runs)]
+
+    ready = [run["ready_ms"] for run in runs]
+    report = {
+        "revision": git_revision(),
+        "database": "sqlite (временная)" if not args.database_url else args.database_url.split(":", 1)[0],
+        "runs": runs,
+        "ready_ms": {"min": min(ready), "median": statistics.median(ready), "max": max(ready)},
+        "target_ms": args.target_ms,
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.target_ms and report["ready_ms"]["median"] > args.target_ms:
+        print(f"Медиана {report['ready_ms']['median']} мс выше цели {args.target_ms} мс", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Общие помощники бенчмарков: загрузка main с нужной БД и сводка латентностей"""
+import math
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_main(database_url: str = None):
+    """Импортирует main.py из корня репозитория (DATABASE_URL читается при импорте)"""
+    if database_url:
+        os.environ["DATABASE_URL"] = database_url
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    import main
+
+    return main
+
+
+def percentile(values: list, q: float) -> float:
+    """Перцентиль (nearest-rank) отсортированного списка"""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, math.ceil(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+def summarize(latencies: list, elapsed: float) -> dict:
+    """p50/p95/p99 в миллисекундах и RPS"""
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def git_revision() -> str:
+    """Текущий коммит - чтобы сравнивать прогоны во времени"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
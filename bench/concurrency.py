@@ -0,0 +1,110 @@
+"""Пропускная способность под конкурентной нагрузкой: DB_EXECUTION=inline против threadpool.
+
+Каждый режим запускается в отдельном процессе на временной SQLite-базе.
+Приложение вызывается in-process через ASGI (нужен httpx). Задержка
+удаленной БД эмулируется паузой перед каждым SQL-запросом (--db-latency-ms).
+
+    python -m bench.concurrency --concurrency 32 --requests 2000 --db-latency-ms 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.common import ROOT, summarize
+
+# Роуты, которые ходят в БД на каждом запросе
+PATHS = (
+    "/course/neural-networks",
+    "/api/course/midjourney-basics",
+    "/courses?query=нейросети",
+    "/api/courses?query=python",
+)
+
+
+async def _run(app, concurrency: int, requests: int) -> dict:
+    import httpx
+
+    latencies = []
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(PATHS[i % len(PATHS)])
+
+    async def worker(client):
+        while not queue.empty():
+            path = queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == 200, (path, response.status_code)
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+
+    return {
+        "mode": os.environ["DB_EXECUTION"],
+        "concurrency": concurrency,
+        **summarize(latencies, elapsed),
+    }
+
+
+def child(args):
+    """Один прогон в текущем процессе (режим берется из окружения)"""
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    from sqlalchemy import event
+    import main
+
+    if args.db_latency_ms:
+        @event.listens_for(main.engine, "before_cursor_execute")
+        def _network_latency(*_):
+            time.sleep(args.db_latency_ms / 1000)
+
+    print(json.dumps(asyncio.run(_run(main.app, args.concurrency, args.requests))))
+
+
+def parent(args):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("inline", "threadpool"):
+            env = dict(
+                os.environ,
+                DB_EXECUTION=mode,
+                AUTO_MIGRATE="1",
+                AUTO_SEED="1",
+                DATABASE_URL=f"sqlite:///{tmp}/bench-{mode}.db",
+            )
+            output = subprocess.run(
+                [sys.executable, "-m", "bench.concurrency", "--child", *sys.argv[1:]],
+                cwd=ROOT, env=env, check=True, capture_output=True, text=True,
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+    for result in results:
+        print(json.dumps(result, ensure_ascii=False))
+    inline, threadpool = results
+    print(f"threadpool / inline: x{threadpool['rps'] / inline['rps']:.2f} RPS")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--db-latency-ms", type=float, default=2.0)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+    else:
+        parent(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Синтетический каталог для нагрузочных тестов: курсы, теги и клики.
+
+Данные детерминированы (--seed), популярность курсов распределена по Ципфу,
+клики идут по времени в порядке id - как их пишет ClickBuffer. База должна
+быть пустой: схема создается миграциями, курсы пишутся тем же upsert, что и
+массовый импорт (с FTS5 и course_tags).
+
+    python -m bench.generate --preset small --database-url sqlite:///bench-small.db
+    python -m bench.generate --preset large --database-url postgresql://localhost/courses_bench
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+from sqlalchemy import bindparam, func, select
+
+from bench.common import import_main
+
+PRESETS = {
+    "small": {"courses": 1_000, "clicks": 100_000},
+    "medium": {"courses": 10_000, "clicks": 1_000_000},
+    "large": {"courses": 100_000, "clicks": 10_000_000},
+}
+
+CATEGORIES = {
+    "design": ["Midjourney", "Stable Diffusion", "Figma AI", "DALL-E", "Kandinsky", "Leonardo AI"],
+    "video": ["Runway", "Sora", "Pika", "HeyGen", "Synthesia", "Premiere Pro"],
+    "marketing": ["ChatGPT для SMM", "AI-копирайтинг", "таргетированная реклама", "контент-маркетинг"],
+    "automation": ["Zapier", "Make", "n8n", "RPA", "Telegram-боты", "Google Sheets"],
+    "coding": ["Python", "нейронные сети", "машинное обучение", "LLM API", "LangChain", "PyTorch"],
+    "business": ["AI-стратегия", "аналитика данных", "AI-стартап", "продуктовый менеджмент"],
+}
+PREFIXES = ["Основы", "Практикум:", "Продвинутый курс:", "Интенсив:", "С нуля:", "Мастер-класс:"]
+SUFFIXES = ["для начинающих", "для профессионалов", "на практике", "за 30 дней", "и автоматизация", "в бизнесе"]
+PROVIDERS = ["Нетология", "Skillbox", "GeekBrains", "Stepik", "Coursera", "Яндекс Практикум", "Udemy", "Practicum"]
+TAGS = [
+    "ai", "нейросети", "python", "ml", "design", "art", "video", "marketing", "smm", "chatgpt", "automation",
+    "no-code", "api", "data", "analytics", "business", "startup", "prompt", "llm", "bots", "figma", "ui/ux",
+    "копирайтинг", "контент", "генерация", "deep learning", "computer vision", "nlp", "excel", "продажи",
+] + [f"тема-{i}" for i in range(270)]
+LEVELS = ("beginner", "middle", "pro")
+FORMATS = ("online", "offline", "mixed")
+UTM_SOURCES = [None, None, "telegram", "vk", "youtube", "google", "yandex", "email"]
+UTM_CAMPAIGNS = [None, None, "spring-sale", "webinar", "retargeting", "newsletter"]
+REFERERS = [None, "https://yandex.ru/", "https://google.com/", "https://t.me/", "https://vk.com/"]
+
+COURSE_BATCH = 1_000
+CLICK_BATCH = 50_000
+
+
+def course_rows(count: int, rng: random.Random):
+    """Строки курсов в формате bulk-импорта"""
+    categories = list(CATEGORIES)
+    for i in range(count):
+        category = categories[i % len(categories)]
+        topic = rng.choice(CATEGORIES[category])
+        tags = {rng.choice(TAGS[:30]) for _ in range(2)} | {rng.choice(TAGS) for _ in range(rng.randint(1, 3))}
+        yield {
+            "slug": f"course-{i}",
+            "title": f"{rng.choice(PREFIXES)} {topic} {rng.choice(SUFFIXES)}",
+            "provider": rng.choice(PROVIDERS),
+            "category_slug": category,
+            "level": rng.choice(LEVELS),
+            "format": rng.choice(FORMATS),
+            "price_from": None if rng.random() < 0.05 else rng.randrange(0, 120_000, 500),
+            "duration": f"{rng.randint(1, 16)} недель",
+            "tags": ",".join(sorted(tags)),
+            "short_desc": f"{topic}: {rng.choice(SUFFIXES)}. Практические задания, обратная связь и сертификат.",
+            "affiliate_url": f"https://example.com/aff/course-{i}",
+            "is_published": rng.random() < 0.95,
+        }
+
+
+def generate(main, courses: int, clicks: int, days: int, seed: int, log=print):
+    rng = random.Random(seed)
+    with main.engine.connect() as connection:
+        if connection.execute(select(func.count()).select_from(main.Course.__table__)).scalar():
+            raise SystemExit("База не пустая: генератор пишет только в новую базу")
+
+    started = time.perf_counter()
+    batch = []
+    for row in course_rows(courses, rng):
+        batch.append(row)
+        if len(batch) == COURSE_BATCH:
+            with main.engine.begin() as connection:
+                main.write_courses(connection, batch)
+            batch = []
+    if batch:
+        with main.engine.begin() as connection:
+            main.write_courses(connection, batch)
+    log(f"курсы: {courses} за {time.perf_counter() - started:.1f} с")
+
+    with main.engine.connect() as connection:
+        ids = list(connection.execute(select(main.Course.id).order_by(main.Course.id)).scalars())
+    # Популярность по Ципфу в случайном порядке курсов
+    ranked = ids[:]
+    rng.shuffle(ranked)
+    cum_weights = list(accumulate(1 / (rank + 1) ** 1.1 for rank in range(len(ranked))))
+    counts = array("q", [0]) * (max(ids) + 1)
+
+    started = time.perf_counter()
+    start = datetime.now(timezone.utc) - timedelta(days=days)
+    step = days * 86400 / max(clicks, 1)
+    table = main.Click.__table__
+    for offset in range(0, clicks, CLICK_BATCH):
+        n = min(CLICK_BATCH, clicks - offset)
+        course_ids = rng.choices(ranked, cum_weights=cum_weights, k=n)
+        rows = []
+        for j, course_id in enumerate(course_ids):
+            counts[course_id] += 1
+            rows.append({
+                "course_id": course_id,
+                "ts": start + timedelta(seconds=(offset + j) * step),
+                "referer": rng.choice(REFERERS),
+                "utm_source": rng.choice(UTM_SOURCES),
+                "utm_campaign": rng.choice(UTM_CAMPAIGNS),
+            })
+        with main.engine.begin() as connection:
+            connection.execute(table.insert(), rows)
+        if offset and offset % (CLICK_BATCH * 20) == 0:
+            log(f"  клики: {offset}/{clicks}")
+    courses_table = main.Course.__table__
+    with main.engine.begin() as connection:
+        connection.execute(
+            courses_table.update()
+            .where(courses_table.c.id == bindparam("course_id"))
+            .values(clicks=bindparam("n")),
+            [{"course_id": course_id, "n": counts[course_id]} for course_id in ids]
+        )
+    log(f"клики: {clicks} за {time.perf_counter() - started:.1f} с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--preset", choices=PRESETS, default="small")
+    parser.add_argument("--courses", type=int, help="переопределяет пресет")
+    parser.add_argument("--clicks", type=int, help="переопределяет пресет")
+    parser.add_argument("--days", type=int, default=90, help="за сколько дней распределить клики")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    preset = PRESETS[args.preset]
+    courses = args.courses if args.courses is not None else preset["courses"]
+    clicks = args.clicks if args.clicks is not None else preset["clicks"]
+
+    app_module = import_main(args.database_url)
+    app_module.migrate_database()
+    app_module.init_search_index()
+    log = lambda message: print(message, file=sys.stderr)
+    generate(app_module, courses, clicks, args.days, args.seed, log)
+    print(json.dumps({"database_url": args.database_url, "courses": courses, "clicks": clicks, "seed": args.seed}))
+
+
+if __name__ == "__main__":
+    main()
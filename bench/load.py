@@ -0,0 +1,204 @@
+"""Нагрузочный тест основных страниц и API: латентность, RPS и запросы к БД.
+
+Драйверы: inprocess - приложение вызывается через ASGI в этом же процессе
+(нужен httpx; считаются SQL-запросы на каждый HTTP-запрос), http - запросы
+к уже запущенному серверу (--url). Каждый эндпоинт гоняется отдельной фазой
+с --concurrency параллельными клиентами; результат - JSON для сравнения
+прогонов (--output), краткая таблица - в stderr.
+
+    python -m bench.generate --preset large --database-url sqlite:///bench-large.db
+    python -m bench.load --driver inprocess --database-url sqlite:///bench-large.db --output runs/large.json
+    python -m bench.load --driver http --url http://localhost:8000 --concurrency 64
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import platform
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+from bench.common import git_revision, import_main, summarize
+
+ENDPOINTS = ("home", "courses", "category", "course", "out", "api_courses", "search")
+SORTS = ("popular", "trending", "new", "price_asc", "price_desc")
+SEARCH_WORDS = ("нейросети", "python", "midjourney", "автоматизация", "видео", "бизнес", "chatgpt", "дизайн")
+QUERY_HEADER = "x-bench-queries"
+
+_request_queries = contextvars.ContextVar("bench_request_queries", default=None)
+
+
+def make_path(endpoint: str, rng: random.Random, slugs: list, categories: list) -> str:
+    """Случайный, но воспроизводимый URL эндпоинта"""
+    if endpoint == "home":
+        return "/"
+    if endpoint == "courses":
+        return f"/courses?sort={rng.choice(SORTS)}&page={rng.randint(1, 5)}"
+    if endpoint == "category":
+        return f"/category/{rng.choice(categories)}?sort={rng.choice(SORTS)}"
+    if endpoint == "course":
+        return f"/course/{rng.choice(slugs)}"
+    if endpoint == "out":
+        return f"/out/{rng.choice(slugs)}?utm_source=bench"
+    if endpoint == "api_courses":
+        return f"/api/courses?category={rng.choice(categories)}&sort={rng.choice(SORTS)}&per_page=20"
+    if endpoint == "search":
+        return f"/api/courses?query={rng.choice(SEARCH_WORDS)}"
+    raise ValueError(endpoint)
+
+
+def count_queries(app_module):
+    """Оборачивает ASGI-приложение: число SQL-запросов запроса - в заголовке ответа"""
+    from sqlalchemy import event
+
+    def _count(*_):
+        holder = _request_queries.get()
+        if holder is not None:
+            holder[0] += 1
+
+    for engine in {app_module.engine, app_module.read_engine}:
+        event.listen(engine, "before_cursor_execute", _count)
+
+    app = app_module.app
+
+    async def counted(scope, receive, send):
+        if scope["type"] != "http":
+            return await app(scope, receive, send)
+        holder = [0]
+        token = _request_queries.set(holder)
+
+        async def send_with_count(message):
+            if message["type"] == "http.response.start":
+                message = dict(message, headers=[*message["headers"], (QUERY_HEADER.encode(), str(holder[0]).encode())])
+            await send(message)
+
+        try:
+            await app(scope, receive, send_with_count)
+        finally:
+            _request_queries.reset(token)
+
+    return counted
+
+
+async def discover(client, limit: int = 500):
+    """Slug'и и категории опубликованных курсов через API"""
+    slugs, categories, cursor = [], set(), None
+    while len(slugs) < limit:
+        params = {"per_page": 100, "with_total": "false"}
+        if cursor:
+            params["cursor"] = cursor
+        data = (await client.get("/api/courses", params=params)).json()
+        for course in data["courses"]:
+            slugs.append(course["slug"])
+            categories.add(course["category_slug"])
+        cursor = data.get("next_cursor")
+        if not cursor:
+            break
+    if not slugs:
+        raise SystemExit("В каталоге нет опубликованных курсов - сначала python -m bench.generate")
+    return slugs, sorted(categories)
+
+
+async def run_phase(client, endpoint: str, paths: list, concurrency: int) -> dict:
+    latencies, queries, errors = [], [], 0
+    queue = list(reversed(paths))
+
+    async def worker():
+        nonlocal errors
+        while queue:
+            path = queue.pop()
+            started = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+            if QUERY_HEADER in response.headers:
+                queries.append(int(response.headers[QUERY_HEADER]))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result = summarize(latencies, time.perf_counter() - started)
+    result["errors"] = errors
+    result["queries_per_request"] = round(sum(queries) / len(queries), 2) if queries else None
+    return result
+
+
+async def run(client, args) -> dict:
+    rng = random.Random(args.seed)
+    slugs, categories = await discover(client)
+    results = {}
+    for endpoint in args.endpoints:
+        for path in [make_path(endpoint, rng, slugs, categories) for _ in range(args.warmup)]:
+            await client.get(path)
+        paths = [make_path(endpoint, rng, slugs, categories) for _ in range(args.requests)]
+        results[endpoint] = await run_phase(client, endpoint, paths, args.concurrency)
+        print(
+            f"{endpoint:12} {results[endpoint]['rps']:>9} rps  p50 {results[endpoint]['p50_ms']:>8} ms  "
+            f"p95 {results[endpoint]['p95_ms']:>8} ms  p99 {results[endpoint]['p99_ms']:>8} ms  "
+            f"sql/req {results[endpoint]['queries_per_request']}  errors {results[endpoint]['errors']}",
+            file=sys.stderr,
+        )
+    return results
+
+
+async def run_inprocess(args) -> dict:
+    import httpx
+
+    app_module = import_main(args.database_url)
+    transport = httpx.ASGITransport(app=count_queries(app_module))
+    async with app_module.app.router.lifespan_context(app_module.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            results = await run(client, args)
+    with app_module.engine.connect() as connection:
+        meta = {"dialect": connection.dialect.name, "courses": len(app_module.get_catalog().rows)}
+    return {"results": results, **meta}
+
+
+async def run_http(args) -> dict:
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        return {"results": await run(client, args)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--driver", choices=("inprocess", "http"), default="inprocess")
+    parser.add_argument("--database-url", help="для inprocess (по умолчанию - DATABASE_URL)")
+    parser.add_argument("--url", default="http://localhost:8000", help="для http")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000, help="на каждый эндпоинт")
+    parser.add_argument("--warmup", type=int, default=50, help="запросов прогрева на эндпоинт (не учитываются)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="куда записать JSON (по умолчанию - stdout)")
+    args = parser.parse_args()
+
+    runner = run_inprocess if args.driver == "inprocess" else run_http
+    report = asyncio.run(runner(args))
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "driver": args.driver,
+        "target": args.url if args.driver == "http" else (args.database_url or os.getenv("DATABASE_URL")),
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "seed": args.seed,
+        **report,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""SQLite под конкурентной нагрузкой: прежний режим (SQLITE_WAL=0) против WAL.
+
+Оба режима гоняются на копиях одной сгенерированной базы. Читатели - приложение
+in-process через ASGI (нужен httpx): поиск по FTS, карточки неопубликованных
+курсов (идут в БД) и /out (клики пишет фоновый сброс). Параллельно --writers
+отдельных процессов, как другие воркеры, пишут пачки кликов в тот же файл.
+Сравниваются латентность и RPS чтений, число ошибок и пропускная способность
+записи.
+
+    python -m bench.sqlite --concurrency 32 --requests 4000 --writers 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from bench.common import ROOT, import_main, summarize
+from bench.load import SEARCH_WORDS
+
+MODES = {"legacy": "0", "wal": "1"}
+
+
+def course_slugs(main):
+    """Slug'и опубликованных и скрытых курсов (скрытые роуты читают из БД)"""
+    from sqlalchemy import select
+
+    table = main.Course.__table__
+    with main.engine.connect() as connection:
+        published = list(connection.execute(select(table.c.slug).where(table.c.is_published == True).limit(500)).scalars())
+        hidden = list(connection.execute(select(table.c.slug).where(table.c.is_published == False).limit(500)).scalars())
+    return published, hidden or published
+
+
+def make_paths(main, requests: int, seed: int) -> list:
+    """Смесь запросов, которые ходят в БД на каждом хите"""
+    published, hidden = course_slugs(main)
+    rng = random.Random(seed)
+    kinds = [
+        lambda: f"/api/courses?query={rng.choice(SEARCH_WORDS)}&page={rng.randint(1, 3)}",
+        lambda: f"/course/{rng.choice(hidden)}",
+        lambda: f"/out/{rng.choice(published)}?utm_source=bench",
+    ]
+    return [kinds[i % len(kinds)]() for i in range(requests)]
+
+
+def db_load(main, requests: int, concurrency: int, seed: int) -> dict:
+    """Те же чтения без HTTP и шаблонов: только сессии читателей и SQL"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    _, hidden = course_slugs(main)
+    rng = random.Random(seed)
+    jobs = [(rng.choice(SEARCH_WORDS), rng.choice(hidden)) for _ in range(requests)]
+    latencies, errors = [], 0
+
+    def read(job):
+        nonlocal errors
+        word, slug = job
+        started = time.perf_counter()
+        db = main.ReadSessionLocal()
+        try:
+            main.search_course_ids(db, word)
+            db.query(main.Course).filter(main.Course.slug == slug).first()
+        except Exception:
+            errors += 1
+        finally:
+            db.close()
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(read, jobs))
+    return {**summarize(latencies, time.perf_counter() - started), "errors": errors}
+
+
+async def read_load(main, paths: list, concurrency: int) -> dict:
+    import httpx
+
+    latencies, errors = [], 0
+    queue = list(reversed(paths))
+
+    async def worker(client):
+        nonlocal errors
+        while queue:
+            path = queue.pop()
+            started = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 500:
+                errors += 1
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+    return {**summarize(latencies, elapsed), "errors": errors}
+
+
+def child(args):
+    """Читатели: один прогон в этом процессе (режим - из окружения)"""
+    main = import_main()
+    paths = make_paths(main, args.requests, args.seed)
+    result = {
+        "http": asyncio.run(read_load(main, paths, args.concurrency)),
+        "db": db_load(main, args.requests, args.concurrency, args.seed),
+    }
+    with main.engine.connect() as connection:
+        result["journal_mode"] = connection.exec_driver_sql("PRAGMA journal_mode").scalar()
+    print(json.dumps(result))
+
+
+def writer(args):
+    """Процесс-писатель: пачки кликов, пока не появится стоп-файл"""
+    main = import_main()
+    from sqlalchemy import exc, select
+
+    with main.engine.connect() as connection:
+        ids = list(connection.execute(select(main.Course.id).limit(1000)).scalars())
+    rng = random.Random(os.getpid())
+    latencies, errors, started = [], 0, time.perf_counter()
+    while not os.path.exists(args.stop_file):
+        now = datetime.now(timezone.utc)
+        rows = [{"course_id": rng.choice(ids), "ts": now, "utm_source": "bench"} for _ in range(args.write_batch)]
+        t = time.perf_counter()
+        try:
+            with main.engine.begin() as connection:
+                connection.execute(main.Click.__table__.insert(), rows)
+        except exc.OperationalError:  # database is locked - истек busy timeout
+            errors += 1
+        latencies.append(time.perf_counter() - t)
+        time.sleep(args.write_interval_ms / 1000)
+    result = summarize(latencies, time.perf_counter() - started)
+    print(json.dumps({"batches_per_s": result["rps"], "p50_ms": result["p50_ms"], "p99_ms": result["p99_ms"], "errors": errors}))
+
+
+def parent(args):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        base = os.path.join(tmp, "base.db")
+        # База в прежнем журнале отката: WAL включит сам прогон в режиме wal
+        env = dict(os.environ, SQLITE_WAL="0")
+        subprocess.run(
+            [sys.executable, "-m", "bench.generate", "--database-url", f"sqlite:///{base}",
+             "--courses", str(args.courses), "--clicks", str(args.clicks), "--seed", str(args.seed)],
+            cwd=ROOT, env=env, check=True, capture_output=True,
+        )
+        for mode, wal in MODES.items():
+            path = os.path.join(tmp, f"{mode}.db")
+            shutil.copy(base, path)
+            stop_file = os.path.join(tmp, f"{mode}.stop")
+            env = dict(
+                os.environ,
+                SQLITE_WAL=wal,
+                DATABASE_URL=f"sqlite:///{path}",
+                CLICK_FLUSH_SIZE="20",
+                CLICK_FLUSH_SECONDS="0.05",
+                # Фоновые пересчеты по кликам писателей съели бы CPU читателей
+                CLICK_ROLLUP_SECONDS="0",
+                TRENDING_SECONDS="0",
+                RELATED_SECONDS="0",
+            )
+            common = ["--write-batch", str(args.write_batch), "--write-interval-ms", str(args.write_interval_ms)]
+            writers = [
+                subprocess.Popen(
+                    [sys.executable, "-m", "bench.sqlite", "--writer", "--stop-file", stop_file, *common],
+                    cwd=ROOT, env=env, stdout=subprocess.PIPE, text=True,
+                )
+                for _ in range(args.writers)
+            ]
+            try:
+                output = subprocess.run(
+                    [sys.executable, "-m", "bench.sqlite", "--child", "--concurrency", str(args.concurrency),
+                     "--requests", str(args.requests), "--seed", str(args.seed)],
+                    cwd=ROOT, env=env, check=True, capture_output=True, text=True,
+                ).stdout
+            finally:
+                open(stop_file, "w").close()
+            reads = json.loads(output.strip().splitlines()[-1])
+            writes = [json.loads(process.communicate()[0].strip().splitlines()[-1]) for process in writers]
+            results[mode] = {"reads": reads, "writers": writes}
+            for phase in ("http", "db"):
+                r = reads[phase]
+                print(
+                    f"{mode:7} {phase:5} {r['rps']:>8} rps  p50 {r['p50_ms']:>7} ms  p99 {r['p99_ms']:>8} ms  errors {r['errors']}",
+                    file=sys.stderr,
+                )
+            print(
+                f"{mode:7} write {sum(w['batches_per_s'] for w in writes):>8.1f} batch/s  "
+                f"p99 {max((w['p99_ms'] for w in writes), default=0):>8} ms  errors {sum(w['errors'] for w in writes)}",
+                file=sys.stderr,
+            )
+    legacy, wal = results["legacy"], results["wal"]
+
+    def gain(new, old):
+        return round(new / old, 2) if old else None
+
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "writers": args.writers,
+        "results": results,
+        "gain": {
+            "http_rps": gain(wal["reads"]["http"]["rps"], legacy["reads"]["http"]["rps"]),
+            "db_rps": gain(wal["reads"]["db"]["rps"], legacy["reads"]["db"]["rps"]),
+            "write_batches": gain(
+                sum(w["batches_per_s"] for w in wal["writers"]), sum(w["batches_per_s"] for w in legacy["writers"])
+            ),
+        },
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--writers", type=int, default=2, help="процессов, пишущих клики параллельно")
+    parser.add_argument("--write-batch", type=int, default=200, help="кликов в одной транзакции писателя")
+    parser.add_argument("--write-interval-ms", type=float, default=20, help="пауза между транзакциями писателя")
+    parser.add_argument("--courses", type=int, default=2_000)
+    parser.add_argument("--clicks", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--writer", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--stop-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+    elif args.writer:
+        writer(args)
+    else:
+        parent(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,174 +1,3358 @@
-from fastapi import FastAPI, Request, Depends, Form, Query, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import FastAPI, Request, Depends, File, Form, Query, HTTPException, UploadFile
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
+import jinja2
+from markupsafe import Markup
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.pool import StaticPool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.pool import QueuePool, StaticPool
 from sqlalchemy.orm import Session
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text
+from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Float, Text
+from sqlalchemy import ForeignKey, Index, bindparam, event, exc, inspect, select, text, update
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.sql import func
+import base64
+import contextvars
+import csv
+import functools
+import heapq
+import gzip
+import hashlib
+import io
+import json
+import logging
+import math
 import os
+import re
+import selectors
+import shutil
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict, deque, namedtuple
+from itertools import chain, islice
+from datetime import datetime, timedelta, timezone
 from pydantic import Field
 from typing import Union
-from typing import Optional
+from typing import List, Optional
+from contextlib import asynccontextmanager
+import mimetypes
 import urllib.parse
+import anyio
+
+try:
+    import brotli
+except ImportError:  # без brotli собираются и отдаются только .gz-варианты
+    brotli = None
+
+try:
+    import orjson
+except ImportError:  # без orjson - стандартный json (медленнее, результат тот же)
+    orjson = None
 
 # ================== НАСТРОЙКА БАЗЫ ДАННЫХ ==================
+# engine - основная БД: записи, админка, /out, фоновые задачи.
+# read_engine - реплика для публичных GET (DATABASE_READ_URL); без нее - та же engine.
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./courses.db")
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", "")
+
+# Пул соединений: на воркер, для основной БД и реплики отдельно (у SQLite - только пул читателей)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", str(DB_POOL_SIZE)))
+DB_READ_MAX_OVERFLOW = int(os.getenv("DB_READ_MAX_OVERFLOW", str(DB_MAX_OVERFLOW)))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "0") == "1"
+# Сколько секунд после записи в админке ее GET-запросы идут в основную БД
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+
+
+def normalize_database_url(url: str) -> str:
+    if url and url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
+
+
+# SQLite (файл): WAL - читатели не ждут писателя и не мешают ему закоммитить.
+# Публичные чтения идут через пул читателей (read_engine, query_only), все
+# записи воркера - через единственное соединение-писатель (engine): потоки
+# ждут его в пуле, а не крутятся на SQLITE_BUSY. Между процессами (несколько
+# воркеров) запись сериализует сама SQLite, ожидая до SQLITE_BUSY_TIMEOUT.
+# SQLITE_WAL=0 - прежний режим: журнал отката и новый коннект на каждый запрос.
+SQLITE_WAL = os.getenv("SQLITE_WAL", "1") == "1"
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "5"))
+SQLITE_CACHE_MB = int(os.getenv("SQLITE_CACHE_MB", "64"))
+SQLITE_MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", "256"))
+
+
+def is_sqlite_file(url: str) -> bool:
+    return url.startswith("sqlite") and ":memory:" not in url and url != "sqlite://"
+
+
+def sqlite_pragmas(writer: bool):
+    """Обработчик connect: настройки каждого нового соединения SQLite"""
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if writer:
+            # WAL хранится в самом файле БД - включает его соединение-писатель
+            cursor.execute("PRAGMA journal_mode=WAL")
+        # В WAL при NORMAL сбой питания может потерять последние коммиты, но не испортить базу
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT * 1000)}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_MB * 1024}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_MB * 1024 * 1024}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        if not writer:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+    return connect
+
+
+class FairQueuePool(QueuePool):
+    """QueuePool, выдающий соединения строго в порядке ожидания.
+
+    Обычный QueuePool отдает вернувшееся соединение тому, кто успеет первым:
+    задача, пишущая пачками подряд, перехватывает единственного писателя снова
+    и снова, а остальные потоки ждут до pool_timeout. Здесь разрешение на
+    соединение передается из рук в руки первому в очереди."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._permits = self._pool.maxsize + max(self._max_overflow, 0)
+        self._waiters = deque()
+        self._permits_lock = threading.Lock()
+
+    def _do_get(self):
+        with self._permits_lock:
+            if self._permits and not self._waiters:
+                self._permits -= 1
+                turn = None
+            else:
+                turn = threading.Event()
+                self._waiters.append(turn)
+        if turn is not None and not turn.wait(self._timeout):
+            with self._permits_lock:
+                if not turn.is_set():
+                    self._waiters.remove(turn)
+                    raise exc.TimeoutError(
+                        f"FairQueuePool limit of size {self.size()} reached, "
+                        f"connection timed out, timeout {self._timeout:.2f}"
+                    )
+        # Разрешение есть - свободное соединение или место под новое тоже
+        try:
+            return super()._do_get()
+        except BaseException:
+            self._release()
+            raise
+
+    def _do_return_conn(self, record):
+        try:
+            super()._do_return_conn(record)
+        finally:
+            self._release()
+
+    def _release(self):
+        with self._permits_lock:
+            if self._waiters:
+                self._waiters.popleft().set()
+            else:
+                self._permits += 1
+
+
+def make_sqlite_engine(url: str, writer: bool, pool_size: int = 1, max_overflow: int = 0):
+    """Файловая SQLite в режиме WAL: писатель - одно соединение, читатели - пул"""
+    sqlite_engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT},
+        poolclass=FairQueuePool if writer else QueuePool,
+        pool_size=1 if writer else pool_size,
+        max_overflow=0 if writer else max_overflow,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    event.listen(sqlite_engine, "connect", sqlite_pragmas(writer))
+    return sqlite_engine
+
+
+def make_engine(url: str, pool_size: int, max_overflow: int):
+    # ДЛЯ SQLite: добавляем параметры для работы в многопоточном режиме
+    if url.startswith("sqlite") and not is_sqlite_file(url):
+        # In-memory база живет, пока жив ее единственный коннект
+        return create_engine(
+            url, 
+            connect_args={"check_same_thread": False},  # Важно для SQLite + FastAPI
+            poolclass=StaticPool
+        )
+    if url.startswith("sqlite"):
+        if SQLITE_WAL:
+            return make_sqlite_engine(url, writer=True)
+        # Файловая база: обработчики работают в пуле потоков, поэтому коннект
+        # у каждого запроса свой, а не один общий на все потоки
+        return create_engine(
+            url, 
+            connect_args={"check_same_thread": False}
+        )
+    return create_engine(
+        url,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+
+
+DATABASE_URL = normalize_database_url(DATABASE_URL)
+DATABASE_READ_URL = normalize_database_url(DATABASE_READ_URL)
+engine = make_engine(DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW)
+if DATABASE_READ_URL:
+    read_engine = make_engine(DATABASE_READ_URL, DB_READ_POOL_SIZE, DB_READ_MAX_OVERFLOW)
+elif is_sqlite_file(DATABASE_URL) and SQLITE_WAL:
+    # Тот же файл: WAL дает читателям согласованный снимок без отставания
+    read_engine = make_sqlite_engine(DATABASE_URL, writer=False, pool_size=DB_READ_POOL_SIZE, max_overflow=DB_READ_MAX_OVERFLOW)
+else:
+    read_engine = engine
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+# Чтения, которым нужны последние коммиты (снимок каталога и его версия): при
+# реплике - основная БД, иначе - читатели (у SQLite - не занимая писателя)
+fresh_engine = engine if DATABASE_READ_URL else read_engine
+FreshSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=fresh_engine)
+Base = declarative_base()
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Cookie с моментом (unix time), до которого GET-запросы этого клиента читают
+# из основной БД: после правки в админке реплика может еще не догнать
+PRIMARY_COOKIE = "db_primary_until"
+
+def reads_primary(request: Request) -> bool:
+    if not DATABASE_READ_URL:
+        return False  # реплики нет - отставать нечему
+    try:
+        return float(request.cookies.get(PRIMARY_COOKIE, "0")) > time.time()
+    except ValueError:
+        return False
+
+def get_fresh_db():
+    """Сессия для чтений админки: последние коммиты, но без соединения писателя"""
+    db = FreshSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_read_db(request: Request):
+    """Сессия для публичных GET: реплика (кроме read-your-writes после записи)"""
+    db = SessionLocal() if reads_primary(request) else ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def pin_primary(response: Response) -> Response:
+    """После записи: следующие чтения клиента - из основной БД"""
+    if DATABASE_READ_URL and READ_YOUR_WRITES_SECONDS > 0:
+        response.set_cookie(
+            PRIMARY_COOKIE, str(int(time.time() + READ_YOUR_WRITES_SECONDS) + 1),
+            max_age=int(READ_YOUR_WRITES_SECONDS) + 1, httponly=True, samesite="lax"
+        )
+    return response
+
+# Синхронная работа с БД не должна блокировать event loop.
+# threadpool - обработчики с БД выполняются в пуле потоков (не больше DB_THREADS),
+# inline - прямо в event loop (старое поведение, для сравнения в бенчмарке)
+DB_EXECUTION = os.getenv("DB_EXECUTION", "threadpool")
+DB_THREADS = int(os.getenv("DB_THREADS", "40"))
+
+def db_route(func):
+    """Декоратор для синхронных обработчиков, работающих с БД"""
+    if DB_EXECUTION == "inline":
+        @functools.wraps(func)
+        async def endpoint(*args, **kwargs):
+            return func(*args, **kwargs)
+        return endpoint
+    # FastAPI сам выполняет обычные def-обработчики в пуле потоков
+    return func
+
+# ================== МОДЕЛИ ==================
+class Course(Base):
+    __tablename__ = "courses"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    slug = Column(String, unique=True, index=True)
+    title = Column(String, nullable=False)
+    provider = Column(String)
+    category_slug = Column(String)
+    level = Column(String)  # beginner|middle|pro
+    format = Column(String)  # online|offline|mixed
+    price_from = Column(Integer)
+    duration = Column(String)
+    tags = Column(Text)
+    short_desc = Column(Text)
+    affiliate_url = Column(String)
+    is_published = Column(Boolean, default=True)
+    clicks = Column(Integer, default=0)
+    trending = Column(Float)  # затухающий рейтинг по кликам (фоновая задача, см. ТРЕНДЫ)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class Click(Base):
+    __tablename__ = "clicks"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    course_id = Column(Integer, index=True)
+    ts = Column(DateTime(timezone=True), server_default=func.now())
+    referer = Column(String, nullable=True)
+    utm_source = Column(String, nullable=True)
+    utm_campaign = Column(String, nullable=True)
+    # Время вставки (ставит БД): по нему агрегаты решают, что клик "осел"
+    inserted_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class Tag(Base):
+    __tablename__ = "tags"
+    
+    id = Column(Integer, primary_key=True)
+    slug = Column(String, unique=True, index=True, nullable=False)
+    name = Column(String, nullable=False)
+
+class CourseTag(Base):
+    """Связь курс-тег; заполняется из Course.tags событиями маппера"""
+    __tablename__ = "course_tags"
+    
+    course_id = Column(Integer, ForeignKey("courses.id", ondelete="CASCADE"), primary_key=True)
+    tag_id = Column(Integer, ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True)
+    position = Column(Integer, nullable=False, default=0)  # порядок тегов в строке
+
+Index("ix_course_tags_tag_course", CourseTag.tag_id, CourseTag.course_id)
+
+class ClickRollup:
+    """Колонки агрегатов кликов; пустая строка в utm_* вместо NULL (часть ключа)"""
+    bucket = Column(DateTime(timezone=True), primary_key=True)  # начало часа/дня, UTC
+    course_id = Column(Integer, primary_key=True)
+    utm_source = Column(String, primary_key=True, default="")
+    utm_campaign = Column(String, primary_key=True, default="")
+    clicks = Column(Integer, nullable=False, default=0)
+
+class ClickStatsHourly(ClickRollup, Base):
+    __tablename__ = "click_stats_hourly"
+
+class ClickStatsDaily(ClickRollup, Base):
+    __tablename__ = "click_stats_daily"
+
+class RollupState(Base):
+    """Высшая отметка: до какого Click.id клики уже разложены по агрегатам"""
+    __tablename__ = "rollup_state"
+    
+    name = Column(String, primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)
+
+class CourseCoclick(Base):
+    """Совместные клики: в скольких сессиях (referer + окно времени) кликнули оба курса"""
+    __tablename__ = "course_coclicks"
+    
+    course_id = Column(Integer, primary_key=True)
+    other_id = Column(Integer, primary_key=True)
+    sessions = Column(Integer, nullable=False, default=0)
+
+class RelatedCourses(Base):
+    """Предвычисленные похожие курсы: JSON [[id, score], ...] по убыванию score"""
+    __tablename__ = "related_courses"
+    
+    course_id = Column(Integer, primary_key=True)
+    related = Column(Text, nullable=False, default="[]")
+    built_at = Column(DateTime(timezone=True), nullable=False)
+
+class CatalogVersion(Base):
+    """Версия каталога (одна строка): растет при каждом изменении курсов, кроме кликов"""
+    __tablename__ = "catalog_version"
+    
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    changed_at = Column(DateTime(timezone=True))
+
+Index("ix_click_stats_hourly_course", ClickStatsHourly.course_id, ClickStatsHourly.bucket)
+Index("ix_click_stats_daily_course", ClickStatsDaily.course_id, ClickStatsDaily.bucket)
+
+# Индексы под фильтры и сортировки (migrations/versions/0003_listing_indexes.py)
+_published_only = dict(sqlite_where=text("is_published"), postgresql_where=text("is_published"))
+Index("ix_courses_pub_clicks", Course.clicks.desc(), Course.id, **_published_only)
+Index("ix_courses_pub_created", Course.created_at.desc(), Course.id, **_published_only)
+Index("ix_courses_pub_trending", Course.trending.desc(), Course.id, **_published_only)
+Index("ix_courses_pub_price", Course.price_from, Course.id, **_published_only)
+Index("ix_courses_pub_category_clicks", Course.category_slug, Course.clicks.desc(), Course.id, **_published_only)
+Index("ix_courses_pub_category_created", Course.category_slug, Course.created_at.desc(), Course.id, **_published_only)
+Index("ix_courses_pub_category_price", Course.category_slug, Course.price_from, Course.id, **_published_only)
+Index("ix_courses_created_at", Course.created_at)
+Index("ix_clicks_course_ts", Click.course_id, Click.ts)
+Index("ix_clicks_ts", Click.ts)
+
+# ================== ПОЛНОТЕКСТОВЫЙ ПОИСК ==================
+# SQLite: FTS5-таблица courses_fts (rowid = courses.id) со стеммированным текстом,
+# синхронизируется событиями маппера Course.
+# PostgreSQL: GIN-индекс по to_tsvector('russian', ...), обновляется самой БД.
+
+SEARCH_BACKEND: Optional[str] = None  # "fts5" | "postgresql" | None (поиск по снимку)
+SEARCH_FIELDS = ("title", "tags", "short_desc")
+
+_RU_VOWELS = "аеиоуыэюя"
+
+
+def _ru_endings(*groups):
+    """Окончания стеммера: (окончание, нужна ли перед ним "а"/"я"), длинные первыми"""
+    endings = [(e, needs_a) for group, needs_a in groups for e in group]
+    return sorted(endings, key=lambda item: -len(item[0]))
+
+
+_RU_ADJECTIVE = (
+    "ими", "ыми", "его", "ого", "ему", "ому", "ее", "ие", "ые", "ое", "ей", "ий", "ый",
+    "ой", "ем", "им", "ым", "ом", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею",
+)
+_RU_PERFECTIVE_GERUND = _ru_endings(
+    (("ившись", "ывшись", "ивши", "ывши", "ив", "ыв"), False),
+    (("вшись", "вши", "в"), True),
+)
+_RU_REFLEXIVE = _ru_endings((("ся", "сь"), False))
+_RU_ADJECTIVAL = _ru_endings((_RU_ADJECTIVE, False))
+_RU_PARTICIPLE = _ru_endings(
+    (("ивш", "ывш", "ующ"), False),
+    (("ем", "нн", "вш", "ющ", "щ"), True),
+)
+_RU_VERB = _ru_endings(
+    (("ила", "ыла", "ена", "ейте", "уйте", "ите", "или", "ыли", "ей", "уй", "ил", "ыл",
+      "им", "ым", "ен", "ило", "ыло", "ено", "ят", "ует", "уют", "ит", "ыт", "ены",
+      "ить", "ыть", "ишь", "ую", "ю"), False),
+    (("ла", "на", "ете", "йте", "ли", "й", "л", "ем", "н", "ло", "но", "ет", "ют", "ны",
+      "ть", "ешь", "нно"), True),
+)
+_RU_NOUN = _ru_endings((
+    ("иями", "ями", "ами", "ией", "иям", "ием", "иях", "ев", "ов", "ие", "ье", "еи", "ии",
+     "ей", "ой", "ий", "ям", "ем", "ам", "ом", "ах", "ях", "ию", "ью", "ия", "ья", "и",
+     "ы", "ь", "ю", "у", "о", "а", "е", "й", "я"), False))
+
+
+def _ru_cut(word: str, rv: int, endings) -> Optional[str]:
+    """Отрезает самое длинное подходящее окончание в пределах RV"""
+    for ending, needs_a in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= rv:
+            stem = word[:-len(ending)]
+            if needs_a and not (len(stem) > rv and stem[-1] in "ая"):
+                return None
+            return stem
+    return None
+
+
+def _ru_region(word: str, start: int) -> int:
+    """Начало R1/R2: позиция после первой согласной, идущей за гласной"""
+    for i in range(start + 1, len(word)):
+        if word[i] not in _RU_VOWELS and word[i - 1] in _RU_VOWELS:
+            return i + 1
+    return len(word)
+
+
+def stem_ru(word: str) -> str:
+    """Стеммер Портера для русского языка (Snowball); прочие слова не меняются"""
+    word = word.replace("ё", "е")
+    match = re.search(f"[{_RU_VOWELS}]", word)
+    if not match:
+        return word
+    rv = match.end()
+    r2 = _ru_region(word, _ru_region(word, 0))
+
+    # Шаг 1: деепричастие, иначе возвратность + прилагательное/глагол/существительное
+    stem = _ru_cut(word, rv, _RU_PERFECTIVE_GERUND)
+    if stem is None:
+        word = _ru_cut(word, rv, _RU_REFLEXIVE) or word
+        stem = _ru_cut(word, rv, _RU_ADJECTIVAL)
+        if stem is not None:
+            stem = _ru_cut(stem, rv, _RU_PARTICIPLE) or stem
+        else:
+            stem = _ru_cut(word, rv, _RU_VERB) or _ru_cut(word, rv, _RU_NOUN)
+    if stem is not None:
+        word = stem
+
+    # Шаг 2-3: "и" и словообразовательное "ость" (в R2)
+    if word.endswith("и") and len(word) > rv:
+        word = word[:-1]
+    for ending in ("ость", "ост"):
+        if word.endswith(ending) and len(word) - len(ending) >= r2:
+            word = word[:-len(ending)]
+            break
+
+    # Шаг 4: "нн" -> "н", превосходная степень, мягкий знак
+    for ending in ("ейше", "ейш"):
+        if word.endswith(ending) and len(word) - len(ending) >= rv:
+            word = word[:-len(ending)]
+            break
+    if word.endswith("нн") and len(word) - 2 >= rv:
+        word = word[:-1]
+    elif word.endswith("ь") and len(word) > rv:
+        word = word[:-1]
+    return word
+
+
+def search_terms(value: Optional[str]) -> list:
+    """Слова строки в нижнем регистре, приведенные к основе"""
+    return [stem_ru(word) for word in re.findall(r"\w+", (value or "").casefold())]
+
+
+# Документ для PostgreSQL; выражение должно совпадать с индексом из миграции 0002
+PG_SEARCH_DOCUMENT = (
+    "to_tsvector('russian', coalesce(title, '') || ' ' || "
+    "replace(coalesce(tags, ''), ',', ' ') || ' ' || coalesce(short_desc, ''))"
+)
+_PG_SEARCH_RANK = (
+    "ts_rank("
+    "setweight(to_tsvector('russian', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('russian', replace(coalesce(tags, ''), ',', ' ')), 'B') || "
+    "setweight(to_tsvector('russian', coalesce(short_desc, '')), 'C'), q)"
+)
+
+
+def _fts_row(course) -> dict:
+    row = {field: " ".join(search_terms(getattr(course, field))) for field in SEARCH_FIELDS}
+    row["id"] = course.id
+    return row
+
+
+def _fts_replace(connection, course):
+    connection.execute(text("DELETE FROM courses_fts WHERE rowid = :id"), {"id": course.id})
+    connection.execute(
+        text("INSERT INTO courses_fts (rowid, title, tags, short_desc) VALUES (:id, :title, :tags, :short_desc)"),
+        _fts_row(course)
+    )
+
+
+def fts_enabled(connection) -> bool:
+    """Есть ли courses_fts в этой БД.
+
+    Смотрим на саму таблицу, а не только на SEARCH_BACKEND: воркер, поднятый до
+    миграции, или скрипт без init_search_index иначе писали бы мимо индекса."""
+    global SEARCH_BACKEND
+    if SEARCH_BACKEND == "fts5":
+        return True
+    if connection.dialect.name != "sqlite":
+        return False
+    found = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'courses_fts'")
+    ).first() is not None
+    if found:
+        SEARCH_BACKEND = "fts5"
+    return found
+
+
+@event.listens_for(Course, "after_insert")
+def _search_after_insert(mapper, connection, target):
+    if fts_enabled(connection):
+        _fts_replace(connection, target)
+
+
+@event.listens_for(Course, "after_update")
+def _search_after_update(mapper, connection, target):
+    # Клики обновляют курс постоянно - переиндексируем только при смене текста
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in SEARCH_FIELDS) and fts_enabled(connection):
+        _fts_replace(connection, target)
+
+
+@event.listens_for(Course, "after_delete")
+def _search_after_delete(mapper, connection, target):
+    if fts_enabled(connection):
+        connection.execute(text("DELETE FROM courses_fts WHERE rowid = :id"), {"id": target.id})
+
+
+def fts_reindex(connection, courses):
+    """Переиндексирует в FTS5 пачку курсов (id, title, tags, short_desc)"""
+    rows = [_fts_row(course) for course in courses]
+    if not rows:
+        return
+    connection.execute(
+        text("DELETE FROM courses_fts WHERE rowid IN :ids").bindparams(bindparam("ids", expanding=True)),
+        {"ids": [row["id"] for row in rows]}
+    )
+    connection.execute(
+        text("INSERT INTO courses_fts (rowid, title, tags, short_desc) VALUES (:id, :title, :tags, :short_desc)"),
+        rows
+    )
+
+
+def rebuild_search_index(connection):
+    """Полная переиндексация FTS5-таблицы"""
+    connection.execute(text("DELETE FROM courses_fts"))
+    courses = connection.execute(text("SELECT id, title, tags, short_desc FROM courses"))
+    rows = [_fts_row(course) for course in courses]
+    if rows:
+        connection.execute(
+            text("INSERT INTO courses_fts (rowid, title, tags, short_desc) VALUES (:id, :title, :tags, :short_desc)"),
+            rows
+        )
+
+
+def init_search_index():
+    """Определяет поисковый бэкенд (индекс создается миграцией 0002).
+
+    FTS5 сверяется с courses по числу строк: курсы, записанные в обход
+    индекса (например, старым кодом), иначе не нашлись бы поиском."""
+    global SEARCH_BACKEND
+    if engine.dialect.name == "postgresql":
+        SEARCH_BACKEND = "postgresql"
+    elif engine.dialect.name == "sqlite" and inspect(engine).has_table("courses_fts"):
+        SEARCH_BACKEND = "fts5"
+        with engine.begin() as connection:
+            indexed = connection.execute(text("SELECT count(*) FROM courses_fts")).scalar()
+            total = connection.execute(text("SELECT count(*) FROM courses")).scalar()
+            if indexed != total:
+                logger.warning("courses_fts: %d строк на %d курсов, переиндексация", indexed, total)
+                rebuild_search_index(connection)
+    else:
+        # Нет FTS5 - остается поиск подстрокой по снимку
+        SEARCH_BACKEND = None
+
+
+def search_course_ids(db: Session, query: str) -> Optional[list]:
+    """id курсов, подходящих под запрос, по убыванию релевантности.
+
+    None - поискового индекса нет, искать нужно по снимку каталога."""
+    if SEARCH_BACKEND == "fts5":
+        terms = search_terms(query)
+        if not terms:
+            return []
+        match = " ".join(f'"{term}"*' for term in terms)
+        rows = db.execute(
+            text("SELECT rowid FROM courses_fts WHERE courses_fts MATCH :match "
+                 "ORDER BY bm25(courses_fts, 10.0, 5.0, 1.0)"),
+            {"match": match}
+        )
+    elif SEARCH_BACKEND == "postgresql":
+        words = re.findall(r"\w+", query.casefold())
+        if not words:
+            return []
+        rows = db.execute(
+            text(f"SELECT id FROM courses, to_tsquery('russian', :q) q "
+                 f"WHERE {PG_SEARCH_DOCUMENT} @@ q ORDER BY {_PG_SEARCH_RANK} DESC"),
+            {"q": " & ".join(f"{word}:*" for word in words)}
+        )
+    else:
+        return None
+    return [row[0] for row in rows]
+
+# ================== ТЕГИ ==================
+# Course.tags остается строкой через запятую (ее редактирует админка), а
+# нормализованная связь course_tags пересобирается при каждом ее изменении.
+
+def tag_slug(name: str) -> str:
+    """Нормализованный slug тега: "Premiere Pro" -> premiere-pro, "UI/UX" -> ui-ux"""
+    return re.sub(r"[^\w]+", "-", name.strip().casefold().replace("ё", "е")).strip("-_")
+
+
+def split_tags(value: Optional[str]) -> list:
+    """[(slug, название)] из строки тегов, без пустых и повторов"""
+    tags = {}
+    for name in (value or "").split(","):
+        name = name.strip()
+        slug = tag_slug(name)
+        if slug and slug not in tags:
+            tags[slug] = name
+    return list(tags.items())
+
+
+def sync_course_tags(connection, course_id: int, value: Optional[str]):
+    """Пересобирает course_tags курса по строке тегов"""
+    sync_tags(connection, {course_id: value})
+
+
+def sync_tags(connection, values: dict):
+    """Пересобирает course_tags для {course_id: строка тегов} за несколько запросов"""
+    if not values:
+        return
+    tags_table, links = Tag.__table__, CourseTag.__table__
+    connection.execute(links.delete().where(links.c.course_id.in_(list(values))))
+    pairs = {course_id: split_tags(value) for course_id, value in values.items()}
+    names = {slug: name for course_pairs in pairs.values() for slug, name in course_pairs}
+    if not names:
+        return
+    lookup = select(tags_table.c.slug, tags_table.c.id).where(tags_table.c.slug.in_(list(names)))
+    ids = dict(connection.execute(lookup).all())
+    missing = [{"slug": slug, "name": name} for slug, name in names.items() if slug not in ids]
+    if missing:
+        connection.execute(tags_table.insert(), missing)
+        ids = dict(connection.execute(lookup).all())
+    connection.execute(
+        links.insert(),
+        [
+            {"course_id": course_id, "tag_id": ids[slug], "position": position}
+            for course_id, course_pairs in pairs.items()
+            for position, (slug, _) in enumerate(course_pairs)
+        ]
+    )
+
+
+@event.listens_for(Course, "after_insert")
+def _tags_after_insert(mapper, connection, target):
+    sync_course_tags(connection, target.id, target.tags)
+
+
+@event.listens_for(Course, "after_update")
+def _tags_after_update(mapper, connection, target):
+    if inspect(target).attrs.tags.history.has_changes():
+        sync_course_tags(connection, target.id, target.tags)
+
+
+@event.listens_for(Course, "after_delete")
+def _tags_after_delete(mapper, connection, target):
+    links = CourseTag.__table__
+    connection.execute(links.delete().where(links.c.course_id == target.id))
+
+# ================== ИНИЦИАЛИЗАЦИЯ FASTAPI ==================
+# Импорт модуля ничего не делает с БД: схема, поисковый индекс, снимок каталога
+# и фоновые потоки поднимаются в lifespan, а /readyz отвечает 200 только после
+# этого. Миграции и тестовые данные можно выполнить отдельно:
+# python main.py migrate / python main.py seed.
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    configure_db_threads()
+    # Синхронная работа с БД - в пуле потоков, event loop свободен
+    await run_in_threadpool(startup)
+    app.state.ready = True
+    startup_seconds.set((), round(time.perf_counter() - started, 4))
+    logger.info("Приложение готово за %.0f мс", (time.perf_counter() - started) * 1000)
+    yield
+    app.state.ready = False
+    await run_in_threadpool(shutdown)
+
+
+def startup():
+    init_database()
+    with engine.connect() as connection:
+        migrated = schema_revision(connection) == migration_head()
+    if migrated:
+        start_schema_jobs()
+    else:
+        # Миграции выполняются отдельно (AUTO_MIGRATE=0) - /readyz ответит 503,
+        # пока не будет python main.py migrate, а затем сам догонит остальное
+        logger.warning("Схема БД не на последней миграции, каталог не прогрет")
+    warm_templates()
+    click_buffer.start()
+    click_rollup.start()
+
+
+_schema_jobs_lock = threading.Lock()
+_schema_jobs_started = False
+
+
+def start_schema_jobs():
+    """Поисковый индекс, снимок каталога и задачи, которым нужна актуальная схема.
+
+    Вызывается при старте, а если миграции выполнили уже после него - из
+    /readyz, когда он впервые увидит схему на последней ревизии."""
+    global _schema_jobs_started
+    with _schema_jobs_lock:
+        if _schema_jobs_started:
+            return
+        init_search_index()
+        warm_catalog()
+        catalog_watcher.start()
+        trending_job.start()
+        related_job.start()
+        _schema_jobs_started = True
+
+
+def shutdown():
+    global _schema_jobs_started
+    with _schema_jobs_lock:
+        related_job.stop()
+        trending_job.stop()
+        catalog_watcher.stop()
+        _schema_jobs_started = False
+    click_rollup.stop()
+    click_buffer.stop()
+
+
+def json_dumps(value) -> bytes:
+    """Компактный JSON в UTF-8 (orjson, если установлен)"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse через json_dumps - ответ API по умолчанию"""
+
+    def render(self, content) -> bytes:
+        return json_dumps(content)
+
+
+app = FastAPI(title="Каталог курсов по нейросетям", lifespan=lifespan, default_response_class=FastJSONResponse)
+app.state.ready = False
+
+def configure_db_threads():
+    """Ограничиваем пул потоков, в котором выполняются обработчики с БД"""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = DB_THREADS
+
+# ================== СТАТИКА ==================
+# python main.py assets копирует static/ в static/dist/ с хэшем содержимого в
+# имени (css/style.css -> css/style.1a2b3c4d5e.css), рядом кладет .gz/.br и
+# пишет manifest.json. Шаблоны берут URL через asset(), такие файлы отдаются с
+# Cache-Control: immutable - браузер больше их не перезапрашивает. Без сборки
+# asset() возвращает исходный путь, а файлы отдаются с ревалидацией по ETag.
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+ASSETS_DIR = os.path.join(STATIC_DIR, "dist")
+ASSET_MANIFEST = os.path.join(ASSETS_DIR, "manifest.json")
+ASSET_COMPRESSIBLE = (".css", ".js", ".svg", ".json", ".txt", ".map", ".html", ".xml")
+ASSET_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))  # в порядке предпочтения
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def build_assets(source: str = STATIC_DIR, output: str = ASSETS_DIR) -> dict:
+    """Собирает fingerprinted-копии статики с .gz/.br; возвращает манифест"""
+    shutil.rmtree(output, ignore_errors=True)
+    manifest = {}
+    for root, dirs, files in os.walk(source):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != output)
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, source).replace(os.sep, "/")
+            with open(path, "rb") as f:
+                data = f.read()
+            stem, ext = os.path.splitext(relative)
+            hashed = f"{stem}.{hashlib.blake2b(data, digest_size=5).hexdigest()}{ext}"
+            target = os.path.join(output, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "wb") as f:
+                f.write(data)
+            if ext in ASSET_COMPRESSIBLE:
+                variants = [(".gz", gzip.compress(data, 9, mtime=0))]
+                if brotli is not None:
+                    variants.append((".br", brotli.compress(data, quality=11)))
+                for suffix, compressed in variants:
+                    if len(compressed) < len(data):
+                        with open(target + suffix, "wb") as f:
+                            f.write(compressed)
+            manifest[relative] = hashed
+    with open(os.path.join(output, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_asset_manifest() -> dict:
+    try:
+        with open(ASSET_MANIFEST) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+asset_manifest = load_asset_manifest()
+
+
+def asset(name: str) -> str:
+    """URL статического файла: fingerprinted из манифеста или исходный"""
+    hashed = asset_manifest.get(name)
+    return f"/static/dist/{hashed}" if hashed else f"/static/{name}"
+
+
+def accepted_encodings(scope) -> set:
+    """Кодировки из Accept-Encoding (без q=0)"""
+    header = next((value for key, value in scope["headers"] if key == b"accept-encoding"), b"").decode("latin-1")
+    encodings = set()
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        if coding and params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            encodings.add(coding.strip().lower())
+    return encodings
+
+
+class AssetFiles(StaticFiles):
+    """StaticFiles: immutable-кэш и готовые .br/.gz для файлов из dist/"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._variants = {}  # путь варианта -> stat_result | None (файлы в dist/ не меняются)
+
+    def _variant(self, full_path: str, scope):
+        accepted = accepted_encodings(scope)
+        for encoding, suffix in ASSET_ENCODINGS:
+            if encoding not in accepted:
+                continue
+            path = full_path + suffix
+            if path not in self._variants:
+                try:
+                    self._variants[path] = os.stat(path)
+                except OSError:
+                    self._variants[path] = None
+            if self._variants[path] is not None:
+                return path, self._variants[path], encoding
+        return None
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        if not os.path.realpath(full_path).startswith(os.path.realpath(ASSETS_DIR) + os.sep):
+            response = super().file_response(full_path, stat_result, scope, status_code)
+            response.headers["cache-control"] = "no-cache"
+            return response
+        variant = self._variant(str(full_path), scope)
+        media_type = mimetypes.guess_type(str(full_path))[0]
+        if variant is not None:
+            path, variant_stat, encoding = variant
+            response = FileResponse(path, status_code=status_code, stat_result=variant_stat,
+                                    method=scope["method"], media_type=media_type)
+            response.headers["content-encoding"] = encoding
+        else:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result,
+                                    method=scope["method"], media_type=media_type)
+        response.headers["cache-control"] = IMMUTABLE
+        response.headers["vary"] = "Accept-Encoding"
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+app.mount("/static", AssetFiles(directory=STATIC_DIR), name="static")
+# Скомпилированные шаблоны сохраняются на диск: после перезапуска воркеры
+# загружают байткод вместо повторной компиляции (пустое значение - без кэша)
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "jinja"))
+
+
+def template_bytecode_cache() -> Optional[jinja2.BytecodeCache]:
+    if not TEMPLATE_CACHE_DIR:
+        return None
+    try:
+        os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+    except OSError as e:
+        logging.getLogger("courses").warning("Кэш байткода шаблонов выключен: %s", e)
+        return None
+    return jinja2.FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+
+
+templates = Jinja2Templates(directory="templates", bytecode_cache=template_bytecode_cache())
+templates.env.globals["asset"] = asset
+
+
+def warm_templates():
+    """Загружает все шаблоны заранее, чтобы первый запрос не ждал компиляции"""
+    for name in templates.env.list_templates(extensions=("html",)):
+        templates.env.get_template(name)
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# ================== МЕТРИКИ ==================
+# Латентность и статусы по шаблону роута, SQL-запросы и время БД на запрос,
+# выдачи соединений из пула - в формате Prometheus на /metrics. Без внешних
+# зависимостей: счетчики под одним локом на метрику, метки - кортежи.
+# Метрики свои у каждого процесса (воркера), Prometheus суммирует их сам.
+
+METRICS_ENABLED = os.getenv("METRICS", "1") != "0"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # если задан - /metrics только с ?token= или Bearer
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metric:
+    """Счетчик (counter), значение (gauge) или гистограмма (histogram) с метками"""
+
+    def __init__(self, name: str, help: str, kind: str, labels=(), buckets=None):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def set(self, labels=(), value: float = 0):
+        with self._lock:
+            self._values[labels] = value
+
+    def observe(self, labels, value: float):
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+
+    def _series(self, suffix: str, labels, extra: str = "") -> str:
+        pairs = [f'{name}="{_label_value(value)}"' for name, value in zip(self.labels, labels)]
+        if extra:
+            pairs.append(extra)
+        return f"{self.name}{suffix}{{{','.join(pairs)}}}" if pairs else f"{self.name}{suffix}"
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            values = [(labels, value if self.kind != "histogram" else (value[0][:], value[1]))
+                      for labels, value in self._values.items()]
+        for labels, value in sorted(values, key=lambda item: item[0]):
+            if self.kind != "histogram":
+                lines.append(f"{self._series('', labels)} {value}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{self._series('_bucket', labels, 'le=' + json.dumps(str(bound)))} {cumulative}")
+            lines.append(f"{self._series('_sum', labels)} {total}")
+            lines.append(f"{self._series('_count', labels)} {cumulative}")
+        return lines
+
+
+http_requests = Metric("http_requests_total", "HTTP-запросы по роуту и статусу", "counter", ("method", "route", "status"))
+http_duration = Metric("http_request_duration_seconds", "Время обработки запроса", "histogram", ("method", "route"), LATENCY_BUCKETS)
+request_queries = Metric("http_request_db_queries", "SQL-запросов на HTTP-запрос", "histogram", ("route",), QUERY_COUNT_BUCKETS)
+request_db_time = Metric("http_request_db_seconds", "Время в БД на HTTP-запрос", "histogram", ("route",), LATENCY_BUCKETS)
+db_queries = Metric("db_queries_total", "Все SQL-запросы процесса (вместе с фоновыми задачами)", "counter")
+db_query_duration = Metric("db_query_duration_seconds", "Длительность SQL-запроса", "histogram", (), LATENCY_BUCKETS)
+pool_checkouts = Metric("db_pool_checkouts_total", "Выдачи соединений из пула", "counter")
+pool_connects = Metric("db_pool_connects_total", "Новые соединения с БД", "counter")
+pool_wait = Metric("db_pool_wait_seconds", "Ожидание соединения из пула (включая открытие нового)", "histogram", (), LATENCY_BUCKETS)
+pool_state = Metric("db_pool_connections", "Соединения пула по состоянию", "gauge", ("pool", "state"))
+startup_seconds = Metric("app_startup_seconds", "Длительность старта (lifespan) до готовности", "gauge")
+METRICS = (
+    http_requests, http_duration, request_queries, request_db_time,
+    db_queries, db_query_duration, pool_checkouts, pool_connects, pool_wait, pool_state, startup_seconds,
+)
+
+# [число запросов, время в БД] текущего HTTP-запроса; копия контекста
+# уходит и в пул потоков, так что запросы из def-обработчиков тоже считаются
+_request_db = contextvars.ContextVar("request_db", default=None)
+
+
+def _metrics_before_cursor(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _metrics_after_cursor(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    db_queries.inc()
+    db_query_duration.observe((), elapsed)
+    current = _request_db.get()
+    if current is not None:
+        current[0] += 1
+        current[1] += elapsed
+
+
+def _metrics_query_error(context):
+    started = context.connection.info.get("query_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def _metrics_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_checkouts.inc()
+
+
+def _metrics_connect(dbapi_connection, connection_record):
+    pool_connects.inc()
+
+
+def _timed_pool_get(get):
+    """Пул блокируется в _do_get, пока нет свободного соединения - меряем это ожидание"""
+    @functools.wraps(get)
+    def timed():
+        started = time.perf_counter()
+        try:
+            return get()
+        finally:
+            pool_wait.observe((), time.perf_counter() - started)
+    return timed
+
+
+def instrument_engine(target):
+    event.listen(target, "before_cursor_execute", _metrics_before_cursor)
+    event.listen(target, "after_cursor_execute", _metrics_after_cursor)
+    event.listen(target, "handle_error", _metrics_query_error)
+    event.listen(target.pool, "checkout", _metrics_checkout)
+    event.listen(target.pool, "connect", _metrics_connect)
+    target.pool._do_get = _timed_pool_get(target.pool._do_get)
+
+# Пулы, метка pool в db_pool_connections
+ENGINES = {"primary": engine} if read_engine is engine else {"primary": engine, "read": read_engine}
+for _engine in ENGINES.values():
+    instrument_engine(_engine)
+
+
+def collect_pool_state():
+    """Текущее состояние пулов (у StaticPool/NullPool этих счетчиков нет)"""
+    for name, target in ENGINES.items():
+        pool = target.pool
+        for state, method in (("size", "size"), ("checked_out", "checkedout"), ("checked_in", "checkedin"), ("overflow", "overflow")):
+            if hasattr(pool, method):
+                pool_state.set((name, state), getattr(pool, method)())
+
+
+def route_label(scope) -> str:
+    """Шаблон пути роута (/course/{slug}), а не сам путь - чтобы метки не разрастались"""
+    endpoint = scope.get("endpoint")
+    if endpoint is not None:
+        for route in scope["app"].routes if "app" in scope else ():
+            if getattr(route, "endpoint", None) is endpoint:
+                return route.path
+    if scope.get("path", "").startswith("/static/"):
+        return "/static"
+    return "<unmatched>"
+
+
+class MetricsMiddleware:
+    """ASGI middleware: латентность, статус и SQL-запросы каждого HTTP-запроса"""
+
+    def __init__(self, app):
+        self.app = app
+        self._routes = {}
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        label = self._routes.get(endpoint)
+        if label is None:
+            label = route_label(scope)
+            if endpoint is not None:
+                self._routes[endpoint] = label
+        return label
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        current = [0, 0.0]
+        token = _request_db.set(current)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_db.reset(token)
+            route = self._route(scope)
+            method = scope["method"]
+            http_requests.inc((method, route, str(status)))
+            http_duration.observe((method, route), time.perf_counter() - started)
+            request_queries.observe((route,), current[0])
+            request_db_time.observe((route,), current[1])
+
+
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request, token: Optional[str] = Query(None)):
+    """Метрики процесса в текстовом формате Prometheus"""
+    if METRICS_TOKEN and METRICS_TOKEN not in (token, request.headers.get("authorization", "").removeprefix("Bearer ")):
+        raise HTTPException(status_code=403, detail="Неверный токен метрик")
+    collect_pool_state()
+    lines = [line for metric in METRICS for line in metric.render()]
+    return Response("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# ================== СЖАТИЕ ОТВЕТОВ ==================
+# Динамические ответы (HTML, JSON, NDJSON/CSV выгрузки) сжимаются brotli или
+# gzip по Accept-Encoding. Маленькие ответы, редиректы и /out/ не трогаем.
+# Страницы из кэша страниц хранят сжатые варианты рядом с телом (PageCache) -
+# middleware видит готовый Content-Encoding и пропускает их как есть.
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION", "1") == "1"
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+COMPRESSION_EXCLUDE = tuple(
+    prefix.strip() for prefix in os.getenv("COMPRESSION_EXCLUDE", "/out/").split(",") if prefix.strip()
+)
+COMPRESSIBLE_TYPES = (
+    "text/", "application/json", "application/x-ndjson", "application/javascript", "image/svg+xml",
+)
+
+
+def choose_encoding(accepted: set) -> Optional[str]:
+    """Лучшая кодировка из поддерживаемых клиентом: br, затем gzip"""
+    if not COMPRESSION_ENABLED:
+        return None
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, GZIP_LEVEL, mtime=0)
+
+
+class StreamCompressor:
+    """Потоковое сжатие: каждый кусок сразу уходит клиенту (flush)"""
+
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31 - формат gzip
+        self.encoding = encoding
+
+    def compress(self, chunk: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(chunk) + self._compressor.flush()
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+class CompressionMiddleware:
+    """ASGI middleware: brotli/gzip для текстовых ответов"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD" or scope["path"].startswith(COMPRESSION_EXCLUDE):
+            return await self.app(scope, receive, send)
+        encoding = choose_encoding(accepted_encodings(scope))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        compressor = None  # None - еще не решили, False - отдаем как есть
+
+        async def send_compressed(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or compressor is False:
+                return await send(message)
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=list(start["headers"]))
+                length = headers.get("content-length")
+                if (
+                    start["status"] < 200 or 300 <= start["status"] < 400 or start["status"] == 204
+                    or "content-encoding" in headers
+                    or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+                    or (not more_body and len(body) < COMPRESSION_MIN_SIZE)
+                    or (length is not None and int(length) < COMPRESSION_MIN_SIZE)
+                ):
+                    compressor = False
+                    if (
+                        start["status"] == 200 and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+                        and "accept-encoding" not in headers.get("vary", "").lower()
+                    ):
+                        headers.add_vary_header("Accept-Encoding")
+                    await send(dict(start, headers=headers.raw))
+                    return await send(message)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if headers.get("etag") and not headers["etag"].startswith("W/"):
+                    # Сильный ETag описывает несжатое тело
+                    headers["ETag"] = "W/" + headers["etag"]
+                if not more_body:
+                    body = compress_body(body, encoding)
+                    headers["Content-Length"] = str(len(body))
+                    compressor = False
+                    await send(dict(start, headers=headers.raw))
+                    return await send({"type": "http.response.body", "body": body})
+                del headers["content-length"]
+                compressor = StreamCompressor(encoding)
+                await send(dict(start, headers=headers.raw))
+            chunk = compressor.compress(body) if body else b""
+            if not more_body:
+                chunk += compressor.finish()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+        if start is not None and compressor is None:
+            # Ответ без тела
+            await send(start)
+
+
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+
+# ================== ПРОБЫ ==================
+
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    """Liveness: процесс жив и отвечает (БД не трогаем)"""
+    return {"status": "ok"}
+
+
+@app.get("/readyz", include_in_schema=False)
+@db_route
+def readyz():
+    """Readiness: старт завершен, БД доступна, схема на последней миграции и клики пишутся"""
+    if not app.state.ready:
+        return JSONResponse({"status": "starting"}, status_code=503)
+    if not click_buffer.is_alive():
+        return JSONResponse({"status": "click flusher stopped", "pending_clicks": len(click_buffer)}, status_code=503)
+    try:
+        with fresh_engine.connect() as connection:
+            revision = schema_revision(connection)
+    except exc.DBAPIError:
+        return JSONResponse({"status": "database unavailable"}, status_code=503)
+    if revision != migration_head():
+        return JSONResponse(
+            {"status": "schema outdated", "schema": revision, "expected": migration_head()},
+            status_code=503
+        )
+    # Схему догнали после старта: поднимаем то, что тогда пропустили
+    start_schema_jobs()
+    catalog = get_catalog()
+    return {"status": "ready", "schema": revision, "courses": len(catalog.rows), "catalog_version": catalog.version}
+
+# ================== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ==================
+def add_test_data():
+    """Добавление тестовых данных (минимум 20 курсов)"""
+    db = SessionLocal()
+    
+    # Проверяем, есть ли уже данные
+    count = db.query(Course).count()
+    if count > 0:
+        db.close()
+        return
+    
+    test_courses = [
+        # design (4 курса)
+        ("midjourney-basics", "Основы Midjourney: генерация изображений", "Нетология", "design", "beginner", "online", 15000, "4 недели", "midjourney,ai,art,design", "Научитесь создавать креативные изображения с помощью нейросетей", "https://example.com/aff/midjourney", True, 42),
+        ("stable-diffusion", "Stable Diffusion с нуля", "Яндекс Практикум", "design", "beginner", "online", 18000, "5 недель", "stable-diffusion,ai,art", "Создавайте уникальные изображения и арты", "https://example.com/aff/stable", True, 28),
+        ("figma-ai", "Дизайн интерфейсов с AI в Figma", "Contented", "design", "middle", "online", 28000, "6 недель", "figma,ui/ux,ai,design", "Автоматизируйте дизайн-процесс с помощью AI", "https://example.com/aff/figma-ai", True, 15),
+        ("ai-photo", "AI-обработка фотографий", "Photoshop", "design", "pro", "offline", 35000, "8 недель", "photoshop,ai,photo,editing", "Профессиональная ретушь с нейросетями", "https://example.com/aff/ai-photo", True, 8),
+        
+        # video (3 курса)
+        ("video-ai", "AI для видеомонтажа", "Coursera", "video", "beginner", "online", 12000, "3 недели", "video,ai,editing", "Автоматизируйте монтаж видео", "https://example.com/aff/video", True, 24),
+        ("ai-video-pro", "AI-инструменты для продвинутого монтажа", "Skillbox", "video", "pro", "mixed", 45000, "8 недель", "premiere pro,ai,video,editing", "Продвинутые техники монтажа с AI", "https://example.com/aff/video-pro", True, 12),
+        ("youtube-ai", "Создание контента для YouTube с AI", "Нетология", "video", "middle", "online", 22000, "4 недели", "youtube,ai,video,content", "Генерация идей и автоматизация производства", "https://example.com/aff/youtube", True, 19),
+        
+        # marketing (3 курса)
+        ("ai-marketing", "AI в маркетинге", "GeekBrains", "marketing", "middle", "mixed", 22000, "4 недели", "маркетинг,ai,analytics", "Используйте нейросети для маркетинга", "https://example.com/aff/marketing", True, 31),
+        ("smm-ai", "AI для SMM-специалистов", "Skillfactory", "marketing", "beginner", "online", 15000, "5 недель", "smm,ai,social media", "Автоматизация постинга и анализ аудитории", "https://example.com/aff/smm", True, 22),
+        ("seo-ai", "SEO и контент с искусственным интеллектом", "Яндекс Практикум", "marketing", "pro", "online", 32000, "6 недель", "seo,ai,content,marketing", "Оптимизация сайтов с помощью AI", "https://example.com/aff/seo", True, 14),
+        
+        # automation (3 курса)
+        ("automation-ai", "Автоматизация с помощью AI", "Otus", "automation", "middle", "online", 20000, "5 недель", "automation,ai,scripts", "Создание автоматических скриптов", "https://example.com/aff/automation", True, 17),
+        ("ai-zapier", "Автоматизация бизнеса: AI + Zapier", "Нетология", "automation", "beginner", "online", 18000, "4 недели", "zapier,automation,no-code", "Настройка автоматических workflow", "https://example.com/aff/zapier", True, 26),
+        ("rpa-ai", "RPA и AI для автоматизации процессов", "Stepik", "automation", "pro", "mixed", 38000, "7 недель", "rpa,ai,automation,business", "Роботизация бизнес-процессов", "https://example.com/aff/rpa", True, 9),
+        
+        # coding (4 курса)
+        ("chatgpt-pro", "ChatGPT для профессионалов", "Skillbox", "coding", "middle", "online", 25000, "6 недель", "chatgpt,ai,programming", "Используйте ChatGPT для автоматизации задач", "https://example.com/aff/chatgpt", True, 37),
+        ("neural-networks", "Нейронные сети на Python", "Stepik", "coding", "pro", "online", 35000, "8 недель", "python,нейросети,ml,ai", "Погружение в глубокое обучение", "https://example.com/aff/neural", True, 45),
+        ("python-ml-basics", "Машинное обучение на Python с нуля", "Coursera", "coding", "beginner", "online", 5000, "6 недель", "python,ml,data science", "Введение в машинное обучение", "https://example.com/aff/python-ml", True, 33),
+        ("ai-api", "Разработка AI-приложений и API", "Яндекс Практикум", "coding", "pro", "mixed", 42000, "9 недель", "python,api,ai,development", "Создание микросервисов с AI", "https://example.com/aff/ai-api", True, 11),
+        
+        # business (3 курса)
+        ("ai-business", "AI для бизнеса: стратегия", "Practicum", "business", "pro", "mixed", 40000, "6 недель", "business,ai,strategy", "Внедрение AI в бизнес-процессы", "https://example.com/aff/business", True, 18),
+        ("ai-startup", "Запуск AI-стартапа", "Нетология", "business", "middle", "online", 28000, "5 недель", "startup,ai,business,entrepreneurship", "От идеи к MVP с использованием AI", "https://example.com/aff/startup", True, 23),
+        ("ai-analytics", "Аналитика данных для бизнеса с AI", "GeekBrains", "business", "beginner", "online", 19000, "4 недели", "analytics,ai,business,data", "Принятие решений на основе данных", "https://example.com/aff/analytics", True, 16)
+    ]
+    
+    db.close()
+    rows = [dict(zip(IMPORT_FIELDS + ("clicks",), course_data)) for course_data in test_courses]
+    with engine.begin() as connection:
+        write_courses(connection, rows)
+
+# Схема ведется миграциями Alembic: python main.py migrate (alembic upgrade head)
+# - отдельный шаг деплоя, а до него /readyz отвечает 503. AUTO_MIGRATE=1 -
+# догонять схему при старте (для разработки); если ревизия уже последняя,
+# это один SELECT из alembic_version, без запуска alembic.
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "0") == "1"
+# Тестовые курсы при старте в пустую базу; в продакшене - python main.py seed
+AUTO_SEED = os.getenv("AUTO_SEED", "0") == "1"
+
+def alembic_config():
+    from alembic.config import Config
+
+    config = Config(os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini"))
+    config.attributes["configure_logger"] = False
+    return config
+
+def migrate_database():
+    """alembic upgrade head"""
+    from alembic import command
+
+    command.upgrade(alembic_config(), "head")
+
+_REVISION_LINE = re.compile(r"^(down_revision|revision)\b[^=]*=\s*(None|['\"]([\w-]+)['\"])\s*$", re.M)
+
+@functools.lru_cache(maxsize=None)
+def migration_head() -> str:
+    """Последняя ревизия в migrations/versions.
+
+    Импорт alembic стоит ~100 мс холодного старта, поэтому сначала читаем
+    revision/down_revision из файлов миграций; alembic - только если так
+    однозначно не получилось (ветки, слияния).
+    """
+    versions = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations", "versions")
+    revisions, parents = set(), set()
+    for name in os.listdir(versions):
+        if not name.endswith(".py"):
+            continue
+        with open(os.path.join(versions, name), encoding="utf-8") as f:
+            fields = {key: value for key, _, value in _REVISION_LINE.findall(f.read())}
+        if "revision" not in fields or "down_revision" not in fields:
+            break
+        revisions.add(fields["revision"])
+        if fields["down_revision"]:
+            parents.add(fields["down_revision"])
+    else:
+        heads = revisions - parents
+        if len(heads) == 1:
+            return heads.pop()
+    from alembic.script import ScriptDirectory
+
+    return ScriptDirectory.from_config(alembic_config()).get_current_head()
+
+def schema_revision(connection) -> Optional[str]:
+    """Ревизия схемы в БД (None - миграции не применялись)"""
+    try:
+        return connection.execute(text("SELECT version_num FROM alembic_version")).scalar()
+    except exc.DBAPIError:
+        return None
+
+def init_database():
+    """Миграции (AUTO_MIGRATE), поисковый индекс и тестовые данные (AUTO_SEED)"""
+    # Полный запуск alembic (env.py, соединение) стоит десятки мс на каждом
+    # старте; если ревизия уже последняя, хватает одного SELECT
+    with engine.connect() as connection:
+        migrated = schema_revision(connection) == migration_head()
+    if AUTO_MIGRATE and not migrated:
+        migrate_database()
+        migrated = True
+    init_search_index()
+    if AUTO_SEED and migrated:
+        add_test_data()
+
+# ================== СНИМОК КАТАЛОГА ==================
+# Опубликованный каталог небольшой и меняется только через админку, поэтому
+# листинги фильтруются, сортируются и режутся на страницы в памяти,
+# без запросов к БД на каждый хит.
+
+# Как часто (в секундах) пересортировывать "popular" после новых кликов
+CATALOG_RESORT_SECONDS = float(os.getenv("CATALOG_RESORT_SECONDS", "5"))
+# HTML-листинги: первые страницы - с номерами (?page=N), глубже - по курсору
+HTML_PAGE_DEPTH = int(os.getenv("HTML_PAGE_DEPTH", "10"))
+
+COURSE_FIELDS = (
+    "id", "slug", "title", "provider", "category_slug", "level", "format",
+    "price_from", "duration", "tags", "short_desc", "affiliate_url",
+    "is_published", "clicks", "created_at", "updated_at",
+)
+CourseRow = namedtuple("CourseRow", COURSE_FIELDS)
+# offset - сколько подходящих курсов до страницы (None - в режиме курсора без with_total);
+# prev_cursor - курсор предыдущей страницы, "" - предыдущая страница первая (без курсора)
+CatalogPage = namedtuple(
+    "CatalogPage", ["courses", "total", "total_pages", "page", "next_cursor", "prev_cursor", "offset"]
+)
+# Порядок сортировки: индексы курсов, ключи по позициям (для курсоров) и обратный индекс
+SortOrder = namedtuple("SortOrder", ["order", "keys", "tiebreaks", "positions"])
+
+NO_PRICE = -1  # price_from IS NULL
+NO_TRENDING = float("-inf")  # trending IS NULL (кликов еще не было)
+TRENDING_NONE_KEY = 1e15  # ключ сортировки курсов без трендового рейтинга - минус клики
+
+# Фасеты: границы корзин гистограммы цен и размер кэша на один снимок
+PRICE_BUCKETS = (0, 10000, 20000, 30000, 40000, 50000)
+FACET_CACHE_SIZE = int(os.getenv("FACET_CACHE_SIZE", "1024"))
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш с ограничением размера и необязательным TTL"""
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def discard(self, predicate):
+        """Удаляет записи, для ключей которых predicate(key) истинен"""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+
+def _encode_column(values):
+    """Кодирует строковую колонку целыми числами: (словарь значение->код, коды)"""
+    codes = {}
+    column = array("H")
+    for value in values:
+        column.append(codes.setdefault(value, len(codes)))
+    return codes, column
+
+
+def parse_price(value) -> Optional[int]:
+    """Цена из query-параметра; пустые и нечисловые значения игнорируются"""
+    if value is None or isinstance(value, int):
+        return value
+    value = value.strip()
+    return int(value) if value.isdigit() else None
+
+
+class CatalogSnapshot:
+    """Колоночный снимок опубликованных курсов (только для чтения)"""
+
+    def __init__(self, courses, course_tags=(), version: int = 0):
+        self.version = version  # catalog_version, на которой построен снимок
+        self.rows = [CourseRow(*(getattr(c, f) for f in COURSE_FIELDS)) for c in courses]
+        self.index = {row.id: i for i, row in enumerate(self.rows)}
+        self.slugs = {row.slug: i for i, row in enumerate(self.rows)}
+
+        # Теги: инвертированный индекс slug -> курсы и теги каждого курса
+        # course_tags - (course_id, slug, название) в порядке position
+        self.tag_index = {}
+        self.tag_names = {}
+        self.row_tags = [[] for _ in self.rows]
+        for course_id, slug, name in course_tags:
+            i = self.index.get(course_id)
+            if i is not None:
+                self.tag_index.setdefault(slug, set()).add(i)
+                self.tag_names.setdefault(slug, name)
+                self.row_tags[i].append(name)
+
+        # Колонки для фильтров и сортировок
+        self.price = array("q", (NO_PRICE if r.price_from is None else r.price_from for r in self.rows))
+        self.clicks = array("q", (r.clicks or 0 for r in self.rows))
+        self.trending = array("d", (
+            NO_TRENDING if getattr(c, "trending", None) is None else c.trending for c in courses
+        ))
+        self.created_at = array("d", (r.created_at.timestamp() if r.created_at else 0.0 for r in self.rows))
+        self.category_codes, self.category = _encode_column(r.category_slug for r in self.rows)
+        self.level_codes, self.level = _encode_column(r.level for r in self.rows)
+        self.format_codes, self.format = _encode_column(r.format for r in self.rows)
+
+        # Текст для поиска: title+tags и title+tags+short_desc
+        self.search_short = ["\x00".join((r.title or "", r.tags or "")).casefold() for r in self.rows]
+        self.search_full = [
+            "\x00".join((r.title or "", r.tags or "", r.short_desc or "")).casefold() for r in self.rows
+        ]
+
+        # Предвычисленные порядки сортировки: по возрастанию (ключ, tiebreak)
+        ids = [r.id for r in self.rows]
+        no_price = float("inf")  # курсы без цены - в конце
+        # sorts[sort] заменяется целиком: читатель видит старый или новый SortOrder,
+        # но не смесь поколений
+        self.sorts = {}
+        self._add_order("new", [-t for t in self.created_at], [-i for i in ids])
+        self._add_order("price_asc", [no_price if p == NO_PRICE else p for p in self.price], ids)
+        self._add_order("price_desc", [no_price if p == NO_PRICE else -p for p in self.price], ids)
+        self._sorted_at = {}
+        self._dirty = set()
+        # _lock - клики и trending (изменяемые колонки), _resort_lock - одна пересортировка за раз
+        self._lock = threading.Lock()
+        self._resort_lock = threading.Lock()
+        self._sort_live("popular")
+        self._sort_live("trending")
+
+        # Данные для фильтров на странице каталога
+        self.facet_cache = LRUCache(FACET_CACHE_SIZE)
+        self.categories = sorted(c for c in self.category_codes if c)
+        prices = [p for p in self.price if p != NO_PRICE]
+        self.price_range = {
+            "min": min(prices, default=0) or 0,
+            "max": max(prices, default=0) or 100000,
+        }
+        self._suggest = None
+        self._suggest_lock = threading.Lock()
+
+    def _add_order(self, sort: str, keys, tiebreaks):
+        """Строит SortOrder и публикует его одним присваиванием"""
+        order = array("I", sorted(range(len(self.rows)), key=lambda i: (keys[i], tiebreaks[i])))
+        positions = array("I", bytes(4 * len(order)))
+        for position, i in enumerate(order):
+            positions[i] = position
+        self.sorts[sort] = SortOrder(
+            order,
+            array("d", (keys[i] for i in order)),
+            array("q", (tiebreaks[i] for i in order)),
+            positions,
+        )
+
+    def _sort_live(self, sort: str):
+        """Пересортировка порядков, зависящих от кликов ("popular", "trending")"""
+        ids = [r.id for r in self.rows]
+        with self._lock:
+            # Копии колонок: клики во время сортировки попадут в следующую
+            clicks = self.clicks.tolist()
+            trending = self.trending.tolist()
+            self._sorted_at[sort] = time.monotonic()
+            self._dirty.discard(sort)
+        if sort == "popular":
+            self._add_order("popular", [-c for c in clicks], ids)
+        else:
+            # Курсы без трендовых кликов - после остальных, по числу кликов
+            self._add_order("trending", [
+                -t if t != NO_TRENDING else TRENDING_NONE_KEY - c for t, c in zip(trending, clicks)
+            ], ids)
+
+    def sort_order(self, sort: str) -> SortOrder:
+        """Текущий SortOrder (sort уже нормализован); устаревший живой порядок пересортировывается"""
+        if sort in self._dirty and time.monotonic() - self._sorted_at[sort] >= CATALOG_RESORT_SECONDS:
+            # Пока другой поток сортирует, отдаем предыдущий порядок
+            if self._resort_lock.acquire(blocking=False):
+                try:
+                    if sort in self._dirty:
+                        self._sort_live(sort)
+                finally:
+                    self._resort_lock.release()
+        return self.sorts[sort]
+
+    def suggest_index(self) -> "SuggestIndex":
+        """Префиксный индекс подсказок (строится при первом обращении)"""
+        if self._suggest is None:
+            with self._suggest_lock:
+                if self._suggest is None:
+                    self._suggest = SuggestIndex.build(self)
+        return self._suggest
+
+    def tags_of(self, row: CourseRow) -> list:
+        """Названия тегов курса из снимка"""
+        return self.row_tags[self.index[row.id]]
+
+    def _tagged(self, tags: Optional[list], tag_mode: str) -> Optional[set]:
+        """Курсы с тегами: все (tag_mode="all") или любой ("any"); None - без фильтра"""
+        slugs = [slug for slug in (tag_slug(tag) for tag in tags or ()) if slug]
+        if not slugs:
+            return None
+        sets = [self.tag_index.get(slug, set()) for slug in slugs]
+        return set().union(*sets) if tag_mode == "any" else set.intersection(*sets)
+
+    def find(self, slug: str) -> Optional[CourseRow]:
+        """Опубликованный курс по slug"""
+        i = self.slugs.get(slug)
+        return self.rows[i] if i is not None else None
+
+    def record_click(self, course_id: int):
+        """Учитывает клик без пересборки снимка"""
+        i = self.index.get(course_id)
+        if i is None:
+            return
+        with self._lock:
+            self.clicks[i] += 1
+            self.rows[i] = self.rows[i]._replace(clicks=self.clicks[i])
+            self._dirty.update(("popular", "trending"))
+
+    def update_trending(self, scores: dict):
+        """Новые трендовые рейтинги {id курса: trending} без пересборки снимка"""
+        with self._lock:
+            for course_id, score in scores.items():
+                i = self.index.get(course_id)
+                if i is not None:
+                    self.trending[i] = NO_TRENDING if score is None else score
+            self._dirty.add("trending")
+
+    def _checks(self, category, level, format, price_min, price_max, query, search_desc):
+        """Предикаты фильтров по индексу курса; None - заведомо пустой результат"""
+        checks = []
+        for value, codes, column in (
+            (category, self.category_codes, self.category),
+            (level, self.level_codes, self.level),
+            (format, self.format_codes, self.format),
+        ):
+            if value and value != "all":
+                code = codes.get(value)
+                if code is None:
+                    return None
+                checks.append(lambda i, column=column, code=code: column[i] == code)
+
+        price = self.price
+        if price_min is not None:
+            checks.append(lambda i: price[i] != NO_PRICE and price[i] >= price_min)
+        if price_max is not None:
+            checks.append(lambda i: price[i] != NO_PRICE and price[i] <= price_max)
+
+        if query:
+            needle = query.casefold()
+            haystack = self.search_full if search_desc else self.search_short
+            checks.append(lambda i: needle in haystack[i])
+        return checks
+
+    def select(
+        self,
+        category: Optional[str] = None,
+        level: Optional[str] = None,
+        format: Optional[str] = None,
+        price_min: Optional[int] = None,
+        price_max: Optional[int] = None,
+        query: Optional[str] = None,
+        search_desc: bool = False,
+        ids: Optional[list] = None,
+        tags: Optional[list] = None,
+        tag_mode: str = "all",
+        sort: str = "popular",
+        page: int = 1,
+        per_page: int = 9,
+        cursor: Optional[str] = None,
+        with_total: bool = True,
+    ) -> CatalogPage:
+        """Фильтрация, сортировка и пагинация в памяти.
+
+        ids - результат полнотекстового поиска (по релевантности); если задан,
+        query по снимку не применяется, а sort="relevance" сохраняет порядок ids.
+        tags - фильтр по тегам через инвертированный индекс (tag_mode: all/any).
+        cursor - продолжение с next_cursor предыдущей страницы (keyset):
+        стоимость не зависит от глубины, page игнорируется, а total
+        считается только при with_total. Назад - по prev_cursor: от позиции
+        курсора назад отбирается per_page подходящих курсов."""
+        ranked = sort == "relevance" and ids is not None
+        if not ranked and sort not in self.sorts:
+            sort = "popular"
+        # Один SortOrder на весь запрос - пересортировка в другом потоке его не меняет
+        current = self.sort_order("popular" if ranked else sort)
+
+        if ids is None:
+            matched = current.order
+        else:
+            matched = [self.index[course_id] for course_id in ids if course_id in self.index]
+            if not ranked:
+                # Сортируем только найденное, без прохода по всему каталогу
+                matched.sort(key=current.positions.__getitem__)
+            query = None
+
+        tagged = self._tagged(tags, tag_mode)
+        if tagged is not None:
+            if ids is None:
+                matched = sorted(tagged, key=current.positions.__getitem__)
+            else:
+                matched = [i for i in matched if i in tagged]
+
+        checks = self._checks(category, level, format, price_min, price_max, query, search_desc)
+        if checks is None:
+            matched, checks = [], []
+
+        def cursor_at(i):
+            """Курсор, продолжающий выдачу после курса i"""
+            if ranked:
+                return encode_cursor("relevance", full.index(i), 0)
+            position = current.positions[i]
+            return encode_cursor(sort, current.keys[position], current.tiebreaks[position])
+
+        def passes(i):
+            return all(check(i) for check in checks)
+
+        full = matched  # для курсора по релевантности - позиция в выдаче поиска
+        prev_cursor = None
+        if cursor is None:
+            for check in checks:
+                matched = [i for i in matched if check(i)]
+            total = len(matched)
+            total_pages = (total + per_page - 1) // per_page if total > 0 else 1
+            page = max(1, min(page, total_pages))
+            offset = (page - 1) * per_page
+            chunk = matched[offset:offset + per_page + 1]
+        else:
+            start = self._seek(matched, "relevance" if ranked else sort, cursor, current)
+            candidates = (matched[j] for j in range(start, len(matched)))
+            if checks:
+                candidates = filter(passes, candidates)
+            chunk = list(islice(candidates, per_page + 1))
+
+            # Предыдущая страница - per_page подходящих курсов перед start;
+            # курсор к ней - после курса, стоящего перед ними
+            before = (matched[j] for j in range(start - 1, -1, -1))
+            if checks:
+                before = filter(passes, before)
+            before = list(islice(before, per_page + 1))
+            if len(before) > per_page:
+                prev_cursor = cursor_at(before[per_page])
+            elif before:
+                prev_cursor = ""
+
+            total = total_pages = page = offset = None
+            if with_total:
+                total = sum(1 for i in matched if passes(i)) if checks else len(matched)
+                total_pages = (total + per_page - 1) // per_page if total > 0 else 1
+                offset = sum(1 for j in range(start) if passes(matched[j])) if checks else start
+
+        next_cursor = cursor_at(chunk[per_page - 1]) if len(chunk) > per_page else None
+        courses = [self.rows[i] for i in chunk[:per_page]]
+        return CatalogPage(courses, total, total_pages, page, next_cursor, prev_cursor, offset)
+
+    def facets(
+        self,
+        category: Optional[str] = None,
+        level: Optional[str] = None,
+        format: Optional[str] = None,
+        price_min: Optional[int] = None,
+        price_max: Optional[int] = None,
+        query: Optional[str] = None,
+        search_desc: bool = False,
+        ids: Optional[list] = None,
+        tags: Optional[list] = None,
+        tag_mode: str = "all",
+    ) -> dict:
+        """Счетчики по категориям, уровням, форматам и гистограмма цен за один проход.
+
+        Фасеты дизъюнктивные: курс, не прошедший только фильтр самого фасета,
+        учитывается в его счетчиках - так видно, сколько курсов даст каждый вариант."""
+        if ids is not None:
+            candidates = [self.index[course_id] for course_id in ids if course_id in self.index]
+            query = None
+        else:
+            candidates = range(len(self.rows))
+        tagged = self._tagged(tags, tag_mode)
+        if tagged is not None:
+            candidates = [i for i in candidates if i in tagged] if ids is not None else sorted(tagged)
+        if query:
+            needle = query.casefold()
+            haystack = self.search_full if search_desc else self.search_short
+            candidates = [i for i in candidates if needle in haystack[i]]
+
+        columns = []  # (колонка, требуемый код или None, счетчики по кодам)
+        for value, codes, column in (
+            (category, self.category_codes, self.category),
+            (level, self.level_codes, self.level),
+            (format, self.format_codes, self.format),
+        ):
+            wanted = codes.get(value, -1) if value and value != "all" else None
+            columns.append((column, wanted, [0] * len(codes)))
+        (category_column, category_code, category_counts), \
+            (level_column, level_code, level_counts), \
+            (format_column, format_code, format_counts) = columns
+
+        price = self.price
+        low = price_min if price_min is not None else 0
+        high = price_max if price_max is not None else float("inf")
+        has_price_filter = price_min is not None or price_max is not None
+        histogram = [0] * len(PRICE_BUCKETS)
+        prices = []
+        total = 0
+
+        for i in candidates:
+            c, l, f, p = category_column[i], level_column[i], format_column[i], price[i]
+            category_ok = category_code is None or c == category_code
+            level_ok = level_code is None or l == level_code
+            format_ok = format_code is None or f == format_code
+            price_ok = not has_price_filter or (p != NO_PRICE and low <= p <= high)
+            if category_ok and level_ok and format_ok:
+                if p != NO_PRICE:
+                    histogram[bisect_right(PRICE_BUCKETS, p) - 1] += 1
+                    prices.append(p)
+                if price_ok:
+                    total += 1
+                    category_counts[c] += 1
+                    level_counts[l] += 1
+                    format_counts[f] += 1
+                continue
+            if not price_ok:
+                continue
+            # Ровно один непройденный фасет - считаем курс только в нем
+            if level_ok and format_ok:
+                category_counts[c] += 1
+            elif category_ok and format_ok:
+                level_counts[l] += 1
+            elif category_ok and level_ok:
+                format_counts[f] += 1
+
+        def named(codes, counts):
+            return {value: counts[code] for value, code in codes.items() if value}
+
+        bounds = PRICE_BUCKETS + (None,)
+        return {
+            "total": total,
+            "category": named(self.category_codes, category_counts),
+            "level": named(self.level_codes, level_counts),
+            "format": named(self.format_codes, format_counts),
+            "price": {
+                "min": min(prices, default=None),
+                "max": max(prices, default=None),
+                "histogram": [
+                    {"from": bounds[k], "to": bounds[k + 1] - 1 if bounds[k + 1] else None, "count": count}
+                    for k, count in enumerate(histogram)
+                ],
+            },
+        }
+
+    def _seek(self, matched, sort: str, cursor: str, current: SortOrder) -> int:
+        """Позиция в matched сразу после курсора"""
+        key, tiebreak = decode_cursor(cursor, sort)
+        if sort == "relevance":
+            return int(key) + 1
+        keys, tiebreaks = current.keys, current.tiebreaks
+        position = bisect_right(range(len(keys)), (key, tiebreak), key=lambda p: (keys[p], tiebreaks[p]))
+        if matched is current.order:
+            return position
+        return bisect_left(matched, position, key=current.positions.__getitem__)
+
+
+def encode_cursor(sort: str, key: float, tiebreak: int) -> str:
+    """Непрозрачный курсор: сортировка + (ключ, tiebreak) последнего курса"""
+    raw = json.dumps([sort, key, tiebreak], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, key, tiebreak = json.loads(raw)
+        key, tiebreak = float(key), int(tiebreak)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if cursor_sort != sort:
+        raise HTTPException(status_code=400, detail="Cursor does not match sort")
+    return key, tiebreak
+
+
+_catalog: Optional[CatalogSnapshot] = None
+_catalog_lock = threading.Lock()
+
+
+def build_catalog(db: Session) -> CatalogSnapshot:
+    """Загружает опубликованные курсы и строит снимок"""
+    # Версия - до курсов: если изменение придет между запросами, снимок
+    # окажется новее своей версии и просто пересоберется лишний раз
+    version = catalog_version(db.connection())
+    courses = db.query(Course).filter(Course.is_published == True).order_by(Course.id).all()
+    course_tags = (
+        db.query(CourseTag.course_id, Tag.slug, Tag.name)
+        .join(Tag, Tag.id == CourseTag.tag_id)
+        .order_by(CourseTag.course_id, CourseTag.position)
+        .all()
+    )
+    return CatalogSnapshot(courses, course_tags, version)
+
+
+def load_catalog() -> CatalogSnapshot:
+    """Снимок в отдельной сессии: у SQLite сборка не занимает соединение-писатель"""
+    db = FreshSessionLocal()
+    try:
+        return build_catalog(db)
+    finally:
+        db.close()
+
+
+def get_catalog() -> CatalogSnapshot:
+    """Текущий снимок каталога (строится при первом обращении)"""
+    global _catalog
+    snapshot = _catalog
+    if snapshot is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = load_catalog()
+            snapshot = _catalog
+    return snapshot
+
+
+def warm_catalog():
+    """Строим снимок и индекс подсказок до первого запроса, а не внутри него"""
+    get_catalog().suggest_index()
+
+
+def get_facets(
+    db: Session,
+    catalog: CatalogSnapshot,
+    category: Optional[str] = None,
+    level: Optional[str] = None,
+    format: Optional[str] = None,
+    price_min: Optional[int] = None,
+    price_max: Optional[int] = None,
+    query: Optional[str] = None,
+    search_desc: bool = False,
+    tags: Optional[list] = None,
+    tag_mode: str = "all",
+) -> dict:
+    """Фасеты с кэшем на снимок: повторный запрос не ходит ни в память, ни в поиск"""
+    key = tuple(None if v in ("", "all") else v for v in (category, level, format, price_min, price_max, query))
+    key += (search_desc, tuple(sorted(tags or ())), tag_mode)
+    facets = catalog.facet_cache.get(key)
+    if facets is None:
+        ids = search_course_ids(db, query) if query else None
+        facets = catalog.facets(category, level, format, price_min, price_max, query, search_desc, ids, tags, tag_mode)
+        catalog.facet_cache.set(key, facets)
+    return facets
+
+
+def catalog_changed():
+    """Вызывается после каждого коммита изменений курсов в админке"""
+    global _catalog
+    # Накопленные клики - в БД, иначе новый снимок их не увидит
+    click_buffer.flush()
+    with _catalog_lock:
+        previous, current = _catalog, load_catalog()
+        if previous is not None and previous._suggest is not None:
+            # Подсказки пересобираются только для изменившихся курсов
+            changed = {row.id for row in changed_courses(previous, current)}
+            current._suggest = SuggestIndex.build(current, previous._suggest, changed)
+        _catalog = current
+        # Кэши сбрасываются под той же блокировкой: иначе параллельная
+        # пересборка может сбросить их по паре снимков не в том порядке
+        page_cache.catalog_changed(previous, current)
+        course_json_changed(previous, current)
+        course_cards_changed(previous, current)
+    related_job.wake()
+
+
+# ================== ВЕРСИЯ КАТАЛОГА ==================
+# Снимок, кэши страниц, JSON и карточек живут в памяти каждого воркера.
+# Любое изменение курсов (ORM-flush или bulk-импорт) в той же транзакции
+# увеличивает catalog_version.version; каждый воркер следит за ней и
+# пересобирает снимок через catalog_changed, когда версия в БД новее его
+# снимка. PostgreSQL будит воркеры через NOTIFY сразу после коммита, прочие
+# СУБД опрашиваются раз в CATALOG_POLL_SECONDS.
+
+CATALOG_POLL_SECONDS = float(os.getenv("CATALOG_POLL_SECONDS", "1"))  # 0 - не следить
+CATALOG_NOTIFY_FALLBACK_SECONDS = 30  # PostgreSQL: проверка версии, даже если NOTIFY потерялся
+CATALOG_CHANNEL = "catalog_changed"
+
+
+def catalog_version(connection) -> int:
+    table = CatalogVersion.__table__
+    return connection.execute(select(table.c.version).where(table.c.id == 1)).scalar() or 0
+
+
+def bump_catalog_version(connection):
+    """Новая версия каталога в текущей транзакции (+ NOTIFY на PostgreSQL)"""
+    table = CatalogVersion.__table__
+    bumped = connection.execute(
+        update(table).where(table.c.id == 1).values(version=table.c.version + 1, changed_at=func.now())
+    ).rowcount
+    if not bumped:
+        connection.execute(table.insert(), {"id": 1, "version": 1, "changed_at": datetime.now(timezone.utc)})
+    if connection.dialect.name == "postgresql":
+        # Уведомление уходит слушателям только при коммите транзакции
+        connection.execute(text("SELECT pg_notify(:channel, '')"), {"channel": CATALOG_CHANNEL})
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_on_course_flush(session, flush_context):
+    # В after_flush new/dirty/deleted еще содержат объекты этого flush
+    if any(isinstance(obj, Course) for obj in chain(session.new, session.dirty, session.deleted)):
+        bump_catalog_version(session.connection())
+
+
+def sync_catalog() -> bool:
+    """Пересобирает снимок, если версия каталога в БД новее; True - пересобран"""
+    snapshot = _catalog
+    if snapshot is None:
+        return False
+    with fresh_engine.connect() as connection:
+        version = catalog_version(connection)
+    if version <= snapshot.version:
+        return False
+    catalog_changed()
+    logger.info("Каталог обновлен до версии %s (было %s)", _catalog.version, snapshot.version)
+    return True
+
+
+class CatalogWatcher:
+    """Фоновый поток: следит за catalog_version и вызывает sync_catalog"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _poll(self):
+        while not self._stop.wait(self.interval):
+            try:
+                sync_catalog()
+            except (exc.DBAPIError, exc.TimeoutError):
+                logger.exception("Не удалось проверить версию каталога")
+
+    def _listen(self):
+        """LISTEN на отдельном соединении; при ошибке - переподключение"""
+        while not self._stop.is_set():
+            raw = None
+            try:
+                raw = engine.raw_connection()
+                connection = raw.connection  # psycopg2
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CATALOG_CHANNEL}")
+                # Изменения между стартом и LISTEN
+                sync_catalog()
+                checked = time.monotonic()
+                with selectors.DefaultSelector() as selector:
+                    selector.register(connection, selectors.EVENT_READ)
+                    # Таймаут interval - чтобы stop() не ждал следующего NOTIFY
+                    while not self._stop.is_set():
+                        notified = bool(selector.select(timeout=self.interval))
+                        if notified:
+                            connection.poll()
+                            connection.notifies.clear()
+                        if notified or time.monotonic() - checked >= CATALOG_NOTIFY_FALLBACK_SECONDS:
+                            sync_catalog()
+                            checked = time.monotonic()
+            except Exception:
+                logger.exception("Слушатель изменений каталога: ошибка, переподключаемся")
+            finally:
+                if raw is not None:
+                    raw.invalidate()  # соединение с LISTEN в пул не возвращаем
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._stop.clear()
+            target = self._listen if engine.dialect.name == "postgresql" else self._poll
+            self._thread = threading.Thread(target=target, name="catalog-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+
+catalog_watcher = CatalogWatcher(CATALOG_POLL_SECONDS)
+
+
+# ================== ПОДСКАЗКИ ПОИСКА ==================
+# /api/suggest отвечает на каждое нажатие клавиши, поэтому без БД и без
+# перебора курсов: ключи (название курса с начала каждого слова, теги,
+# категории, провайдеры) лежат в отсортированном массиве, префикс - это
+# диапазон bisect, а лучшие по кликам в диапазоне достает дерево максимумов
+# за O(k log n). Ключи нормализованы: casefold, ё -> е, одиночные пробелы.
+
+SUGGEST_KEY_LENGTH = 64  # длиннее префиксы не набирают - хвост не храним
+SUGGEST_KINDS = ("course", "tag", "category", "provider")
+_COURSE, _TAG, _CATEGORY, _PROVIDER = range(len(SUGGEST_KINDS))
+
+_WORD_START = re.compile(r"\b\w")
+
+
+def suggest_key(text: Optional[str]) -> str:
+    return " ".join((text or "").casefold().replace("ё", "е").split())
+
+
+def suggest_keys(text: Optional[str]) -> list:
+    """Ключи для поиска по началу любого слова: "основы python" -> ["основы python", "python"]"""
+    key = suggest_key(text)
+    return [key[m.start():m.start() + SUGGEST_KEY_LENGTH] for m in _WORD_START.finditer(key)]
+
+
+class SuggestIndex:
+    """Отсортированные ключи подсказок и дерево отрезков с максимумом веса"""
+
+    def __init__(self, entries: list, weights: list):
+        # entries - отсортированные (ключ, вид, ref): ref - id курса, slug тега
+        # или категории, название провайдера
+        self.entries = entries
+        self.keys = [entry[0] for entry in entries]
+        self.weights = array("q", weights)
+        size = 1
+        while size < len(entries):
+            size *= 2
+        self._size = size
+        tree = array("i", [-1]) * (2 * size)
+        tree[size:size + len(entries)] = array("i", range(len(entries)))
+        for node in range(size - 1, 0, -1):
+            left, right = tree[2 * node], tree[2 * node + 1]
+            tree[node] = left if right < 0 or (left >= 0 and self.weights[left] >= self.weights[right]) else right
+        self._tree = tree
+
+    @classmethod
+    def build(cls, catalog: "CatalogSnapshot", previous: Optional["SuggestIndex"] = None, changed=None) -> "SuggestIndex":
+        """Индекс по снимку; с previous ключи неизменившихся курсов берутся из него"""
+        rows = catalog.rows
+        fresh = []
+        if previous is None:
+            changed_rows = rows
+        else:
+            changed_rows = [rows[catalog.index[course_id]] for course_id in changed if course_id in catalog.index]
+        for row in changed_rows:
+            fresh.extend((key, _COURSE, row.id) for key in suggest_keys(row.title))
+
+        # Группы (теги, категории, провайдеры) немногочисленны - всегда заново
+        group_weights = {}
+        for slug, courses in catalog.tag_index.items():
+            weight = sum(catalog.clicks[i] for i in courses)
+            group_weights[(_TAG, slug)] = weight
+            fresh.extend((key, _TAG, slug) for key in suggest_keys(catalog.tag_names[slug]))
+        for i, row in enumerate(rows):
+            for kind, value in ((_CATEGORY, row.category_slug), (_PROVIDER, row.provider)):
+                if value:
+                    group_weights[(kind, value)] = group_weights.get((kind, value), 0) + catalog.clicks[i]
+        for (kind, value) in list(group_weights):
+            if kind != _TAG:
+                fresh.extend((key, kind, value) for key in suggest_keys(value))
+        fresh.sort()
+
+        if previous is None:
+            entries = fresh
+        else:
+            kept = (
+                entry for entry in previous.entries
+                if entry[1] == _COURSE and entry[2] not in changed and entry[2] in catalog.index
+            )
+            entries = list(heapq.merge(kept, fresh))
+        weights = [
+            catalog.clicks[catalog.index[ref]] if kind == _COURSE else group_weights[(kind, ref)]
+            for _, kind, ref in entries
+        ]
+        return cls(entries, weights)
+
+    def _argmax(self, lo: int, hi: int) -> int:
+        """Позиция с наибольшим весом в [lo, hi) или -1"""
+        best, weights, tree = -1, self.weights, self._tree
+        lo += self._size
+        hi += self._size
+        while lo < hi:
+            if lo & 1:
+                if best < 0 or weights[tree[lo]] > weights[best]:
+                    best = tree[lo]
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                if best < 0 or weights[tree[hi]] > weights[best]:
+                    best = tree[hi]
+            lo >>= 1
+            hi >>= 1
+        return best
+
+    def top(self, prefix: str, limit: int) -> list:
+        """До limit разных (вид, ref) с ключом на prefix, по убыванию веса"""
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + "\uffff", lo)
+        found, seen, heap = [], set(), []
+
+        def push(lo, hi):
+            if lo < hi:
+                best = self._argmax(lo, hi)
+                heapq.heappush(heap, (-self.weights[best], best, lo, hi))
+
+        push(lo, hi)
+        while heap and len(found) < limit:
+            _, best, lo, hi = heapq.heappop(heap)
+            _, kind, ref = self.entries[best]
+            if (kind, ref) not in seen:
+                seen.add((kind, ref))
+                found.append((kind, ref, self.weights[best]))
+            push(lo, best)
+            push(best + 1, hi)
+        return found
+
+
+def suggest(catalog: "CatalogSnapshot", q: str, limit: int) -> list:
+    """Подсказки для строки поиска: курсы, теги, категории, провайдеры"""
+    prefix = suggest_key(q)[:SUGGEST_KEY_LENGTH]
+    if not prefix:
+        return []
+    # Берем с запасом и досортировываем курсы по текущим кликам:
+    # веса в индексе - на момент его сборки
+    candidates = catalog.suggest_index().top(prefix, limit * 2)
+    ranked = []
+    for kind, ref, weight in candidates:
+        if kind == _COURSE:
+            i = catalog.index.get(ref)
+            if i is None:
+                continue
+            weight = catalog.clicks[i]
+        ranked.append((-weight, kind, ref))
+    ranked.sort(key=lambda item: (item[0], item[1]))
+    suggestions = []
+    for _, kind, ref in ranked[:limit]:
+        if kind == _COURSE:
+            row = catalog.rows[catalog.index[ref]]
+            item = {"text": row.title, "url": f"/course/{row.slug}"}
+        elif kind == _TAG:
+            item = {"text": catalog.tag_names[ref], "url": "/courses?" + urllib.parse.urlencode({"tag": ref})}
+        elif kind == _CATEGORY:
+            item = {"text": ref, "url": f"/category/{ref}"}
+        else:
+            # Фильтра по провайдеру нет - подсказка только дополняет строку поиска
+            item = {"text": ref, "url": None}
+        suggestions.append({"type": SUGGEST_KINDS[kind], **item})
+    return suggestions
+
+
+# ================== БУФЕР КЛИКОВ ==================
+# /out/{slug} не ждет записи в БД: клик ставится в очередь, а фоновый поток
+# раз в CLICK_FLUSH_SECONDS (или при CLICK_FLUSH_SIZE кликах) пишет пачку
+# Click одним executemany и сводит счетчики в UPDATE clicks = clicks + n.
+
+CLICK_FLUSH_SIZE = int(os.getenv("CLICK_FLUSH_SIZE", "500"))
+CLICK_FLUSH_SECONDS = float(os.getenv("CLICK_FLUSH_SECONDS", "1.0"))
+
+logger = logging.getLogger("courses")
+
+
+class ClickBuffer:
+    """Очередь кликов с пакетной записью в БД"""
+
+    def __init__(self, flush_size: int, flush_seconds: float):
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def add(self, course_id: int, referer: Optional[str], utm_source: Optional[str], utm_campaign: Optional[str]):
+        """Ставит клик в очередь (не блокирует)"""
+        click = {
+            "course_id": course_id,
+            "ts": datetime.now(timezone.utc),
+            "referer": referer,
+            "utm_source": utm_source,
+            "utm_campaign": utm_campaign,
+        }
+        with self._lock:
+            self._pending.append(click)
+            full = len(self._pending) >= self.flush_size
+        if full:
+            self._wakeup.set()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def flush(self) -> int:
+        """Записывает накопленные клики одной транзакцией; возвращает их число"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            counts = Counter(click["course_id"] for click in batch)
+            try:
+                with engine.begin() as connection:
+                    connection.execute(Click.__table__.insert(), batch)
+                    connection.execute(
+                        Course.__table__.update()
+                        .where(Course.id == bindparam("course_id_"))
+                        .values(clicks=func.coalesce(Course.clicks, 0) + bindparam("n")),
+                        [{"course_id_": course_id, "n": n} for course_id, n in counts.items()]
+                    )
+            except (exc.DBAPIError, exc.TimeoutError):
+                # Возвращаем пачку в начало очереди, повторим при следующем сбросе
+                logger.exception("Не удалось записать %d кликов", len(batch))
+                with self._lock:
+                    self._pending[:0] = batch
+                return 0
+            return len(batch)
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_seconds)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Поток не должен умирать: без него клики копятся в памяти до OOM
+                logger.exception("Сброс кликов: непредвиденная ошибка")
+
+    def is_alive(self) -> bool:
+        """Поток сброса запущен и жив (для /readyz)"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Запускает фоновый поток сброса"""
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="click-flusher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Останавливает поток и сбрасывает все, что осталось в очереди"""
+        if self._thread is not None:
+            self._stopping = True
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+click_buffer = ClickBuffer(CLICK_FLUSH_SIZE, CLICK_FLUSH_SECONDS)
+
+
+def find_course(slug: str) -> Optional[Course]:
+    """Курс по slug из БД (в том числе неопубликованный)"""
+    db = FreshSessionLocal()
+    try:
+        return db.query(Course).filter(Course.slug == slug).first()
+    finally:
+        db.close()
+
+# ================== АГРЕГАТЫ КЛИКОВ ==================
+# Фоновая задача раскладывает новые клики (Click.id > высшей отметки) по
+# часовым и дневным агрегатам (курс, utm_source, utm_campaign). Отметка
+# сдвигается в той же транзакции, что и upsert агрегатов, поэтому каждый клик
+# учитывается ровно один раз, даже если задача крутится в нескольких воркерах.
+
+CLICK_ROLLUP_SECONDS = float(os.getenv("CLICK_ROLLUP_SECONDS", "60"))  # 0 - без фоновой задачи
+CLICK_ROLLUP_BATCH = int(os.getenv("CLICK_ROLLUP_BATCH", "10000"))
+# Клики, записанные (clicks.inserted_at) позже этого, не трогаем: параллельная
+# транзакция с меньшим id может еще не закоммититься, а отметка назад не
+# двигается. ts для этого не годится - он ставится в буфере и при повторном
+# сбросе уже старый. Лаг должен перекрывать самую долгую транзакцию сброса
+CLICK_ROLLUP_LAG_SECONDS = float(os.getenv("CLICK_ROLLUP_LAG_SECONDS", str(CLICK_FLUSH_SECONDS + 5)))
+ROLLUP_KEY = ("bucket", "course_id", "utm_source", "utm_campaign")
+
+
+def as_utc(value: datetime) -> datetime:
+    """Время в UTC; наивное (SQLite) считаем уже UTC"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def dialect_insert(connection):
+    """insert() с поддержкой ON CONFLICT для SQLite/PostgreSQL, иначе None"""
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    return insert
+
+
+def upsert_add(connection, table, rows: list, key=ROLLUP_KEY, column: str = "clicks"):
+    """INSERT ... ON CONFLICT (key) DO UPDATE SET column = column + excluded.column"""
+    if not rows:
+        return
+    insert = dialect_insert(connection)
+    if insert is not None:
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(key),
+            set_={column: table.c[column] + stmt.excluded[column]}
+        )
+        connection.execute(stmt, rows)
+        return
+    # Прочие СУБД: UPDATE, а для новых ключей - INSERT
+    for row in rows:
+        updated = connection.execute(
+            table.update()
+            .where(*(table.c[name] == row[name] for name in key))
+            .values({column: table.c[column] + row[column]})
+        )
+        if not updated.rowcount:
+            connection.execute(table.insert(), row)
+
+
+def claim_click_batch(name: str, columns: tuple, on_batch, batch_size: int, lag_seconds: float):
+    """Забирает следующую пачку осевших кликов после отметки name в rollup_state.
+
+    Клики берутся по id, пока время их записи старше lag_seconds. Отметка
+    сдвигается условно (last_id == прежний): если другой воркер успел раньше,
+    пачка не обрабатывается. on_batch(connection, last_id, new_last_id, rows)
+    вызывается в той же транзакции уже после сдвига; rows - (id, ts, *columns),
+    ts в UTC. Возвращает (прежняя отметка, результат on_batch или None)."""
+    clicks, state = Click.__table__, RollupState.__table__
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=lag_seconds)
+    with engine.begin() as connection:
+        last_id = connection.execute(select(state.c.last_id).where(state.c.name == name)).scalar()
+        if last_id is None:
+            connection.execute(state.insert(), {"name": name, "last_id": 0})
+            last_id = 0
+        rows = []
+        for click_id, ts, inserted_at, *values in connection.execute(
+            select(clicks.c.id, clicks.c.ts, clicks.c.inserted_at, *(clicks.c[column] for column in columns))
+            .where(clicks.c.id > last_id)
+            .order_by(clicks.c.id)
+            .limit(batch_size)
+        ):
+            inserted_at = as_utc(inserted_at) if inserted_at is not None else cutoff
+            if inserted_at > cutoff:
+                break
+            rows.append((click_id, as_utc(ts) if ts is not None else inserted_at, *values))
+        if not rows:
+            return last_id, None
+        new_last_id = rows[-1][0]
+        claimed = connection.execute(
+            update(state)
+            .where(state.c.name == name, state.c.last_id == last_id)
+            .values(last_id=new_last_id)
+        ).rowcount
+        if not claimed:
+            return last_id, None
+        return last_id, on_batch(connection, last_id, new_last_id, rows)
+
+
+def rollup_clicks_batch(batch_size: int = CLICK_ROLLUP_BATCH, lag_seconds: float = CLICK_ROLLUP_LAG_SECONDS) -> int:
+    """Раскладывает по агрегатам следующую пачку кликов; возвращает их число"""
+    def add(connection, last_id, new_last_id, rows):
+        hourly, daily = Counter(), Counter()
+        for _, ts, course_id, utm_source, utm_campaign in rows:
+            hour = ts.replace(minute=0, second=0, microsecond=0)
+            hourly[hour, course_id, utm_source or "", utm_campaign or ""] += 1
+            daily[hour.replace(hour=0), course_id, utm_source or "", utm_campaign or ""] += 1
+        for table, counts in ((ClickStatsHourly.__table__, hourly), (ClickStatsDaily.__table__, daily)):
+            upsert_add(connection, table, [dict(zip(ROLLUP_KEY, key), clicks=n) for key, n in counts.items()])
+        return len(rows)
+
+    _, added = claim_click_batch(
+        "clicks", ("course_id", "utm_source", "utm_campaign"), add, batch_size, lag_seconds
+    )
+    return added or 0
+
+
+def rollup_clicks(**kwargs) -> int:
+    """Догоняет агрегаты до свежих кликов пачками"""
+    total = 0
+    while True:
+        try:
+            n = rollup_clicks_batch(**kwargs)
+        except exc.IntegrityError:
+            # Параллельный воркер одновременно создал строку отметки - повторим позже
+            return total
+        total += n
+        if not n:
+            return total
+
+
+class PeriodicJob:
+    """Фоновый поток, вызывающий target раз в interval секунд (или по wake())"""
+
+    def __init__(self, name: str, interval: float, target, run_at_start: bool = False):
+        self.name = name
+        self.interval = interval
+        self.target = target
+        self.run_at_start = run_at_start
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        if not self.run_at_start:
+            self._wakeup.wait(self.interval)
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            try:
+                self.target()
+            except (exc.DBAPIError, exc.TimeoutError):
+                logger.exception("Фоновая задача %s: ошибка БД", self.name)
+            except Exception:
+                # Задача повторится через interval - поток остается жив
+                logger.exception("Фоновая задача %s: непредвиденная ошибка", self.name)
+            self._wakeup.wait(self.interval)
+
+    def wake(self):
+        """Запустить target, не дожидаясь интервала"""
+        self._wakeup.set()
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._stop.clear()
+            self._wakeup.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+
+
+click_rollup = PeriodicJob("click-rollup", CLICK_ROLLUP_SECONDS, rollup_clicks)
+
+
+# ================== ПОХОЖИЕ КУРСЫ ==================
+# Соседи курса считаются фоновой задачей и лежат в related_courses одной
+# строкой на курс - карточка читает их одним запросом по первичному ключу.
+# Сходство: Жаккар по тегам, общие категория и уровень, совместные клики.
+# Совместные клики копятся инкрементально (отметка "related" в rollup_state):
+# сессия - клики с одним referer в одном окне RELATED_SESSION_MINUTES; пара
+# курсов засчитывается сессии один раз, когда в ней впервые появляется второй.
+# Пересчитываются только курсы без строки, правленные после built_at и
+# получившие новые совместные клики.
+
+RELATED_SECONDS = float(os.getenv("RELATED_SECONDS", "300"))  # 0 - без фоновой задачи
+RELATED_SIZE = int(os.getenv("RELATED_SIZE", "6"))
+RELATED_BATCH = int(os.getenv("RELATED_BATCH", "500"))  # курсов на транзакцию
+RELATED_SESSION_MINUTES = float(os.getenv("RELATED_SESSION_MINUTES", "30"))
+RELATED_SESSION_MAX = 50  # больше курсов в "сессии" - это общий referer, а не посетитель
+RELATED_TAG_CANDIDATES = 100  # кандидаты по тегу: самые кликаемые курсы с этим тегом
+RELATED_CATEGORY_CANDIDATES = 30
+RELATED_WEIGHTS = {"tags": 0.6, "coclicks": 0.2, "category": 0.15, "level": 0.05}
+
+
+def coclick_batch(batch_size: int = CLICK_ROLLUP_BATCH, lag_seconds: float = CLICK_ROLLUP_LAG_SECONDS):
+    """Учитывает следующую пачку кликов в course_coclicks; (число кликов, id затронутых курсов)"""
+    clicks = Click.__table__
+    window = RELATED_SESSION_MINUTES * 60
+
+    def add(connection, last_id, new_last_id, rows):
+        first_ts = min(ts for _, ts in rows)
+        last_ts = max(ts for _, ts in rows)
+        # Сессии целиком: новые клики + более ранние клики тех же окон
+        start = datetime.fromtimestamp(first_ts.timestamp() // window * window, timezone.utc)
+        end = datetime.fromtimestamp((last_ts.timestamp() // window + 1) * window, timezone.utc)
+        sessions = {}
+        for click_id, course_id, referer, ts in connection.execute(
+            select(clicks.c.id, clicks.c.course_id, clicks.c.referer, clicks.c.ts)
+            .where(clicks.c.ts >= start, clicks.c.ts < end, clicks.c.id <= new_last_id, clicks.c.referer.isnot(None))
+            .order_by(clicks.c.id)
+        ):
+            sessions.setdefault((referer, as_utc(ts).timestamp() // window), []).append((click_id, course_id))
+
+        pairs = Counter()
+        for session in sessions.values():
+            seen = []
+            for click_id, course_id in session:
+                if course_id in seen:
+                    continue
+                if click_id > last_id and len(seen) < RELATED_SESSION_MAX:
+                    for other_id in seen:
+                        pairs[course_id, other_id] += 1
+                        pairs[other_id, course_id] += 1
+                seen.append(course_id)
+        upsert_add(
+            connection, CourseCoclick.__table__,
+            [{"course_id": a, "other_id": b, "sessions": n} for (a, b), n in pairs.items()],
+            key=("course_id", "other_id"), column="sessions"
+        )
+        return new_last_id - last_id, {course_id for course_id, _ in pairs}
+
+    _, result = claim_click_batch("related", (), add, batch_size, lag_seconds)
+    return result or (0, set())
+
+
+def stale_related_ids(connection) -> list:
+    """Опубликованные курсы без соседей или правленные после их расчета"""
+    courses, related = Course.__table__, RelatedCourses.__table__
+    return list(connection.execute(
+        select(courses.c.id)
+        .select_from(courses.outerjoin(related, related.c.course_id == courses.c.id))
+        .where(
+            courses.c.is_published == True,
+            (related.c.course_id.is_(None)) | (courses.c.updated_at >= related.c.built_at)
+        )
+        .order_by(courses.c.id)
+    ).scalars())
+
+
+class RelatedBuilder:
+    """Расчет соседей по снимку каталога; кандидаты - из инвертированных индексов"""
+
+    def __init__(self, catalog: "CatalogSnapshot"):
+        self.catalog = catalog
+        clicks = catalog.clicks
+        self.tags = [set() for _ in catalog.rows]
+        self.tag_top = {}
+        for slug, courses in catalog.tag_index.items():
+            for i in courses:
+                self.tags[i].add(slug)
+            self.tag_top[slug] = heapq.nlargest(RELATED_TAG_CANDIDATES, courses, key=clicks.__getitem__)
+        by_category = {}
+        for i, code in enumerate(catalog.category):
+            by_category.setdefault(code, []).append(i)
+        self.category_top = {
+            code: heapq.nlargest(RELATED_CATEGORY_CANDIDATES, courses, key=clicks.__getitem__)
+            for code, courses in by_category.items()
+        }
+
+    def neighbours(self, i: int, coclicks: dict) -> list:
+        """[[id, score], ...] для курса с индексом i; coclicks - {id: сессий}"""
+        catalog = self.catalog
+        tags, category, level = self.tags[i], catalog.category[i], catalog.level[i]
+        candidates = set(self.category_top.get(category, ()))
+        for slug in tags:
+            candidates.update(self.tag_top[slug])
+        candidates.update(j for j in map(catalog.index.get, coclicks) if j is not None)
+        candidates.discard(i)
+        top_coclicks = max(coclicks.values(), default=0)
+        scored = []
+        for j in candidates:
+            other_tags = self.tags[j]
+            common = len(tags & other_tags)
+            union = len(tags) + len(other_tags) - common
+            score = (
+                RELATED_WEIGHTS["tags"] * (common / union if union else 0.0)
+                + RELATED_WEIGHTS["coclicks"] * (coclicks.get(catalog.rows[j].id, 0) / top_coclicks if top_coclicks else 0.0)
+                + RELATED_WEIGHTS["category"] * (catalog.category[j] == category)
+                + RELATED_WEIGHTS["level"] * (catalog.level[j] == level)
+            )
+            scored.append((score, catalog.clicks[j], j))
+        return [
+            [catalog.rows[j].id, round(score, 4)]
+            for score, _, j in heapq.nlargest(RELATED_SIZE, scored)
+        ]
+
+    def write(self, connection, course_ids: list) -> dict:
+        """Пересчитывает и сохраняет соседей курсов; {id: [id соседей]}"""
+        coclick = CourseCoclick.__table__
+        related = RelatedCourses.__table__
+        coclicks = {course_id: {} for course_id in course_ids}
+        for course_id, other_id, sessions in connection.execute(
+            select(coclick.c.course_id, coclick.c.other_id, coclick.c.sessions)
+            .where(coclick.c.course_id.in_(course_ids))
+        ):
+            coclicks[course_id][other_id] = sessions
+        built = {}
+        for course_id in course_ids:
+            i = self.catalog.index.get(course_id)
+            if i is not None:
+                built[course_id] = self.neighbours(i, coclicks[course_id])
+        rows = [{"course_id": course_id, "related": json.dumps(neighbours)} for course_id, neighbours in built.items()]
+        insert = dialect_insert(connection)
+        if insert is None:
+            connection.execute(related.delete().where(related.c.course_id.in_(course_ids)))
+            stmt = related.insert().values(built_at=func.now())
+        else:
+            # Upsert: параллельный воркер мог пересчитать те же курсы
+            missing = [course_id for course_id in course_ids if course_id not in built]
+            if missing:
+                connection.execute(related.delete().where(related.c.course_id.in_(missing)))
+            stmt = insert(related).values(built_at=func.now())
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["course_id"],
+                set_={"related": stmt.excluded.related, "built_at": stmt.excluded.built_at}
+            )
+        if rows:
+            connection.execute(stmt, rows)
+        return {course_id: [neighbour for neighbour, _ in neighbours] for course_id, neighbours in built.items()}
+
+
+def refresh_related(batch_size: int = RELATED_BATCH) -> int:
+    """Догоняет совместные клики и пересчитывает устаревших соседей; число курсов"""
+    touched = set()
+    while True:
+        try:
+            n, courses = coclick_batch()
+        except exc.IntegrityError:
+            break
+        touched |= courses
+        if not n:
+            break
+    catalog = get_catalog()
+    with fresh_engine.connect() as connection:
+        stale = stale_related_ids(connection)
+    builder = RelatedBuilder(catalog)
+    # Новые соседи правленых курсов тоже пересчитываются: сходство симметрично
+    pending = [course_id for course_id in sorted(touched | set(stale)) if course_id in catalog.index]
+    symmetric = set(stale) if len(stale) < len(catalog.rows) else set()
+    done = set()
+    while pending:
+        batch, pending = pending[:batch_size], pending[batch_size:]
+        with engine.begin() as connection:
+            built = builder.write(connection, batch)
+        done.update(batch)
+        extra = {
+            neighbour for course_id in symmetric.intersection(built)
+            for neighbour in built[course_id] if neighbour not in done
+        }
+        pending.extend(sorted(extra - set(pending)))
+    return len(done)
+
+
+related_job = PeriodicJob("related-courses", RELATED_SECONDS, refresh_related, run_at_start=True)
+
+
+def related_courses(db: Session, catalog: "CatalogSnapshot", course) -> list:
+    """Похожие опубликованные курсы из related_courses (один запрос по ключу)"""
+    related = db.execute(
+        select(RelatedCourses.related).where(RelatedCourses.course_id == course.id)
+    ).scalar()
+    if not related:
+        return []
+    return [catalog.rows[i] for i in (catalog.index.get(course_id) for course_id, _ in json.loads(related)) if i is not None]
+
+
+# ================== ТРЕНДЫ ==================
+# Трендовый рейтинг - сумма кликов, каждый из которых вдвое теряет вес за
+# TRENDING_HALF_LIFE_HOURS. Вместо ежедневного пересчета всех курсов веса
+# считаются от фиксированной эпохи: курс хранит log2(sum 2^((ts - эпоха) / T)),
+# порядок по нему совпадает с порядком по затухшей сумме в любой момент, а
+# новый клик просто прибавляется (log-sum-exp). Колонку courses.trending
+# двигает фоновая задача по новым кликам - O(новых кликов), отметка
+# "trending" в rollup_state, как у агрегатов.
+
+TRENDING_SECONDS = float(os.getenv("TRENDING_SECONDS", "60"))  # 0 - без фоновой задачи
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "72"))
+TRENDING_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def log2_add(a: Optional[float], b: float) -> float:
+    """log2(2^a + 2^b) без переполнения; a=None - пустая сумма"""
+    if a is None:
+        return b
+    high, low = (a, b) if a >= b else (b, a)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def trending_weight(ts: datetime) -> float:
+    """log2 веса клика: возраст от эпохи в периодах полураспада"""
+    return (as_utc(ts) - TRENDING_EPOCH).total_seconds() / (TRENDING_HALF_LIFE_HOURS * 3600)
+
+
+def trending_now(score: Optional[float], now: Optional[datetime] = None) -> float:
+    """Затухшая на момент now сумма кликов (для показа и отладки)"""
+    if score is None:
+        return 0.0
+    return 2 ** (score - trending_weight(now or datetime.now(timezone.utc)))
+
+
+def trending_batch(batch_size: int = CLICK_ROLLUP_BATCH, lag_seconds: float = CLICK_ROLLUP_LAG_SECONDS):
+    """Добавляет в courses.trending следующую пачку кликов.
+
+    Возвращает (отметка до, отметка после, {id курса: новый trending});
+    пустой словарь - новых кликов нет или пачку забрал другой воркер."""
+    courses = Course.__table__
+
+    # on_batch идет после сдвига отметки, до чтения рейтингов: параллельный воркер
+    # с той же пачкой ждет на строке отметки и после нашего коммита получит rowcount 0
+    def add(connection, last_id, new_last_id, rows):
+        added = {}
+        for _, ts, course_id in rows:
+            added[course_id] = log2_add(added.get(course_id), trending_weight(ts))
+        current = dict(connection.execute(
+            select(courses.c.id, courses.c.trending).where(courses.c.id.in_(list(added)))
+        ).all())
+        scores = {
+            course_id: log2_add(current[course_id], value)
+            for course_id, value in added.items() if course_id in current
+        }
+        if scores:
+            connection.execute(
+                courses.update()
+                .where(courses.c.id == bindparam("course_id"))
+                .values(trending=bindparam("score")),
+                [{"course_id": course_id, "score": score} for course_id, score in scores.items()]
+            )
+        return last_id, new_last_id, scores
+
+    last_id, result = claim_click_batch("trending", ("course_id",), add, batch_size, lag_seconds)
+    return result or (last_id, last_id, {})
+
+
+_trending_seen = None  # отметка "trending", до которой снимок этого воркера актуален
+
+
+def refresh_trending() -> int:
+    """Догоняет рейтинги по новым кликам и переносит их в снимок каталога"""
+    global _trending_seen
+    state = RollupState.__table__
+    catalog = get_catalog()
+    total = 0
+    while True:
+        try:
+            before, after, scores = trending_batch()
+        except exc.IntegrityError:
+            break
+        if after == before:
+            break
+        catalog.update_trending(scores)
+        total += len(scores)
+        if before == _trending_seen:
+            # Пачка сразу за уже виденным - снимок по-прежнему актуален
+            _trending_seen = after
+    # Пачки, обработанные другими воркерами, - перечитываем колонку, только
+    # если отметка ушла дальше виденной
+    with fresh_engine.connect() as connection:
+        last_id = connection.execute(select(state.c.last_id).where(state.c.name == "trending")).scalar()
+        if last_id != _trending_seen:
+            catalog.update_trending(dict(connection.execute(
+                select(Course.id, Course.trending).where(Course.is_published == True, Course.trending.isnot(None))
+            ).all()))
+            _trending_seen = last_id
+    return total
+
+
+trending_job = PeriodicJob("trending", TRENDING_SECONDS, refresh_trending, run_at_start=True)
+
+
+# ================== МАССОВЫЙ ИМПОРТ КУРСОВ ==================
+# CSV/JSONL читается построчно и пишется пачками: один INSERT ... ON CONFLICT
+# (slug) DO UPDATE на пачку, поэтому память не зависит от размера файла.
+# Core-запросы обходят события маппера - FTS5 и course_tags обновляются тут же.
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+IMPORT_MAX_ERRORS = 1000  # сколько ошибок строк возвращать в отчете (считаются все)
+IMPORT_PRICE_MAX = 2_147_483_647  # courses.price_from - INTEGER (int4 в PostgreSQL)
+IMPORT_FIELDS = (
+    "slug", "title", "provider", "category_slug", "level", "format", "price_from",
+    "duration", "tags", "short_desc", "affiliate_url", "is_published",
+)
+LEVELS = ("beginner", "middle", "pro")
+FORMATS = ("online", "offline", "mixed")
+TRUE_VALUES = ("1", "true", "yes", "y", "да", "on")
+FALSE_VALUES = ("0", "false", "no", "n", "нет", "off")
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+def _import_str(value) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def validate_import_row(raw: dict) -> dict:
+    """Строка файла -> значения колонок courses; ImportRowError при ошибке"""
+    if not isinstance(raw, dict):
+        raise ImportRowError("ожидается объект")
+    row = {field: _import_str(raw.get(field)) for field in IMPORT_FIELDS}
+    if not row["slug"]:
+        raise ImportRowError("не указан slug")
+    if not row["title"]:
+        raise ImportRowError("не указан title")
+    if row["level"] and row["level"] not in LEVELS:
+        raise ImportRowError(f"level должен быть одним из: {', '.join(LEVELS)}")
+    if row["format"] and row["format"] not in FORMATS:
+        raise ImportRowError(f"format должен быть одним из: {', '.join(FORMATS)}")
+    if isinstance(raw.get("tags"), list):
+        row["tags"] = ",".join(str(tag) for tag in raw["tags"])
+    if row["price_from"] is not None:
+        try:
+            price = float(row["price_from"])
+        except (ValueError, OverflowError):
+            raise ImportRowError(f"price_from не число: {row['price_from']!r}")
+        if not price.is_integer():
+            # inf/nan и дробные цены не обрезаем молча
+            raise ImportRowError(f"price_from должна быть целым числом: {row['price_from']!r}")
+        if price < 0:
+            raise ImportRowError("price_from не может быть отрицательной")
+        if price > IMPORT_PRICE_MAX:
+            raise ImportRowError(f"price_from больше {IMPORT_PRICE_MAX}")
+        row["price_from"] = int(price)
+    published = raw.get("is_published")
+    if published is None or str(published).strip() == "":
+        row["is_published"] = True
+    elif isinstance(published, bool):
+        row["is_published"] = published
+    elif str(published).strip().casefold() in TRUE_VALUES:
+        row["is_published"] = True
+    elif str(published).strip().casefold() in FALSE_VALUES:
+        row["is_published"] = False
+    else:
+        raise ImportRowError(f"is_published не булево: {published!r}")
+    return row
+
+
+def read_import_rows(stream, format: str):
+    """(номер строки, dict | ImportRowError) из текстового потока CSV/JSONL"""
+    if format == "csv":
+        reader = csv.DictReader(stream)
+        for raw in reader:
+            yield reader.line_num, raw
+    elif format == "jsonl":
+        for line_no, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except ValueError as e:
+                yield line_no, ImportRowError(f"некорректный JSON: {e}")
+    else:
+        raise ValueError(f"Неизвестный формат импорта: {format}")
+
+
+def write_courses(connection, rows: list) -> int:
+    """Upsert пачки курсов по slug; возвращает число новых. Ключи строк одинаковые"""
+    table = Course.__table__
+    slugs = [row["slug"] for row in rows]
+    existing = set(connection.execute(select(table.c.slug).where(table.c.slug.in_(slugs))).scalars())
+    columns = [name for name in rows[0] if name != "slug"]
+    insert = dialect_insert(connection)
+    if insert is not None:
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["slug"],
+            set_={**{name: stmt.excluded[name] for name in columns}, "updated_at": func.now()}
+        )
+        connection.execute(stmt, rows)
+    else:
+        for row in rows:
+            if row["slug"] in existing:
+                connection.execute(
+                    table.update().where(table.c.slug == row["slug"])
+                    .values({name: row[name] for name in columns}, updated_at=func.now())
+                )
+            else:
+                connection.execute(table.insert(), row)
+    # Поиск и теги: события маппера здесь не срабатывают
+    courses = connection.execute(
+        select(table.c.id, table.c.title, table.c.tags, table.c.short_desc).where(table.c.slug.in_(slugs))
+    ).all()
+    if fts_enabled(connection):
+        fts_reindex(connection, courses)
+    sync_tags(connection, {course.id: course.tags for course in courses})
+    bump_catalog_version(connection)
+    return len(set(slugs) - existing)
+
+
+def import_courses(stream, format: str, batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    """Потоковый импорт CSV/JSONL: пачки по batch_size в отдельных транзакциях"""
+    report = {"rows": 0, "inserted": 0, "updated": 0, "errors": 0, "error_rows": []}
+
+    def error(line_no, slug, message):
+        report["errors"] += 1
+        if len(report["error_rows"]) < IMPORT_MAX_ERRORS:
+            report["error_rows"].append({"line": line_no, "slug": slug, "error": message})
+
+    def flush(batch):
+        # Повтор slug внутри пачки: побеждает последняя строка
+        rows = list({row["slug"]: row for _, row in batch}.values())
+        try:
+            with engine.begin() as connection:
+                inserted = write_courses(connection, rows)
+        except exc.DBAPIError:
+            if len(batch) == 1:
+                line_no, row = batch[0]
+                error(line_no, row["slug"], "ошибка записи в БД")
+                return
+            # Ищем виноватые строки, записывая пачку по одной
+            for item in batch:
+                flush([item])
+            return
+        report["inserted"] += inserted
+        report["updated"] += len(rows) - inserted
+
+    batch = []
+    for line_no, raw in read_import_rows(stream, format):
+        report["rows"] += 1
+        if isinstance(raw, ImportRowError):
+            error(line_no, None, str(raw))
+            continue
+        try:
+            batch.append((line_no, validate_import_row(raw)))
+        except ImportRowError as e:
+            error(line_no, raw.get("slug") if isinstance(raw, dict) else None, str(e))
+            continue
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    return report
+
+
+def import_format(filename: Optional[str], format: Optional[str] = None) -> str:
+    """Формат импорта: явно заданный или по расширению файла"""
+    if format:
+        return format
+    if filename and filename.lower().endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return "csv"
+
+# ================== ЭКСПОРТ ==================
+# Выгрузка читает таблицу keyset-пачками по id (WHERE id > последний ORDER BY id
+# LIMIT n), каждая пачка - в своем коротком соединении: в памяти не больше
+# одной пачки, и транзакция не висит открытой, пока клиент медленно читает поток.
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+CLICK_FIELDS = ("id", "course_id", "ts", "referer", "utm_source", "utm_campaign")
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+def export_chunks(table, fields, where=(), after_id: int = 0, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """Пачки строк таблицы по возрастанию id"""
+    columns = [table.c[name] for name in fields]
+    while True:
+        with fresh_engine.connect() as connection:
+            rows = connection.execute(
+                select(*columns).where(table.c.id > after_id, *where).order_by(table.c.id).limit(chunk_size)
+            ).all()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < chunk_size:
+            return
+        after_id = rows[-1].id
+
+
+def _export_value(value, format: str):
+    if isinstance(value, datetime):
+        return as_utc(value).isoformat()
+    if format == "csv":
+        if isinstance(value, bool):
+            return int(value)  # 1/0 - как понимает импорт
+        if value is None:
+            return ""
+    return value
+
+
+def encode_export(chunks, fields, format: str):
+    """Пачки строк -> куски NDJSON/CSV для StreamingResponse"""
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        yield buffer.getvalue()
+        for rows in chunks:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows([_export_value(value, format) for value in row] for row in rows)
+            yield buffer.getvalue()
+    else:
+        for rows in chunks:
+            yield "".join(
+                json.dumps(dict(zip(fields, (_export_value(value, format) for value in row))), ensure_ascii=False) + "\n"
+                for row in rows
+            )
 
-if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-# ДЛЯ SQLite: добавляем параметры для работы в многопоточном режиме
-if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(
-        DATABASE_URL, 
-        connect_args={"check_same_thread": False},  # Важно для SQLite + FastAPI
-        poolclass=StaticPool  # Для SQLite в многопоточном режиме
+def export_response(chunks, fields, format: str, name: str) -> StreamingResponse:
+    extension = "csv" if format == "csv" else "ndjson"
+    return StreamingResponse(
+        encode_export(chunks, fields, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{extension}"'}
     )
-else:
-    # Для PostgreSQL оставляем как было
-    engine = create_engine(DATABASE_URL)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
+# ================== JSON КУРСОВ ==================
+# Курс в API кодируется один раз: байты JSON кэшируются по (вид, id,
+# updated_at), а список собирается склейкой готовых фрагментов. Клики меняются
+# постоянно, поэтому в фрагмент не входят и дописываются при каждой отдаче.
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+COURSE_JSON_CACHE_SIZE = int(os.getenv("COURSE_JSON_CACHE_SIZE", "20000"))
 
-# ================== МОДЕЛИ ==================
-class Course(Base):
-    __tablename__ = "courses"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    slug = Column(String, unique=True, index=True)
-    title = Column(String, nullable=False)
-    provider = Column(String)
-    category_slug = Column(String)
-    level = Column(String)  # beginner|middle|pro
-    format = Column(String)  # online|offline|mixed
-    price_from = Column(Integer)
-    duration = Column(String)
-    tags = Column(Text)
-    short_desc = Column(Text)
-    affiliate_url = Column(String)
-    is_published = Column(Boolean, default=True)
-    clicks = Column(Integer, default=0)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+COURSE_JSON_FIELDS = {
+    "list": (
+        "id", "slug", "title", "provider", "price_from", "duration", "level", "format", "category_slug",
+        "short_desc", "tags",
+    ),
+    "detail": (
+        "id", "slug", "title", "provider", "category_slug", "level", "format", "price_from", "duration", "tags",
+        "short_desc", "affiliate_url", "is_published", "created_at", "updated_at",
+    ),
+    # В админке tags - исходная строка
+    "admin": (
+        "id", "slug", "title", "provider", "category_slug", "level", "format", "price_from", "duration", "tags",
+        "short_desc", "affiliate_url", "is_published", "created_at", "updated_at",
+    ),
+}
 
-class Click(Base):
-    __tablename__ = "clicks"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    course_id = Column(Integer, index=True)
-    ts = Column(DateTime(timezone=True), server_default=func.now())
-    referer = Column(String, nullable=True)
-    utm_source = Column(String, nullable=True)
-    utm_campaign = Column(String, nullable=True)
+course_json_cache = LRUCache(COURSE_JSON_CACHE_SIZE)
 
-# ================== ИНИЦИАЛИЗАЦИЯ FASTAPI ==================
-app = FastAPI(title="Каталог курсов по нейросетям")
 
-# Создаем таблицы
-Base.metadata.create_all(bind=engine)
+def course_json(view: str, course, tags_of=None) -> bytes:
+    """JSON-объект курса; tags_of(course) - список тегов (не нужен для admin)"""
+    key = (view, course.id, course.updated_at)
+    fragment = course_json_cache.get(key)
+    if fragment is None:
+        payload = {}
+        for name in COURSE_JSON_FIELDS[view]:
+            value = getattr(course, name)
+            if name == "tags" and view != "admin":
+                value = tags_of(course)
+            elif isinstance(value, datetime):
+                value = value.isoformat()
+            payload[name] = value
+        fragment = json_dumps(payload)[:-1]  # без закрывающей скобки - дальше clicks
+        course_json_cache.set(key, fragment)
+    return b'%s,"clicks":%d}' % (fragment, course.clicks or 0)
 
-# Настройка статики и шаблонов
-app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
 
-ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+def json_list_response(meta: dict, items) -> Response:
+    """{**meta, "courses": [...]} из готовых JSON-фрагментов"""
+    body = b"".join((json_dumps(meta)[:-1], b',"courses":[', b",".join(items), b"]}"))
+    return Response(body, media_type="application/json")
 
-# ================== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ==================
-def add_test_data():
-    """Добавление тестовых данных (минимум 20 курсов)"""
-    db = SessionLocal()
-    
-    # Проверяем, есть ли уже данные
-    count = db.query(Course).count()
-    if count > 0:
-        db.close()
+
+def changed_courses(previous: "CatalogSnapshot", current: "CatalogSnapshot") -> list:
+    """Строки курсов (до и после), изменившихся между снимками; клики не в счет"""
+    before = {row.id: row._replace(clicks=0) for row in previous.rows}
+    after = {row.id: row._replace(clicks=0) for row in current.rows}
+    changed = []
+    for course_id in before.keys() | after.keys():
+        old, new = before.get(course_id), after.get(course_id)
+        if old != new:
+            changed.extend(row for row in (old, new) if row is not None)
+    return changed
+
+
+def course_json_changed(previous: Optional["CatalogSnapshot"], current: "CatalogSnapshot"):
+    """Сбрасывает фрагменты изменившихся курсов и админки.
+
+    updated_at в SQLite с точностью до секунды, поэтому одного ключа мало:
+    две правки за секунду дали бы тот же ключ."""
+    if previous is None:
+        course_json_cache.clear()
         return
-    
-    test_courses = [
-        # design (4 курса)
-        ("midjourney-basics", "Основы Midjourney: генерация изображений", "Нетология", "design", "beginner", "online", 15000, "4 недели", "midjourney,ai,art,design", "Научитесь создавать креативные изображения с помощью нейросетей", "https://example.com/aff/midjourney", True, 42),
-        ("stable-diffusion", "Stable Diffusion с нуля", "Яндекс Практикум", "design", "beginner", "online", 18000, "5 недель", "stable-diffusion,ai,art", "Создавайте уникальные изображения и арты", "https://example.com/aff/stable", True, 28),
-        ("figma-ai", "Дизайн интерфейсов с AI в Figma", "Contented", "design", "middle", "online", 28000, "6 недель", "figma,ui/ux,ai,design", "Автоматизируйте дизайн-процесс с помощью AI", "https://example.com/aff/figma-ai", True, 15),
-        ("ai-photo", "AI-обработка фотографий", "Photoshop", "design", "pro", "offline", 35000, "8 недель", "photoshop,ai,photo,editing", "Профессиональная ретушь с нейросетями", "https://example.com/aff/ai-photo", True, 8),
-        
-        # video (3 курса)
-        ("video-ai", "AI для видеомонтажа", "Coursera", "video", "beginner", "online", 12000, "3 недели", "video,ai,editing", "Автоматизируйте монтаж видео", "https://example.com/aff/video", True, 24),
-        ("ai-video-pro", "AI-инструменты для продвинутого монтажа", "Skillbox", "video", "pro", "mixed", 45000, "8 недель", "premiere pro,ai,video,editing", "Продвинутые техники монтажа с AI", "https://example.com/aff/video-pro", True, 12),
-        ("youtube-ai", "Создание контента для YouTube с AI", "Нетология", "video", "middle", "online", 22000, "4 недели", "youtube,ai,video,content", "Генерация идей и автоматизация производства", "https://example.com/aff/youtube", True, 19),
-        
-        # marketing (3 курса)
-        ("ai-marketing", "AI в маркетинге", "GeekBrains", "marketing", "middle", "mixed", 22000, "4 недели", "маркетинг,ai,analytics", "Используйте нейросети для маркетинга", "https://example.com/aff/marketing", True, 31),
-        ("smm-ai", "AI для SMM-специалистов", "Skillfactory", "marketing", "beginner", "online", 15000, "5 недель", "smm,ai,social media", "Автоматизация постинга и анализ аудитории", "https://example.com/aff/smm", True, 22),
-        ("seo-ai", "SEO и контент с искусственным интеллектом", "Яндекс Практикум", "marketing", "pro", "online", 32000, "6 недель", "seo,ai,content,marketing", "Оптимизация сайтов с помощью AI", "https://example.com/aff/seo", True, 14),
-        
-        # automation (3 курса)
-        ("automation-ai", "Автоматизация с помощью AI", "Otus", "automation", "middle", "online", 20000, "5 недель", "automation,ai,scripts", "Создание автоматических скриптов", "https://example.com/aff/automation", True, 17),
-        ("ai-zapier", "Автоматизация бизнеса: AI + Zapier", "Нетология", "automation", "beginner", "online", 18000, "4 недели", "zapier,automation,no-code", "Настройка автоматических workflow", "https://example.com/aff/zapier", True, 26),
-        ("rpa-ai", "RPA и AI для автоматизации процессов", "Stepik", "automation", "pro", "mixed", 38000, "7 недель", "rpa,ai,automation,business", "Роботизация бизнес-процессов", "https://example.com/aff/rpa", True, 9),
-        
-        # coding (4 курса)
-        ("chatgpt-pro", "ChatGPT для профессионалов", "Skillbox", "coding", "middle", "online", 25000, "6 недель", "chatgpt,ai,programming", "Используйте ChatGPT для автоматизации задач", "https://example.com/aff/chatgpt", True, 37),
-        ("neural-networks", "Нейронные сети на Python", "Stepik", "coding", "pro", "online", 35000, "8 недель", "python,нейросети,ml,ai", "Погружение в глубокое обучение", "https://example.com/aff/neural", True, 45),
-        ("python-ml-basics", "Машинное обучение на Python с нуля", "Coursera", "coding", "beginner", "online", 5000, "6 недель", "python,ml,data science", "Введение в машинное обучение", "https://example.com/aff/python-ml", True, 33),
-        ("ai-api", "Разработка AI-приложений и API", "Яндекс Практикум", "coding", "pro", "mixed", 42000, "9 недель", "python,api,ai,development", "Создание микросервисов с AI", "https://example.com/aff/ai-api", True, 11),
-        
-        # business (3 курса)
-        ("ai-business", "AI для бизнеса: стратегия", "Practicum", "business", "pro", "mixed", 40000, "6 недель", "business,ai,strategy", "Внедрение AI в бизнес-процессы", "https://example.com/aff/business", True, 18),
-        ("ai-startup", "Запуск AI-стартапа", "Нетология", "business", "middle", "online", 28000, "5 недель", "startup,ai,business,entrepreneurship", "От идеи к MVP с использованием AI", "https://example.com/aff/startup", True, 23),
-        ("ai-analytics", "Аналитика данных для бизнеса с AI", "GeekBrains", "business", "beginner", "online", 19000, "4 недели", "analytics,ai,business,data", "Принятие решений на основе данных", "https://example.com/aff/analytics", True, 16)
-    ]
-    
-    for course_data in test_courses:
-        course = Course(
-            slug=course_data[0],
-            title=course_data[1],
-            provider=course_data[2],
-            category_slug=course_data[3],
-            level=course_data[4],
-            format=course_data[5],
-            price_from=course_data[6],
-            duration=course_data[7],
-            tags=course_data[8],
-            short_desc=course_data[9],
-            affiliate_url=course_data[10],
-            is_published=course_data[11],
-            clicks=course_data[12]
+    ids = {row.id for row in changed_courses(previous, current)}
+    course_json_cache.discard(lambda key: key[0] == "admin" or key[1] in ids)
+
+
+# ================== КАРТОЧКИ КУРСОВ ==================
+# Карточки курсов в листингах (templates/cards/*.html) рендерятся один раз и
+# кэшируются по (карточка, id, updated_at); страница листинга склеивает
+# готовый HTML. Клики в ключе - только у карточек, которые их показывают.
+
+CARD_CACHE_SIZE = int(os.getenv("CARD_CACHE_SIZE", "20000"))
+# Поля помимо updated_at, которые выводит карточка и которые меняются без правки курса
+CARD_EXTRA_KEYS = {"courses": ("clicks",)}
+
+card_cache = LRUCache(CARD_CACHE_SIZE)
+
+
+def course_card(name: str, course) -> Markup:
+    """HTML карточки курса из templates/cards/<name>.html"""
+    key = (name, course.id, course.updated_at, *(getattr(course, field) for field in CARD_EXTRA_KEYS.get(name, ())))
+    html = card_cache.get(key)
+    if html is None:
+        html = Markup(templates.env.get_template(f"cards/{name}.html").render(course=course))
+        card_cache.set(key, html)
+    return html
+
+
+templates.env.globals["course_card"] = course_card
+
+
+def course_cards_changed(previous: Optional["CatalogSnapshot"], current: "CatalogSnapshot"):
+    """Сбрасывает карточки изменившихся курсов (updated_at в SQLite - до секунды)"""
+    if previous is None:
+        card_cache.clear()
+        return
+    ids = {row.id for row in changed_courses(previous, current)}
+    card_cache.discard(lambda key: key[1] in ids)
+
+
+# ================== КЭШ СТРАНИЦ ==================
+# Отрендеренные HTML-страницы кэшируются по пути + нормализованным параметрам
+# (LRU с TTL) и отдаются с сильным ETag; If-None-Match -> 304 без тела.
+# Листинги сбрасываются при любом изменении каталога, карточки - только
+# у изменившихся курсов. Клики меняют страницы незаметно - их догоняет TTL.
+
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "256"))
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "30"))
+
+LISTING_PARAMS = (
+    "query", "category", "level", "format", "price_min", "price_max", "tag", "tag_mode", "sort", "page", "cursor",
+)
+PARAM_DEFAULTS = {"sort": "popular", "page": "1", "tag_mode": "all"}
+
+# compressed: {кодировка: сжатое тело} - заполняется по мере запросов
+CachedPage = namedtuple("CachedPage", ["body", "etag", "media_type", "compressed"])
+
+
+class PageCache:
+    """Кэш отрендеренных страниц с ETag/304"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.pages = LRUCache(maxsize, ttl)
+
+    @staticmethod
+    def key(request: Request, params=()) -> tuple:
+        """(путь, параметры) без пустых значений, "all" и значений по умолчанию"""
+        items = sorted(
+            (name, value) for name, value in request.query_params.multi_items()
+            if name in params and value not in ("", "all") and PARAM_DEFAULTS.get(name) != value
         )
-        db.add(course)
-    
-    db.commit()
-    db.close()
+        return request.url.path, tuple(items)
+
+    @staticmethod
+    def respond(request: Request, page: CachedPage) -> Response:
+        """Ответ из кэша: сжатый вариант сжимается один раз на запись кэша"""
+        body, etag = page.body, page.etag
+        headers = {"Cache-Control": "public, no-cache", "Vary": "Accept-Encoding"}
+        encoding = choose_encoding(accepted_encodings(request.scope)) if len(body) >= COMPRESSION_MIN_SIZE else None
+        if encoding is not None:
+            # У каждого представления свой сильный ETag
+            etag = f'{etag[:-1]}-{encoding}"'
+            headers["Content-Encoding"] = encoding
+        headers["ETag"] = etag
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            if "*" in tags or etag in tags:
+                headers.pop("Content-Encoding", None)
+                return Response(status_code=304, headers=headers)
+        if encoding is not None:
+            body = page.compressed.get(encoding)
+            if body is None:
+                body = page.compressed[encoding] = compress_body(page.body, encoding)
+        return Response(body, media_type=page.media_type, headers=headers)
+
+    def lookup(self, request: Request, params=()):
+        """(ответ из кэша или None, ключ для store)"""
+        key = self.key(request, params)
+        page = self.pages.get(key)
+        return (self.respond(request, page) if page is not None else None), key
+
+    def store(self, request: Request, key: tuple, response: Response) -> Response:
+        """Кэширует успешный ответ и отдает его с ETag"""
+        if response.status_code != 200:
+            return response
+        etag = '"%s"' % hashlib.blake2b(response.body, digest_size=16).hexdigest()
+        page = CachedPage(response.body, etag, response.media_type, {})
+        self.pages.set(key, page)
+        return self.respond(request, page)
 
-# Инициализируем данные при старте
-add_test_data()
+    def catalog_changed(self, previous: Optional[CatalogSnapshot], current: CatalogSnapshot):
+        """Сбрасывает листинги и карточки изменившихся курсов"""
+        if previous is None:
+            self.pages.clear()
+            return
+        paths = {f"/course/{row.slug}" for row in changed_courses(previous, current)}
+        self.pages.discard(lambda key: not key[0].startswith("/course/") or key[0] in paths)
+
+
+page_cache = PageCache(PAGE_CACHE_SIZE, PAGE_CACHE_TTL)
 
 # ================== ПУБЛИЧНЫЕ РОУТЫ ==================
 
 @app.get("/", response_class=HTMLResponse)
-async def home(request: Request, db: Session = Depends(get_db)):
+@db_route
+def home(request: Request):
     """Главная страница с популярными курсами"""
-    courses = db.query(Course).filter(
-        Course.is_published == True
-    ).order_by(Course.clicks.desc()).limit(8).all()
+    cached, key = page_cache.lookup(request)
+    if cached is not None:
+        return cached
     
-    return templates.TemplateResponse("index.html", {
+    courses = get_catalog().select(sort="trending", per_page=8).courses
+    
+    return page_cache.store(request, key, templates.TemplateResponse("index.html", {
         "request": request,
         "courses": courses
-    })
+    }))
 
 @app.get("/courses", response_class=HTMLResponse)
-async def courses_list(
+@db_route
+def courses_list(
     request: Request,
     query: Optional[str] = Query(None),
     category: Optional[str] = Query(None),
@@ -176,65 +3360,45 @@ async def courses_list(
     format: Optional[str] = Query(None),
     price_min: Optional[str] = Query(None), 
     price_max: Optional[str] = Query(None),
+    tag: Optional[List[str]] = Query(None),
+    tag_mode: str = Query("all", pattern="^(all|any)$"),
     sort: str = Query("popular"),
     page: int = Query(1, ge=1),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None),
+    db: Session = Depends(get_read_db)
 ):
     """Каталог курсов с фильтрами, поиском и сортировкой"""
-    # Базовый запрос
-    db_query = db.query(Course).filter(Course.is_published == True)
-    
-    # ПРИМЕНЕНИЕ ФИЛЬТРОВ
-    if query:
-        search_term = f"%{query}%"
-        db_query = db_query.filter(
-            (Course.title.ilike(search_term)) | 
-            (Course.tags.ilike(search_term)) |
-            (Course.short_desc.ilike(search_term))
-        )
-    
-    if category and category != "all":
-        db_query = db_query.filter(Course.category_slug == category)
-    
-    if level and level != "all":
-        db_query = db_query.filter(Course.level == level)
+    cursor = cursor or None  # пустой ?cursor= - первая страница, а не 400
+    cached, key = page_cache.lookup(request, LISTING_PARAMS)
+    if cached is not None:
+        return cached
     
-    if format and format != "all":
-        db_query = db_query.filter(Course.format == format)
+    catalog = get_catalog()
+    price_min_value = parse_price(price_min)
+    price_max_value = parse_price(price_max)
     
-    if price_min is not None:
-        db_query = db_query.filter(Course.price_from >= price_min)
-    
-    if price_max is not None:
-        db_query = db_query.filter(Course.price_from <= price_max)
-    
-    # ПРИМЕНЕНИЕ СОРТИРОВКИ
-    if sort == "new":
-        db_query = db_query.order_by(Course.created_at.desc())
-    elif sort == "price_asc":
-        db_query = db_query.order_by(Course.price_from.asc())
-    elif sort == "price_desc":
-        db_query = db_query.order_by(Course.price_from.desc())
-    else:  # "popular" по умолчанию
-        db_query = db_query.order_by(Course.clicks.desc())
-    
-    # ПАГИНАЦИЯ
+    # Фильтры, сортировка и пагинация - в памяти, по снимку каталога
     per_page = 9  # Курсов на странице
-    total_courses = db_query.count()
-    total_pages = (total_courses + per_page - 1) // per_page if total_courses > 0 else 1
-    page = max(1, min(page, total_pages))
-    
-    # Получаем курсы для текущей страницы
-    offset = (page - 1) * per_page
-    courses = db_query.offset(offset).limit(per_page).all()
-    
-    # Получаем уникальные категории для фильтра
-    categories = db.query(Course.category_slug).filter(Course.is_published == True).distinct().all()
-    categories = [c[0] for c in categories if c[0]]
+    result = catalog.select(
+        category=category,
+        level=level,
+        format=format,
+        price_min=price_min_value,
+        price_max=price_max_value,
+        query=query,
+        search_desc=True,
+        ids=search_course_ids(db, query) if query else None,
+        tags=tag,
+        tag_mode=tag_mode,
+        sort=sort,
+        page=page,
+        per_page=per_page,
+        cursor=cursor
+    )
     
-    return templates.TemplateResponse("courses.html", {
+    return page_cache.store(request, key, templates.TemplateResponse("courses.html", {
         "request": request,
-        "courses": courses,
+        "courses": result.courses,
         "current_query": query,
         "current_category": category,
         "current_level": level,
@@ -242,18 +3406,25 @@ async def courses_list(
         "current_price_min": price_min,
         "current_price_max": price_max,
         "current_sort": sort,
-        "current_page": page,
-        "total_pages": total_pages,
-        "total_courses": total_courses,
-        "available_categories": categories,
-        "price_range": {
-            "min": db.query(func.min(Course.price_from)).filter(Course.is_published == True).scalar() or 0,
-            "max": db.query(func.max(Course.price_from)).filter(Course.is_published == True).scalar() or 100000
-        }
-    })
+        "current_page": result.page,
+        "total_pages": result.total_pages,
+        "total_courses": result.total,
+        "current_cursor": cursor,
+        "next_cursor": result.next_cursor,
+        "prev_cursor": result.prev_cursor,
+        "cursor_page": result.offset // per_page + 1 if cursor else None,
+        "page_depth": HTML_PAGE_DEPTH,
+        "available_categories": catalog.categories,
+        "current_tags": tag or [],
+        "current_tag_mode": tag_mode,
+        "tag_names": catalog.tag_names,
+        "facets": get_facets(db, catalog, category, level, format, price_min_value, price_max_value, query, True, tag, tag_mode),
+        "price_range": catalog.price_range
+    }))
 
 @app.get("/category/{category_slug}", response_class=HTMLResponse)
-async def category_list(
+@db_route
+def category_list(
     request: Request,
     category_slug: str,
     query: Optional[str] = Query(None),
@@ -261,54 +3432,36 @@ async def category_list(
     format: Optional[str] = Query(None),
     price_min: Optional[int] = Query(None),
     price_max: Optional[int] = Query(None),
+    tag: Optional[List[str]] = Query(None),
+    tag_mode: str = Query("all", pattern="^(all|any)$"),
     sort: str = Query("popular"),
     page: int = Query(1, ge=1),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None),
+    db: Session = Depends(get_read_db)
 ):
     """Страница категории с фильтрами"""
-    # Базовый запрос с фильтром по категории
-    db_query = db.query(Course).filter(
-        Course.is_published == True,
-        Course.category_slug == category_slug
-    )
-    
-    # Дополнительные фильтры
-    if query:
-        search_term = f"%{query}%"
-        db_query = db_query.filter(
-            (Course.title.ilike(search_term)) | 
-            (Course.tags.ilike(search_term))
-        )
-    
-    if level and level != "all":
-        db_query = db_query.filter(Course.level == level)
-    
-    if format and format != "all":
-        db_query = db_query.filter(Course.format == format)
+    cursor = cursor or None  # пустой ?cursor= - первая страница, а не 400
+    cached, key = page_cache.lookup(request, LISTING_PARAMS)
+    if cached is not None:
+        return cached
     
-    if price_min is not None:
-        db_query = db_query.filter(Course.price_from >= price_min)
-    
-    if price_max is not None:
-        db_query = db_query.filter(Course.price_from <= price_max)
-    
-    # Сортировка
-    if sort == "new":
-        db_query = db_query.order_by(Course.created_at.desc())
-    elif sort == "price_asc":
-        db_query = db_query.order_by(Course.price_from.asc())
-    elif sort == "price_desc":
-        db_query = db_query.order_by(Course.price_from.desc())
-    else:
-        db_query = db_query.order_by(Course.clicks.desc())
-    
-    # Пагинация
+    catalog = get_catalog()
     per_page = 9
-    total_courses = db_query.count()
-    total_pages = (total_courses + per_page - 1) // per_page if total_courses > 0 else 1
-    page = max(1, min(page, total_pages))
-    
-    courses = db_query.offset((page - 1) * per_page).limit(per_page).all()
+    result = catalog.select(
+        category=category_slug,
+        level=level,
+        format=format,
+        price_min=price_min,
+        price_max=price_max,
+        query=query,
+        ids=search_course_ids(db, query) if query else None,
+        tags=tag,
+        tag_mode=tag_mode,
+        sort=sort,
+        page=page,
+        per_page=per_page,
+        cursor=cursor
+    )
     
     # Название категории для отображения
     category_names = {
@@ -322,9 +3475,9 @@ async def category_list(
     
     category_name = category_names.get(category_slug, category_slug)
     
-    return templates.TemplateResponse("category.html", {
+    return page_cache.store(request, key, templates.TemplateResponse("category.html", {
         "request": request,
-        "courses": courses,
+        "courses": result.courses,
         "category_slug": category_slug,
         "category_name": category_name,
         "current_query": query,
@@ -333,57 +3486,72 @@ async def category_list(
         "current_price_min": price_min,
         "current_price_max": price_max,
         "current_sort": sort,
-        "current_page": page,
-        "total_pages": total_pages,
-        "total_courses": total_courses
-    })
+        "current_page": result.page,
+        "total_pages": result.total_pages,
+        "total_courses": result.total,
+        "current_cursor": cursor,
+        "next_cursor": result.next_cursor,
+        "prev_cursor": result.prev_cursor,
+        "cursor_page": result.offset // per_page + 1 if cursor else None,
+        "page_depth": HTML_PAGE_DEPTH,
+        "current_tags": tag or [],
+        "current_tag_mode": tag_mode,
+        "tag_names": catalog.tag_names,
+        "facets": get_facets(db, catalog, category_slug, level, format, price_min, price_max, query, tags=tag, tag_mode=tag_mode)
+    }))
 
 @app.get("/course/{slug}", response_class=HTMLResponse)
-async def course_detail(slug: str, request: Request, db: Session = Depends(get_db)):
+@db_route
+def course_detail(slug: str, request: Request, db: Session = Depends(get_read_db)):
     """Карточка курса"""
-    course = db.query(Course).filter(Course.slug == slug).first()
+    cached, key = page_cache.lookup(request)
+    if cached is not None:
+        return cached
+    
+    course = get_catalog().find(slug)
+    published = course is not None
+    if not published:
+        # Неопубликованные курсы - из БД и без кэша
+        course = db.query(Course).filter(Course.slug == slug).first()
     
     if not course:
         return templates.TemplateResponse("404.html", {
             "request": request
         }, status_code=404)
     
-    # Разделяем теги для отображения
-    tags_list = course.tags.split(",") if course.tags else []
+    # Теги: [(slug, название)] для ссылок на каталог по тегу
+    tags_list = split_tags(course.tags)
     
-    return templates.TemplateResponse("course.html", {
+    response = templates.TemplateResponse("course.html", {
         "request": request,
         "course": course,
-        "tags_list": tags_list
+        "tags_list": tags_list,
+        "related": related_courses(db, get_catalog(), course) if published else []
     })
+    return page_cache.store(request, key, response) if published else response
 
 @app.get("/out/{slug}")
-async def redirect_out(
+@db_route
+def redirect_out(
     slug: str, 
     request: Request,
     utm_source: Optional[str] = None,
-    utm_campaign: Optional[str] = None,
-    db: Session = Depends(get_db)
+    utm_campaign: Optional[str] = None
 ):
     """Редирект на партнерку с логированием клика"""
-    course = db.query(Course).filter(Course.slug == slug).first()
+    catalog = get_catalog()
+    course = catalog.find(slug)
+    if course is None:
+        # Неопубликованных курсов в снимке нет
+        course = find_course(slug)
     
     if not course:
         return RedirectResponse("/")
     
-    # Логируем клик
+    # Логируем клик: в БД он попадет фоновым сбросом буфера
     referer = request.headers.get("referer")
-    click = Click(
-        course_id=course.id,
-        referer=referer,
-        utm_source=utm_source,
-        utm_campaign=utm_campaign
-    )
-    db.add(click)
-    
-    # Увеличиваем счетчик кликов
-    course.clicks += 1
-    db.commit()
+    click_buffer.add(course.id, referer, utm_source, utm_campaign)
+    catalog.record_click(course.id)
     
     # Редирект на партнерскую ссылку
     if not course.affiliate_url:
@@ -396,87 +3564,96 @@ async def redirect_out(
 # ================== API ЭНДПОИНТЫ ==================
 
 @app.get("/api/courses")
-async def api_courses_list(
+@db_route
+def api_courses_list(
     category: Optional[str] = Query(None),
     level: Optional[str] = Query(None),
     format: Optional[str] = Query(None),
     price_min: Optional[int] = Query(None),
     price_max: Optional[int] = Query(None),
+    tag: Optional[List[str]] = Query(None),
+    tag_mode: str = Query("all", pattern="^(all|any)$"),
     sort: str = Query("popular"),
     query: Optional[str] = Query(None),
     page: int = Query(1, ge=1),
     per_page: int = Query(10, ge=1, le=100),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None),
+    with_total: bool = Query(False),
+    db: Session = Depends(get_read_db)
 ):
-    """API для получения списка курсов"""
-    db_query = db.query(Course).filter(Course.is_published == True)
-    
-    if category and category != "all":
-        db_query = db_query.filter(Course.category_slug == category)
-    
-    if level and level != "all":
-        db_query = db_query.filter(Course.level == level)
-    
-    if format and format != "all":
-        db_query = db_query.filter(Course.format == format)
-    
-    if price_min is not None:
-        db_query = db_query.filter(Course.price_from >= price_min)
-    
-    if price_max is not None:
-        db_query = db_query.filter(Course.price_from <= price_max)
-    
-    if query:
-        search = f"%{query}%"
-        db_query = db_query.filter(
-            (Course.title.ilike(search)) | 
-            (Course.tags.ilike(search))
-        )
-    
-    if sort == "new":
-        db_query = db_query.order_by(Course.created_at.desc())
-    elif sort == "price_asc":
-        db_query = db_query.order_by(Course.price_from.asc())
-    elif sort == "price_desc":
-        db_query = db_query.order_by(Course.price_from.desc())
-    else:
-        db_query = db_query.order_by(Course.clicks.desc())
-    
-    total = db_query.count()
-    total_pages = (total + per_page - 1) // per_page if total > 0 else 1
-    page = max(1, min(page, total_pages))
-    
-    courses = db_query.offset((page - 1) * per_page).limit(per_page).all()
+    """API для получения списка курсов.
+
+    Для обхода всего каталога - cursor=next_cursor предыдущего ответа (keyset):
+    стоимость страницы не растет с глубиной. В режиме курсора page и
+    total_pages равны null, total считается только при with_total=true."""
+    catalog = get_catalog()
+    result = catalog.select(
+        category=category,
+        level=level,
+        format=format,
+        price_min=price_min,
+        price_max=price_max,
+        query=query,
+        ids=search_course_ids(db, query) if query else None,
+        tags=tag,
+        tag_mode=tag_mode,
+        sort=sort,
+        page=page,
+        per_page=per_page,
+        cursor=cursor,
+        with_total=with_total
+    )
     
-    return {
-        "page": page,
-        "per_page": per_page,
-        "total": total,
-        "total_pages": total_pages,
-        "courses": [
-            {
-                "id": c.id,
-                "slug": c.slug,
-                "title": c.title,
-                "provider": c.provider,
-                "price_from": c.price_from,
-                "duration": c.duration,
-                "level": c.level,
-                "format": c.format,
-                "category_slug": c.category_slug,
-                "clicks": c.clicks,
-                "short_desc": c.short_desc,
-                "tags": c.tags.split(",") if c.tags else []
-            }
-            for c in courses
-        ]
-    }
+    return json_list_response(
+        {
+            "page": result.page,
+            "per_page": per_page,
+            "total": result.total,
+            "total_pages": result.total_pages,
+            "next_cursor": result.next_cursor,
+        },
+        [course_json("list", c, catalog.tags_of) for c in result.courses]
+    )
+
+@app.get("/api/suggest")
+@db_route
+def api_suggest(
+    q: str = Query("", max_length=200),
+    limit: int = Query(8, ge=1, le=20)
+):
+    """Подсказки для строки поиска (по началу слов названий, тегов, категорий, провайдеров)"""
+    return FastJSONResponse(
+        {"q": q, "suggestions": suggest(get_catalog(), q, limit)},
+        headers={"Cache-Control": "public, max-age=30"}
+    )
+
+@app.get("/api/facets")
+@db_route
+def api_facets(
+    category: Optional[str] = Query(None),
+    level: Optional[str] = Query(None),
+    format: Optional[str] = Query(None),
+    price_min: Optional[int] = Query(None),
+    price_max: Optional[int] = Query(None),
+    query: Optional[str] = Query(None),
+    tag: Optional[List[str]] = Query(None),
+    tag_mode: str = Query("all", pattern="^(all|any)$"),
+    db: Session = Depends(get_read_db)
+):
+    """API фасетов: сколько курсов даст каждый вариант фильтра + гистограмма цен"""
+    return get_facets(db, get_catalog(), category, level, format, price_min, price_max, query, tags=tag, tag_mode=tag_mode)
 
 @app.get("/api/course/{slug}")
-async def api_course_detail(slug: str, db: Session = Depends(get_db)):
+@db_route
+def api_course_detail(slug: str, db: Session = Depends(get_read_db)):
     """API для получения курса по slug"""
-    course = db.query(Course).filter(Course.slug == slug).first()
+    catalog = get_catalog()
+    course = catalog.find(slug)
+    if course is not None:
+        return Response(course_json("detail", course, catalog.tags_of), media_type="application/json")
     
+    # Неопубликованный курс - из БД и без кэша фрагментов
+    course = db.query(Course).filter(Course.slug == slug).first()
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
     
@@ -490,7 +3667,7 @@ async def api_course_detail(slug: str, db: Session = Depends(get_db)):
         "format": course.format,
         "price_from": course.price_from,
         "duration": course.duration,
-        "tags": course.tags.split(",") if course.tags else [],
+        "tags": [name for _, name in split_tags(course.tags)],
         "short_desc": course.short_desc,
         "affiliate_url": course.affiliate_url,
         "is_published": course.is_published,
@@ -499,6 +3676,170 @@ async def api_course_detail(slug: str, db: Session = Depends(get_db)):
         "updated_at": course.updated_at.isoformat() if course.updated_at else None
     }
 
+
+@app.get("/api/course/{slug}/related")
+@db_route
+def api_course_related(slug: str, db: Session = Depends(get_read_db)):
+    """API похожих курсов (предвычисленные соседи, по убыванию сходства)"""
+    catalog = get_catalog()
+    course = catalog.find(slug)
+    if course is None:
+        raise HTTPException(status_code=404, detail="Course not found")
+    return json_list_response(
+        {"slug": slug},
+        [course_json("list", c, catalog.tags_of) for c in related_courses(db, catalog, course)]
+    )
+
+
+STATS_GROUPS = ("bucket", "course", "utm_source", "utm_campaign")
+
+@app.get("/api/admin/stats")
+@db_route
+def api_admin_stats(
+    token: str = Query(...),
+    grain: str = Query("day", pattern="^(hour|day)$"),
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    group_by: str = Query("bucket"),
+    course: Optional[str] = Query(None),
+    utm_source: Optional[str] = Query(None),
+    utm_campaign: Optional[str] = Query(None),
+    limit: int = Query(1000, ge=1, le=10000),
+    db: Session = Depends(get_fresh_db)
+):
+    """API для админки: клики из агрегатов за [from, to) с группировкой.
+
+    group_by - через запятую из bucket, course, utm_source, utm_campaign;
+    по умолчанию последние 30 дней по дням.
+    """
+    check_admin_token(token)
+    groups = [name.strip() for name in group_by.split(",") if name.strip()]
+    unknown = set(groups) - set(STATS_GROUPS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Неизвестная группировка: {', '.join(sorted(unknown))}")
+    
+    table = (ClickStatsHourly if grain == "hour" else ClickStatsDaily).__table__
+    date_to = as_utc(date_to) if date_to else datetime.now(timezone.utc)
+    date_from = as_utc(date_from) if date_from else date_to - timedelta(days=30)
+    
+    columns = {
+        "bucket": table.c.bucket,
+        "course": table.c.course_id,
+        "utm_source": table.c.utm_source,
+        "utm_campaign": table.c.utm_campaign,
+    }
+    group_columns = [columns[name] for name in groups]
+    total_clicks = func.sum(table.c.clicks).label("clicks")
+    stmt = (
+        select(*group_columns, total_clicks)
+        .where(table.c.bucket >= date_from, table.c.bucket < date_to)
+        .group_by(*group_columns)
+        .order_by(table.c.bucket if "bucket" in groups else total_clicks.desc())
+        .limit(limit)
+    )
+    if course:
+        course_id = db.query(Course.id).filter(Course.slug == course).scalar()
+        if course_id is None:
+            raise HTTPException(status_code=404, detail="Course not found")
+        stmt = stmt.where(table.c.course_id == course_id)
+    if utm_source is not None:
+        stmt = stmt.where(table.c.utm_source == utm_source)
+    if utm_campaign is not None:
+        stmt = stmt.where(table.c.utm_campaign == utm_campaign)
+    rows = db.execute(stmt).all()
+    
+    slugs = {}
+    if "course" in groups:
+        course_ids = {row.course_id for row in rows}
+        slugs = dict(db.query(Course.id, Course.slug).filter(Course.id.in_(course_ids)).all()) if course_ids else {}
+    
+    result = []
+    for row in rows:
+        item = {}
+        if "bucket" in groups:
+            item["bucket"] = as_utc(row.bucket).isoformat()
+        if "course" in groups:
+            item["course_id"] = row.course_id
+            item["slug"] = slugs.get(row.course_id)
+        if "utm_source" in groups:
+            item["utm_source"] = row.utm_source or None
+        if "utm_campaign" in groups:
+            item["utm_campaign"] = row.utm_campaign or None
+        item["clicks"] = int(row.clicks)
+        result.append(item)
+    
+    last_id = db.query(RollupState.last_id).filter(RollupState.name == "clicks").scalar()
+    return {
+        "grain": grain,
+        "from": date_from.isoformat(),
+        "to": date_to.isoformat(),
+        "group_by": groups,
+        "total": sum(item["clicks"] for item in result),
+        "rolled_up_to_click_id": last_id or 0,
+        "rows": result,
+    }
+@app.post("/api/admin/import/courses")
+@db_route
+def api_admin_import_courses(
+    response: Response,
+    token: str = Query(...),
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern="^(csv|jsonl)$"),
+    batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1, le=10000)
+):
+    """API для админки: upsert курсов по slug из CSV/JSONL с отчетом об ошибках строк"""
+    check_admin_token(token)
+    # UploadFile - временный файл на диске, читаем его построчно
+    stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    report = import_courses(stream, import_format(file.filename, format), batch_size)
+    if report["inserted"] or report["updated"]:
+        catalog_changed()
+        pin_primary(response)
+    return report
+
+@app.get("/api/admin/export/courses")
+@db_route
+def api_admin_export_courses(
+    token: str = Query(...),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+):
+    """API для админки: потоковая выгрузка всех курсов (CSV совместим с импортом)"""
+    check_admin_token(token)
+    return export_response(export_chunks(Course.__table__, COURSE_FIELDS), COURSE_FIELDS, format, "courses")
+
+@app.get("/api/admin/export/clicks")
+@db_route
+def api_admin_export_clicks(
+    token: str = Query(...),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    course: Optional[str] = Query(None),
+    db: Session = Depends(get_fresh_db)
+):
+    """API для админки: потоковая выгрузка кликов за [from, to), можно по одному курсу"""
+    check_admin_token(token)
+    table = Click.__table__
+    where = []
+    after_id = 0
+    if course:
+        course_id = db.query(Course.id).filter(Course.slug == course).scalar()
+        if course_id is None:
+            raise HTTPException(status_code=404, detail="Course not found")
+        where.append(table.c.course_id == course_id)
+    if date_from:
+        where.append(table.c.ts >= as_utc(date_from))
+        # Кликов раньше первого id из диапазона в выгрузке быть не может -
+        # не сканируем начало таблицы
+        first_id = db.execute(select(func.min(table.c.id)).where(*where)).scalar()
+        if first_id is None:
+            return export_response(iter(()), CLICK_FIELDS, format, "clicks")
+        after_id = first_id - 1
+    if date_to:
+        where.append(table.c.ts < as_utc(date_to))
+    db.close()  # соединение из Depends не держим, пока отдается поток
+    return export_response(export_chunks(table, CLICK_FIELDS, where, after_id), CLICK_FIELDS, format, "clicks")
+
 # ================== АДМИНКА ==================
 
 def check_admin_token(token: str):
@@ -507,11 +3848,12 @@ def check_admin_token(token: str):
         raise HTTPException(status_code=403, detail="Invalid admin token")
 
 @app.get("/admin/courses", response_class=HTMLResponse)
-async def admin_courses_list(
+@db_route
+def admin_courses_list(
     request: Request,
     token: str = Query(...),
     page: int = 1,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_fresh_db)
 ):
     """Список всех курсов в админке"""
     check_admin_token(token)
@@ -547,7 +3889,8 @@ async def admin_course_new_form(request: Request, token: str = Query(...)):
     })
 
 @app.post("/admin/course/new")
-async def admin_course_create(
+@db_route
+def admin_course_create(
     request: Request,
     token: str = Form(...),
     title: str = Form(...),
@@ -596,15 +3939,17 @@ async def admin_course_create(
     
     db.add(course)
     db.commit()
+    catalog_changed()
     
-    return RedirectResponse(f"/admin/courses?token={token}", status_code=303)
+    return pin_primary(RedirectResponse(f"/admin/courses?token={token}", status_code=303))
 
 @app.get("/admin/course/{course_id}", response_class=HTMLResponse)
-async def admin_course_edit_form(
+@db_route
+def admin_course_edit_form(
     request: Request,
     course_id: int,
     token: str = Query(...),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_fresh_db)
 ):
     """Форма редактирования курса"""
     check_admin_token(token)
@@ -622,7 +3967,8 @@ async def admin_course_edit_form(
     })
 
 @app.post("/admin/course/{course_id}")
-async def admin_course_update(
+@db_route
+def admin_course_update(
     request: Request,
     course_id: int,
     token: str = Form(...),
@@ -674,15 +4020,17 @@ async def admin_course_update(
     course.is_published = is_published
     
     db.commit()
+    catalog_changed()
     
-    return RedirectResponse(f"/admin/courses?token={token}", status_code=303)
+    return pin_primary(RedirectResponse(f"/admin/courses?token={token}", status_code=303))
 
 @app.get("/api/admin/courses")
-async def api_admin_courses_list(
+@db_route
+def api_admin_courses_list(
     token: str = Query(...),
     page: int = 1,
     per_page: int = 20,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_fresh_db)
 ):
     """API для админки: список всех курсов"""
     check_admin_token(token)
@@ -694,33 +4042,10 @@ async def api_admin_courses_list(
     
     courses = db_query.offset((page - 1) * per_page).limit(per_page).all()
     
-    return {
-        "page": page,
-        "per_page": per_page,
-        "total": total,
-        "total_pages": total_pages,
-        "courses": [
-            {
-                "id": c.id,
-                "slug": c.slug,
-                "title": c.title,
-                "provider": c.provider,
-                "category_slug": c.category_slug,
-                "level": c.level,
-                "format": c.format,
-                "price_from": c.price_from,
-                "duration": c.duration,
-                "tags": c.tags,
-                "short_desc": c.short_desc,
-                "affiliate_url": c.affiliate_url,
-                "is_published": c.is_published,
-                "clicks": c.clicks,
-                "created_at": c.created_at.isoformat() if c.created_at else None,
-                "updated_at": c.updated_at.isoformat() if c.updated_at else None
-            }
-            for c in courses
-        ]
-    }
+    return json_list_response(
+        {"page": page, "per_page": per_page, "total": total, "total_pages": total_pages},
+        [course_json("admin", c) for c in courses]
+    )
 # ================== АДМИНКА ==================
 
 def check_admin_token(token: str):
@@ -729,11 +4054,12 @@ def check_admin_token(token: str):
         raise HTTPException(status_code=403, detail="Неверный токен админки")
 
 @app.get("/admin/courses", response_class=HTMLResponse)
-async def admin_courses_list(
+@db_route
+def admin_courses_list(
     request: Request,
     token: str = Query(...),
     page: int = Query(1, ge=1),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_fresh_db)
 ):
     """Список всех курсов в админке"""
     check_admin_token(token)
@@ -769,7 +4095,8 @@ async def admin_course_new_form(request: Request, token: str = Query(...)):
     })
 
 @app.post("/admin/course/new")
-async def admin_course_create(
+@db_route
+def admin_course_create(
     request: Request,
     token: str = Form(...),
     title: str = Form(...),
@@ -818,16 +4145,18 @@ async def admin_course_create(
     
     db.add(course)
     db.commit()
+    catalog_changed()
     
     # Редирект на список курсов
-    return RedirectResponse(f"/admin/courses?token={token}", status_code=303)
+    return pin_primary(RedirectResponse(f"/admin/courses?token={token}", status_code=303))
 
 @app.get("/admin/course/{course_id}", response_class=HTMLResponse)
-async def admin_course_edit_form(
+@db_route
+def admin_course_edit_form(
     request: Request,
     course_id: int,
     token: str = Query(...),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_fresh_db)
 ):
     """Форма редактирования курса"""
     check_admin_token(token)
@@ -845,7 +4174,8 @@ async def admin_course_edit_form(
     })
 
 @app.post("/admin/course/{course_id}")
-async def admin_course_update(
+@db_route
+def admin_course_update(
     request: Request,
     course_id: int,
     token: str = Form(...),
@@ -897,11 +4227,13 @@ async def admin_course_update(
     course.is_published = is_published
     
     db.commit()
+    catalog_changed()
     
-    return RedirectResponse(f"/admin/courses?token={token}", status_code=303)
+    return pin_primary(RedirectResponse(f"/admin/courses?token={token}", status_code=303))
 
 @app.get("/admin/delete/{course_id}")
-async def admin_course_delete(
+@db_route
+def admin_course_delete(
     course_id: int,
     token: str = Query(...),
     db: Session = Depends(get_db)
@@ -914,11 +4246,65 @@ async def admin_course_delete(
     if course:
         db.delete(course)
         db.commit()
+        catalog_changed()
     
-    return RedirectResponse(f"/admin/courses?token={token}")
+    return pin_primary(RedirectResponse(f"/admin/courses?token={token}"))
 # ================== ЗАПУСК ==================
 
+def import_command(path: str, format: Optional[str], batch_size: int) -> int:
+    """python main.py import FILE: импорт курсов из CSV/JSONL ("-" - stdin)"""
+    import sys
+    
+    if AUTO_MIGRATE:
+        migrate_database()
+    init_search_index()
+    if path == "-":
+        stream = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig", newline="")
+        report = import_courses(stream, import_format(None, format), batch_size)
+    else:
+        with open(path, encoding="utf-8-sig", newline="") as stream:
+            report = import_courses(stream, import_format(path, format), batch_size)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 1 if report["errors"] else 0
+
+
+def seed_command() -> int:
+    """python main.py seed: тестовые курсы, если база пустая"""
+    if AUTO_MIGRATE:
+        migrate_database()
+    init_search_index()
+    add_test_data()
+    return 0
+
+
 if __name__ == "__main__":
+    import argparse
+    import sys
+    
+    parser = argparse.ArgumentParser(description="Каталог курсов по нейросетям")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("serve", help="запустить веб-сервер (по умолчанию)")
+    commands.add_parser("migrate", help="применить миграции (alembic upgrade head)")
+    commands.add_parser("seed", help="добавить тестовые курсы в пустую базу")
+    commands.add_parser("assets", help="собрать fingerprinted-статику в static/dist")
+    import_parser = commands.add_parser("import", help="импорт курсов из CSV/JSONL (upsert по slug)")
+    import_parser.add_argument("file", help='путь к файлу или "-" для stdin')
+    import_parser.add_argument("--format", choices=("csv", "jsonl"), help="по умолчанию - по расширению файла")
+    import_parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+    
+    if args.command == "migrate":
+        migrate_database()
+        sys.exit(0)
+    if args.command == "seed":
+        sys.exit(seed_command())
+    if args.command == "assets":
+        manifest = build_assets()
+        print(json.dumps(manifest, indent=2, sort_keys=True))
+        sys.exit(0)
+    if args.command == "import":
+        sys.exit(import_command(args.file, args.format, args.batch_size))
+    
     import uvicorn
     port = int(os.getenv("PORT", 8000))
     uvicorn.run(app, host="0.0.0.0", port=port)
@@ -0,0 +1,55 @@
+"""Окружение Alembic: схема и подключение берутся из main.py"""
+from logging.config import fileConfig
+
+from alembic import context
+
+import main
+
+config = context.config
+
+# При запуске из приложения (AUTO_MIGRATE) логирование не перенастраиваем
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name)
+
+target_metadata = main.Base.metadata
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    """Поисковый индекс ведется миграциями вручную, автогенерация его не трогает"""
+    if type_ == "table" and name.startswith("courses_fts"):
+        return False
+    if type_ == "index" and name == "ix_courses_search":
+        return False
+    return True
+
+
+def run_migrations_offline() -> None:
+    """Генерация SQL без подключения: alembic upgrade head --sql"""
+    context.configure(
+        url=main.DATABASE_URL,
+        target_metadata=target_metadata,
+        include_object=include_object,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        render_as_batch=main.DATABASE_URL.startswith("sqlite"),
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    with main.engine.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_object=include_object,
+            render_as_batch=connection.dialect.name == "sqlite",
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,71 @@
+"""Начальная схема: courses и clicks
+
+Базы, созданные раньше через Base.metadata.create_all, уже содержат эти
+таблицы - для них миграция ничего не делает.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 12:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(name: str) -> bool:
+    # В offline-режиме (--sql) подключения нет - генерируем полную схему
+    if op.get_context().as_sql:
+        return False
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade() -> None:
+    if not _has_table("courses"):
+        op.create_table(
+            "courses",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("slug", sa.String()),
+            sa.Column("title", sa.String(), nullable=False),
+            sa.Column("provider", sa.String()),
+            sa.Column("category_slug", sa.String()),
+            sa.Column("level", sa.String()),
+            sa.Column("format", sa.String()),
+            sa.Column("price_from", sa.Integer()),
+            sa.Column("duration", sa.String()),
+            sa.Column("tags", sa.Text()),
+            sa.Column("short_desc", sa.Text()),
+            sa.Column("affiliate_url", sa.String()),
+            sa.Column("is_published", sa.Boolean()),
+            sa.Column("clicks", sa.Integer()),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=True)),
+        )
+        op.create_index("ix_courses_id", "courses", ["id"])
+        op.create_index("ix_courses_slug", "courses", ["slug"], unique=True)
+
+    if not _has_table("clicks"):
+        op.create_table(
+            "clicks",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("course_id", sa.Integer()),
+            sa.Column("ts", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("referer", sa.String(), nullable=True),
+            sa.Column("utm_source", sa.String(), nullable=True),
+            sa.Column("utm_campaign", sa.String(), nullable=True),
+        )
+        op.create_index("ix_clicks_id", "clicks", ["id"])
+        op.create_index("ix_clicks_course_id", "clicks", ["course_id"])
+
+
+def downgrade() -> None:
+    op.drop_table("clicks")
+    op.drop_table("courses")
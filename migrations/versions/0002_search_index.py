@@ -0,0 +1,168 @@
+"""Полнотекстовый поиск: FTS5-таблица (SQLite) или GIN-индекс (PostgreSQL)
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 12:10:00
+
+"""
+import re
+from typing import Optional, Sequence, Union
+
+from alembic import op
+from sqlalchemy import text
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Должно совпадать с main.PG_SEARCH_DOCUMENT, иначе индекс не будет использоваться
+PG_SEARCH_DOCUMENT = (
+    "to_tsvector('russian', coalesce(title, '') || ' ' || "
+    "replace(coalesce(tags, ''), ',', ' ') || ' ' || coalesce(short_desc, ''))"
+)
+
+# Замороженная копия стеммера main.stem_ru на момент этой ревизии: миграция не
+# должна зависеть от того, как приложение индексирует текст сейчас.
+SEARCH_FIELDS = ("title", "tags", "short_desc")
+
+_RU_VOWELS = "аеиоуыэюя"
+
+
+def _ru_endings(*groups):
+    """Окончания стеммера: (окончание, нужна ли перед ним "а"/"я"), длинные первыми"""
+    endings = [(e, needs_a) for group, needs_a in groups for e in group]
+    return sorted(endings, key=lambda item: -len(item[0]))
+
+
+_RU_ADJECTIVE = (
+    "ими", "ыми", "его", "ого", "ему", "ому", "ее", "ие", "ые", "ое", "ей", "ий", "ый",
+    "ой", "ем", "им", "ым", "ом", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею",
+)
+_RU_PERFECTIVE_GERUND = _ru_endings(
+    (("ившись", "ывшись", "ивши", "ывши", "ив", "ыв"), False),
+    (("вшись", "вши", "в"), True),
+)
+_RU_REFLEXIVE = _ru_endings((("ся", "сь"), False))
+_RU_ADJECTIVAL = _ru_endings((_RU_ADJECTIVE, False))
+_RU_PARTICIPLE = _ru_endings(
+    (("ивш", "ывш", "ующ"), False),
+    (("ем", "нн", "вш", "ющ", "щ"), True),
+)
+_RU_VERB = _ru_endings(
+    (("ила", "ыла", "ена", "ейте", "уйте", "ите", "или", "ыли", "ей", "уй", "ил", "ыл",
+      "им", "ым", "ен", "ило", "ыло", "ено", "ят", "ует", "уют", "ит", "ыт", "ены",
+      "ить", "ыть", "ишь", "ую", "ю"), False),
+    (("ла", "на", "ете", "йте", "ли", "й", "л", "ем", "н", "ло", "но", "ет", "ют", "ны",
+      "ть", "ешь", "нно"), True),
+)
+_RU_NOUN = _ru_endings((
+    ("иями", "ями", "ами", "ией", "иям", "ием", "иях", "ев", "ов", "ие", "ье", "еи", "ии",
+     "ей", "ой", "ий", "ям", "ем", "ам", "ом", "ах", "ях", "ию", "ью", "ия", "ья", "и",
+     "ы", "ь", "ю", "у", "о", "а", "е", "й", "я"), False))
+
+
+def _ru_cut(word: str, rv: int, endings) -> Optional[str]:
+    """Отрезает самое длинное подходящее окончание в пределах RV"""
+    for ending, needs_a in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= rv:
+            stem = word[:-len(ending)]
+            if needs_a and not (len(stem) > rv and stem[-1] in "ая"):
+                return None
+            return stem
+    return None
+
+
+def _ru_region(word: str, start: int) -> int:
+    """Начало R1/R2: позиция после первой согласной, идущей за гласной"""
+    for i in range(start + 1, len(word)):
+        if word[i] not in _RU_VOWELS and word[i - 1] in _RU_VOWELS:
+            return i + 1
+    return len(word)
+
+
+def stem_ru(word: str) -> str:
+    """Стеммер Портера для русского языка (Snowball); прочие слова не меняются"""
+    word = word.replace("ё", "е")
+    match = re.search(f"[{_RU_VOWELS}]", word)
+    if not match:
+        return word
+    rv = match.end()
+    r2 = _ru_region(word, _ru_region(word, 0))
+
+    # Шаг 1: деепричастие, иначе возвратность + прилагательное/глагол/существительное
+    stem = _ru_cut(word, rv, _RU_PERFECTIVE_GERUND)
+    if stem is None:
+        word = _ru_cut(word, rv, _RU_REFLEXIVE) or word
+        stem = _ru_cut(word, rv, _RU_ADJECTIVAL)
+        if stem is not None:
+            stem = _ru_cut(stem, rv, _RU_PARTICIPLE) or stem
+        else:
+            stem = _ru_cut(word, rv, _RU_VERB) or _ru_cut(word, rv, _RU_NOUN)
+    if stem is not None:
+        word = stem
+
+    # Шаг 2-3: "и" и словообразовательное "ость" (в R2)
+    if word.endswith("и") and len(word) > rv:
+        word = word[:-1]
+    for ending in ("ость", "ост"):
+        if word.endswith(ending) and len(word) - len(ending) >= r2:
+            word = word[:-len(ending)]
+            break
+
+    # Шаг 4: "нн" -> "н", превосходная степень, мягкий знак
+    for ending in ("ейше", "ейш"):
+        if word.endswith(ending) and len(word) - len(ending) >= rv:
+            word = word[:-len(ending)]
+            break
+    if word.endswith("нн") and len(word) - 2 >= rv:
+        word = word[:-1]
+    elif word.endswith("ь") and len(word) > rv:
+        word = word[:-1]
+    return word
+
+
+def search_terms(value: Optional[str]) -> list:
+    """Слова строки в нижнем регистре, приведенные к основе"""
+    return [stem_ru(word) for word in re.findall(r"\w+", (value or "").casefold())]
+
+
+def rebuild_search_index(connection):
+    """Заполняет courses_fts стеммированным текстом всех курсов"""
+    connection.exec_driver_sql("DELETE FROM courses_fts")
+    rows = [
+        {"id": course.id, **{field: " ".join(search_terms(getattr(course, field))) for field in SEARCH_FIELDS}}
+        for course in connection.exec_driver_sql("SELECT id, title, tags, short_desc FROM courses")
+    ]
+    if rows:
+        connection.execute(
+            text("INSERT INTO courses_fts (rowid, title, tags, short_desc) VALUES (:id, :title, :tags, :short_desc)"),
+            rows
+        )
+
+
+def upgrade() -> None:
+    dialect = op.get_context().dialect.name
+    if dialect == "postgresql":
+        # CONCURRENTLY не блокирует запись в courses на время построения
+        with op.get_context().autocommit_block():
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_courses_search ON courses USING GIN ({PG_SEARCH_DOCUMENT})")
+    elif dialect == "sqlite":
+        op.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS courses_fts "
+            "USING fts5(title, tags, short_desc, tokenize='unicode61 remove_diacritics 2')"
+        )
+        # В offline-режиме (--sql) курсов не прочитать - индекс заполнит
+        # init_search_index при старте приложения (сверка числа строк)
+        if not op.get_context().as_sql:
+            rebuild_search_index(op.get_bind())
+
+
+def downgrade() -> None:
+    dialect = op.get_context().dialect.name
+    if dialect == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_courses_search")
+    elif dialect == "sqlite":
+        op.execute("DROP TABLE IF EXISTS courses_fts")
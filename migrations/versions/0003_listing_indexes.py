@@ -0,0 +1,59 @@
+"""Индексы под фильтры и сортировки каталога
+
+Частичные индексы по опубликованным курсам повторяют формы запросов листинга:
+категория + сортировка (clicks DESC / created_at DESC / price_from) и те же
+сортировки по всему каталогу. level и format - низкоселективные колонки,
+отдельных индексов для них нет. На PostgreSQL индексы строятся CONCURRENTLY.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 12:20:00
+
+"""
+from contextlib import nullcontext
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PUBLISHED = sa.text("is_published")
+
+# (имя, таблица, колонки, только опубликованные)
+INDEXES = [
+    ("ix_courses_pub_clicks", "courses", [sa.text("clicks DESC"), "id"], True),
+    ("ix_courses_pub_created", "courses", [sa.text("created_at DESC"), "id"], True),
+    ("ix_courses_pub_price", "courses", ["price_from", "id"], True),
+    ("ix_courses_pub_category_clicks", "courses", ["category_slug", sa.text("clicks DESC"), "id"], True),
+    ("ix_courses_pub_category_created", "courses", ["category_slug", sa.text("created_at DESC"), "id"], True),
+    ("ix_courses_pub_category_price", "courses", ["category_slug", "price_from", "id"], True),
+    ("ix_courses_created_at", "courses", ["created_at"], False),
+    ("ix_clicks_course_ts", "clicks", ["course_id", "ts"], False),
+    ("ix_clicks_ts", "clicks", ["ts"], False),
+]
+
+
+def upgrade() -> None:
+    # Диалект - из контекста: в offline-режиме (--sql) подключения нет
+    concurrently = op.get_context().dialect.name == "postgresql"
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block() if concurrently else nullcontext():
+        for name, table, columns, published_only in INDEXES:
+            where = PUBLISHED if published_only else None
+            op.create_index(
+                name, table, columns,
+                postgresql_concurrently=concurrently,
+                postgresql_where=where,
+                sqlite_where=where,
+            )
+
+
+def downgrade() -> None:
+    for name, table, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
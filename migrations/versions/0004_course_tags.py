@@ -0,0 +1,89 @@
+"""Нормализованные теги: tags + course_tags
+
+Строка Course.tags остается источником правды для админки, а связь
+course_tags пересобирается из нее событиями маппера (main.sync_course_tags).
+Миграция создает таблицы и заполняет их по существующим курсам своей
+замороженной копией разбора тегов.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 14:05:00
+
+"""
+import re
+from typing import Optional, Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def tag_slug(name: str) -> str:
+    """Нормализованный slug тега: "Premiere Pro" -> premiere-pro, "UI/UX" -> ui-ux"""
+    return re.sub(r"[^\w]+", "-", name.strip().casefold().replace("ё", "е")).strip("-_")
+
+
+def split_tags(value: Optional[str]) -> list:
+    """[(slug, название)] из строки тегов, без пустых и повторов"""
+    tags = {}
+    for name in (value or "").split(","):
+        name = name.strip()
+        slug = tag_slug(name)
+        if slug and slug not in tags:
+            tags[slug] = name
+    return list(tags.items())
+
+
+def upgrade() -> None:
+    tags_table = op.create_table(
+        "tags",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("slug", sa.String(), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_tags_slug", "tags", ["slug"], unique=True)
+    links = op.create_table(
+        "course_tags",
+        sa.Column("course_id", sa.Integer(), nullable=False),
+        sa.Column("tag_id", sa.Integer(), nullable=False),
+        sa.Column("position", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["course_id"], ["courses.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["tag_id"], ["tags.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("course_id", "tag_id"),
+    )
+    op.create_index("ix_course_tags_tag_course", "course_tags", ["tag_id", "course_id"])
+
+    if op.get_context().as_sql:
+        return
+    connection = op.get_bind()
+    pairs = {
+        course_id: split_tags(tags)
+        for course_id, tags in connection.execute(sa.text("SELECT id, tags FROM courses"))
+    }
+    names = {slug: name for course_pairs in pairs.values() for slug, name in course_pairs}
+    if not names:
+        return
+    op.bulk_insert(tags_table, [{"slug": slug, "name": name} for slug, name in names.items()])
+    ids = dict(connection.execute(sa.select(tags_table.c.slug, tags_table.c.id)).all())
+    op.bulk_insert(
+        links,
+        [
+            {"course_id": course_id, "tag_id": ids[slug], "position": position}
+            for course_id, course_pairs in pairs.items()
+            for position, (slug, _) in enumerate(course_pairs)
+        ]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_course_tags_tag_course", table_name="course_tags")
+    op.drop_table("course_tags")
+    op.drop_index("ix_tags_slug", table_name="tags")
+    op.drop_table("tags")
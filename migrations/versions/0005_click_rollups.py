@@ -0,0 +1,51 @@
+"""Агрегаты кликов: click_stats_hourly, click_stats_daily, rollup_state
+
+Таблицы заполняет фоновая задача main.rollup_clicks начиная с отметки 0,
+так что существующие клики попадут в агрегаты при первом проходе.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 15:10:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ROLLUP_TABLES = ("click_stats_hourly", "click_stats_daily")
+
+
+def upgrade() -> None:
+    for table in ROLLUP_TABLES:
+        op.create_table(
+            table,
+            sa.Column("bucket", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("course_id", sa.Integer(), nullable=False),
+            sa.Column("utm_source", sa.String(), nullable=False),
+            sa.Column("utm_campaign", sa.String(), nullable=False),
+            sa.Column("clicks", sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint("bucket", "course_id", "utm_source", "utm_campaign"),
+        )
+        op.create_index(f"ix_{table}_course", table, ["course_id", "bucket"])
+    state = op.create_table(
+        "rollup_state",
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("last_id", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+    )
+    op.bulk_insert(state, [{"name": "clicks", "last_id": 0}])
+
+
+def downgrade() -> None:
+    op.drop_table("rollup_state")
+    for table in reversed(ROLLUP_TABLES):
+        op.drop_index(f"ix_{table}_course", table_name=table)
+        op.drop_table(table)
@@ -0,0 +1,48 @@
+"""Похожие курсы: related_courses, course_coclicks
+
+related_courses - предвычисленные соседи курса (одна строка на курс),
+course_coclicks - число сессий (referer + окно времени), в которых кликнули
+оба курса. Обе таблицы заполняет фоновая задача main.refresh_related:
+совместные клики - с отметки 0 в rollup_state, соседи - для всех курсов.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 21:30:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "course_coclicks",
+        sa.Column("course_id", sa.Integer(), nullable=False),
+        sa.Column("other_id", sa.Integer(), nullable=False),
+        sa.Column("sessions", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("course_id", "other_id"),
+    )
+    op.create_table(
+        "related_courses",
+        sa.Column("course_id", sa.Integer(), nullable=False),
+        sa.Column("related", sa.Text(), nullable=False),
+        sa.Column("built_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("course_id"),
+    )
+    state = sa.table("rollup_state", sa.column("name", sa.String()), sa.column("last_id", sa.Integer()))
+    op.bulk_insert(state, [{"name": "related", "last_id": 0}])
+
+
+def downgrade() -> None:
+    op.execute("DELETE FROM rollup_state WHERE name = 'related'")
+    op.drop_table("related_courses")
+    op.drop_table("course_coclicks")
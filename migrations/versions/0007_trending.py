@@ -0,0 +1,48 @@
+"""Трендовый рейтинг: courses.trending + индекс
+
+trending - log2 суммы 2^((ts - эпоха) / период полураспада) по кликам курса
+(см. main.TRENDING_*). Колонку заполняет фоновая задача main.refresh_trending
+с отметки 0 в rollup_state, дальше - только по новым кликам.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 22:40:00
+
+"""
+from contextlib import nullcontext
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007"
+down_revision: Union[str, None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PUBLISHED = sa.text("is_published")
+
+
+def upgrade() -> None:
+    op.add_column("courses", sa.Column("trending", sa.Float(), nullable=True))
+    state = sa.table("rollup_state", sa.column("name", sa.String()), sa.column("last_id", sa.Integer()))
+    op.bulk_insert(state, [{"name": "trending", "last_id": 0}])
+    # Диалект - из контекста: в offline-режиме (--sql) подключения нет
+    concurrently = op.get_context().dialect.name == "postgresql"
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block() if concurrently else nullcontext():
+        op.create_index(
+            "ix_courses_pub_trending", "courses", [sa.text("trending DESC"), "id"],
+            postgresql_concurrently=concurrently,
+            postgresql_where=PUBLISHED,
+            sqlite_where=PUBLISHED,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_courses_pub_trending", table_name="courses")
+    op.execute("DELETE FROM rollup_state WHERE name = 'trending'")
+    with op.batch_alter_table("courses") as batch:
+        batch.drop_column("trending")
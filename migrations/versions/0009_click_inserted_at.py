@@ -0,0 +1,64 @@
+"""Время записи клика: clicks.inserted_at
+
+ts - момент клика (ставится в буфере до сброса, при повторном сбросе он
+старый), а отметки агрегатов и trending сдвигаются только по кликам,
+записанным в БД дольше CLICK_ROLLUP_LAG_SECONDS назад - для этого нужно
+время вставки, которое ставит сама БД.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 10:20:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0009"
+down_revision: Union[str, None] = "0008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _clicks_table(*columns):
+    """clicks на ревизии 0008 (+ columns): в offline-режиме (--sql) batch не может
+    прочитать схему из БД, и пересоздаваемую таблицу передаем целиком"""
+    if not op.get_context().as_sql:
+        return None
+    return sa.Table(
+        "clicks", sa.MetaData(),
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("course_id", sa.Integer()),
+        sa.Column("ts", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("referer", sa.String(), nullable=True),
+        sa.Column("utm_source", sa.String(), nullable=True),
+        sa.Column("utm_campaign", sa.String(), nullable=True),
+        *columns,
+        sa.Index("ix_clicks_id", "id"),
+        sa.Index("ix_clicks_course_id", "course_id"),
+        sa.Index("ix_clicks_course_ts", "course_id", "ts"),
+        sa.Index("ix_clicks_ts", "ts"),
+    )
+
+
+def _inserted_at():
+    return sa.Column("inserted_at", sa.DateTime(timezone=True), server_default=sa.func.now())
+
+
+def upgrade() -> None:
+    if op.get_context().dialect.name == "sqlite":
+        # SQLite не добавляет колонку с DEFAULT CURRENT_TIMESTAMP через ALTER -
+        # таблица пересоздается; существующие клики получают время миграции
+        with op.batch_alter_table("clicks", recreate="always", copy_from=_clicks_table()) as batch:
+            batch.add_column(_inserted_at())
+    else:
+        # PostgreSQL: now() стабильна в транзакции, колонка добавляется без перезаписи таблицы
+        op.add_column("clicks", _inserted_at())
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("clicks", copy_from=_clicks_table(_inserted_at())) as batch:
+        batch.drop_column("inserted_at")
@@ -76,6 +76,47 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
+    // Подсказки в строке поиска (/api/suggest): список через <datalist>,
+    // выбор подсказки со ссылкой сразу открывает курс, тег или категорию
+    const searchInput = document.querySelector('.search-box input[name="query"]');
+    if (searchInput) {
+        const list = document.createElement('datalist');
+        list.id = 'search-suggestions';
+        searchInput.setAttribute('list', list.id);
+        searchInput.setAttribute('autocomplete', 'off');
+        searchInput.after(list);
+        
+        let suggestions = [];
+        let controller = null;
+        
+        searchInput.addEventListener('input', function(e) {
+            const picked = suggestions.find(s => s.text === this.value && s.url);
+            // Выбор из списка приходит событием без inputType
+            if (picked && !e.inputType) {
+                window.location.href = picked.url;
+                return;
+            }
+            const q = this.value.trim();
+            if (controller) controller.abort();
+            if (!q) {
+                list.replaceChildren();
+                return;
+            }
+            controller = new AbortController();
+            fetch(`/api/suggest?q=${encodeURIComponent(q)}`, { signal: controller.signal })
+                .then(response => response.json())
+                .then(data => {
+                    suggestions = data.suggestions;
+                    list.replaceChildren(...suggestions.map(s => {
+                        const option = document.createElement('option');
+                        option.value = s.text;
+                        return option;
+                    }));
+                })
+                .catch(() => {});
+        });
+    }
+    
     // Кнопка сброса фильтров
     const resetBtn = document.querySelector('.reset-filters');
     if (resetBtn) {
@@ -0,0 +1,80 @@
+"""Общие фикстуры: приложение на временной SQLite с тестовыми курсами"""
+import os
+import sys
+from datetime import datetime, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_TOKEN = "test-token"
+
+
+@pytest.fixture(scope="session")
+def main(tmp_path_factory):
+    """Модуль main.py; настройки он читает при импорте, поэтому окружение - до него"""
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{tmp_path_factory.mktemp('db') / 'courses.db'}",
+        ADMIN_TOKEN=ADMIN_TOKEN,
+        AUTO_MIGRATE="1",
+        AUTO_SEED="1",
+        TEMPLATE_CACHE_DIR="",
+        # Фоновые пересчеты тесты вызывают сами, когда им нужно
+        CLICK_ROLLUP_SECONDS="0",
+        TRENDING_SECONDS="0",
+        RELATED_SECONDS="0",
+        CATALOG_POLL_SECONDS="0",
+    )
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    import main
+
+    return main
+
+
+@pytest.fixture(scope="session")
+def client(main):
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def add_clicks(main, client):
+    """Пишет клики в БД напрямую, как сброс буфера: add_clicks(course_id, ts, n=1)"""
+    def add(course_id: int, ts: datetime, n: int = 1):
+        with main.engine.begin() as connection:
+            connection.execute(main.Click.__table__.insert(), [{"course_id": course_id, "ts": ts}] * n)
+
+    return add
+
+
+@pytest.fixture
+def settled(main, client):
+    """Все уже записанные клики учтены агрегатами, trending и совместными кликами"""
+    main.click_buffer.flush()
+    main.rollup_clicks(lag_seconds=0)
+    while main.trending_batch(lag_seconds=0)[2]:
+        pass
+    while main.coclick_batch(lag_seconds=0)[0]:
+        pass
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def watermark(main, name: str) -> int:
+    state = main.RollupState.__table__
+    with main.fresh_engine.connect() as connection:
+        return connection.execute(select(state.c.last_id).where(state.c.name == name)).scalar() or 0
+
+
+def last_click_id(main) -> int:
+    clicks = main.Click.__table__
+    with main.fresh_engine.connect() as connection:
+        return connection.execute(select(clicks.c.id).order_by(clicks.c.id.desc()).limit(1)).scalar() or 0
+
+
+def course_id(main, slug: str) -> int:
+    return main.get_catalog().find(slug).id
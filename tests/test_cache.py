@@ -0,0 +1,77 @@
+"""Кэши страниц, JSON и карточек сбрасываются после записи в админке"""
+import pytest
+from sqlalchemy import select
+
+from conftest import ADMIN_TOKEN
+
+FORM = {
+    "token": ADMIN_TOKEN,
+    "provider": "Тест",
+    "category_slug": "programming",
+    "level": "beginner",
+    "format": "online",
+    "price_from": "1000",
+    "duration": "1 неделя",
+    "tags": "cache,test",
+    "short_desc": "Курс для проверки кэша",
+    "affiliate_url": "https://example.com/aff/cache",
+    "is_published": "true",
+}
+
+
+def course_row(main, slug: str):
+    table = main.Course.__table__
+    with main.fresh_engine.connect() as connection:
+        return connection.execute(select(table.c.id, table.c.title).where(table.c.slug == slug)).one_or_none()
+
+
+def listing(client) -> str:
+    return client.get("/courses", params={"sort": "new"}).text
+
+
+@pytest.fixture
+def created(main, client):
+    """Курс, созданный через админку, после того как листинг уже в кэше"""
+    listing(client)
+    response = client.post(
+        "/admin/course/new", data={**FORM, "slug": "cache-course", "title": "Кэш: исходное название"},
+        follow_redirects=False,
+    )
+    assert response.status_code == 303
+    course_id = course_row(main, "cache-course").id
+    yield course_id
+    client.get(f"/admin/delete/{course_id}", params={"token": ADMIN_TOKEN})
+
+
+def test_create_invalidates_listing(client, created):
+    assert "Кэш: исходное название" in listing(client)
+    assert client.get("/api/course/cache-course").status_code == 200
+
+
+def test_update_invalidates_pages_json_and_cards(main, client, created):
+    assert "Кэш: исходное название" in client.get("/course/cache-course").text
+    assert client.get("/api/course/cache-course").json()["title"] == "Кэш: исходное название"
+    response = client.post(
+        f"/admin/course/{created}", data={**FORM, "slug": "cache-course", "title": "Кэш: новое название"},
+        follow_redirects=False,
+    )
+    assert response.status_code == 303
+    assert "Кэш: новое название" in client.get("/course/cache-course").text
+    assert client.get("/api/course/cache-course").json()["title"] == "Кэш: новое название"
+    page = listing(client)
+    assert "Кэш: новое название" in page and "Кэш: исходное название" not in page
+
+
+def test_unpublish_removes_course_from_cached_pages(client, created):
+    assert client.get("/api/course/cache-course").json()["is_published"] is True
+    form = {key: value for key, value in FORM.items() if key != "is_published"}
+    client.post(f"/admin/course/{created}", data={**form, "slug": "cache-course", "title": "Кэш: исходное название"})
+    assert "Кэш: исходное название" not in listing(client)
+    assert client.get("/api/course/cache-course").json()["is_published"] is False
+
+
+def test_delete_invalidates_pages(main, client, created):
+    assert client.get("/course/cache-course").status_code == 200
+    client.get(f"/admin/delete/{created}", params={"token": ADMIN_TOKEN})
+    assert client.get("/course/cache-course").status_code == 404
+    assert "Кэш: исходное название" not in listing(client)
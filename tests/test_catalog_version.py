@@ -0,0 +1,33 @@
+"""Снимок и кэши воркера догоняют изменения, сделанные мимо него (catalog_version)"""
+
+
+def listing(client) -> str:
+    return client.get("/courses", params={"sort": "new"}).text
+
+
+def test_change_from_other_worker_is_picked_up_by_version(main, client):
+    """Запись мимо этого воркера (bulk-запрос) видна после sync_catalog"""
+    assert "Кэш: чужой воркер" not in listing(client)
+    with main.engine.begin() as connection:
+        main.write_courses(connection, [{"slug": "cache-other", "title": "Кэш: чужой воркер", "is_published": True}])
+    assert main.sync_catalog()
+    assert "Кэш: чужой воркер" in listing(client)
+    assert not main.sync_catalog()
+
+
+def test_orm_write_bumps_version(main, client):
+    def version():
+        with main.fresh_engine.connect() as connection:
+            return main.catalog_version(connection)
+
+    before = version()
+    db = main.SessionLocal()
+    try:
+        course = db.query(main.Course).filter(main.Course.slug == "ai-marketing").one()
+        course.short_desc = "Изменено мимо админки"
+        db.commit()
+    finally:
+        db.close()
+    assert version() == before + 1
+    assert main.sync_catalog()
+    assert main.get_catalog().find("ai-marketing").short_desc == "Изменено мимо админки"
@@ -0,0 +1,100 @@
+"""Клики из буфера и отметки фоновых задач: "осевшим" клик считается по времени записи в БД"""
+import threading
+from datetime import timedelta
+
+from sqlalchemy import select
+
+from conftest import course_id, last_click_id, utcnow, watermark
+
+LAG = 60  # для "свежих" кликов: записаны только что, лаг еще не прошел
+
+
+def test_buffered_click_gets_insert_time(main, client, settled):
+    response = client.get("/out/youtube-ai", follow_redirects=False)
+    assert response.status_code == 302
+    assert main.click_buffer.flush() == 1
+    clicks = main.Click.__table__
+    with main.fresh_engine.connect() as connection:
+        row = connection.execute(
+            select(clicks.c.course_id, clicks.c.inserted_at).order_by(clicks.c.id.desc()).limit(1)
+        ).one()
+    assert row.course_id == course_id(main, "youtube-ai")
+    assert abs(main.as_utc(row.inserted_at) - utcnow()) < timedelta(minutes=1)
+
+
+def test_rollup_waits_for_insert_time_not_click_time(main, settled, add_clicks):
+    before = watermark(main, "clicks")
+    # Клик из повторного сброса буфера: ts час назад, а в БД он только что
+    add_clicks(course_id(main, "midjourney-basics"), utcnow() - timedelta(hours=1))
+    assert main.rollup_clicks_batch(lag_seconds=LAG) == 0
+    assert watermark(main, "clicks") == before
+    assert main.rollup_clicks_batch(lag_seconds=0) == 1
+    assert watermark(main, "clicks") == last_click_id(main)
+
+
+def test_trending_waits_for_insert_time(main, settled, add_clicks):
+    target = course_id(main, "figma-ai")
+    before = watermark(main, "trending")
+    add_clicks(target, utcnow() - timedelta(hours=1), n=2)
+    assert main.trending_batch(lag_seconds=LAG) == (before, before, {})
+
+    start, end, scores = main.trending_batch(lag_seconds=0)
+    assert (start, end) == (before, last_click_id(main))
+    assert set(scores) == {target}
+    assert main.trending_now(scores[target]) > 0
+
+
+def test_coclicks_wait_for_insert_time(main, settled, add_clicks):
+    before = watermark(main, "related")
+    add_clicks(course_id(main, "video-ai"), utcnow() - timedelta(hours=1))
+    assert main.coclick_batch(lag_seconds=LAG)[0] == 0
+    assert watermark(main, "related") == before
+    assert main.coclick_batch(lag_seconds=0)[0] == 1
+
+
+def calls_until(target, count):
+    """Вызовы target, считая их; после count-го - событие done"""
+    done = threading.Event()
+    calls = []
+
+    def call():
+        calls.append(1)
+        if len(calls) >= count:
+            done.set()
+        if len(calls) == 1:
+            raise RuntimeError("сбой в фоновом потоке")
+        return target()
+
+    return call, done
+
+
+def test_flusher_survives_unexpected_error(main, monkeypatch):
+    buffer = main.ClickBuffer(flush_size=100, flush_seconds=0.01)
+    flush, done = calls_until(lambda: 0, 3)
+    monkeypatch.setattr(buffer, "flush", flush)
+    buffer.start()
+    try:
+        assert done.wait(5)
+        assert buffer.is_alive()
+    finally:
+        buffer.stop()
+    assert not buffer.is_alive()
+
+
+def test_periodic_job_survives_unexpected_error(main):
+    target, done = calls_until(lambda: None, 3)
+    job = main.PeriodicJob("test-job", 0.01, target, run_at_start=True)
+    job.start()
+    try:
+        assert done.wait(5)
+        assert job._thread.is_alive()
+    finally:
+        job.stop()
+
+
+def test_readyz_reports_dead_flusher(main, client, monkeypatch):
+    assert client.get("/readyz").status_code == 200
+    monkeypatch.setattr(main.click_buffer, "is_alive", lambda: False)
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json()["status"] == "click flusher stopped"
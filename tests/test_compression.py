@@ -0,0 +1,63 @@
+"""Потоковое сжатие gzip/br: каждый кусок разжимается сразу, ответ - с Vary"""
+import gzip
+import importlib.util
+import zlib
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+CHUNKS = [("строка %d: " % n + "курс " * 100 + "\n").encode() for n in range(20)]
+
+ENCODINGS = [
+    "gzip",
+    pytest.param("br", marks=pytest.mark.skipif(importlib.util.find_spec("brotli") is None, reason="нет brotli")),
+]
+
+
+def decompressor(encoding):
+    if encoding == "br":
+        import brotli
+        return brotli.Decompressor().process
+    return zlib.decompressobj(31).decompress
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_stream_compressor_roundtrip_chunk_by_chunk(main, encoding):
+    compressor = main.StreamCompressor(encoding)
+    decompress = decompressor(encoding)
+    for chunk in CHUNKS:
+        # Сразу после compress() кусок разжимается целиком - клиент не ждет конца ответа
+        assert decompress(compressor.compress(chunk)) == chunk
+    assert decompress(compressor.finish()) == b""
+
+
+def run_streaming(main, accept_encoding):
+    """Ответ StreamingResponse через CompressionMiddleware: (заголовки, сырые куски тела)"""
+    app = Starlette(routes=[Route(
+        "/stream", lambda request: StreamingResponse(iter(CHUNKS), media_type="application/x-ndjson")
+    )])
+    app.add_middleware(main.CompressionMiddleware)
+    with TestClient(app) as client:
+        with client.stream("GET", "/stream", headers={"Accept-Encoding": accept_encoding}) as response:
+            return response.headers, list(response.iter_raw())
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_middleware_streams_compressed_body(main, encoding):
+    headers, bodies = run_streaming(main, encoding)
+    assert headers["content-encoding"] == encoding
+    assert "accept-encoding" in headers["vary"].lower()
+    assert "content-length" not in headers
+    decompress = decompressor(encoding)
+    assert b"".join(decompress(body) for body in bodies) == b"".join(CHUNKS)
+    if encoding == "gzip":
+        assert gzip.decompress(b"".join(bodies)) == b"".join(CHUNKS)
+
+
+def test_middleware_passes_through_without_accept_encoding(main):
+    headers, bodies = run_streaming(main, "identity")
+    assert "content-encoding" not in headers
+    assert b"".join(bodies) == b"".join(CHUNKS)
@@ -0,0 +1,60 @@
+"""Дизъюнктивные фасеты: счетчик варианта = число курсов, если выбрать этот вариант"""
+from bisect import bisect_right
+from itertools import product
+
+import pytest
+
+COMBOS = list(product(
+    (None, "design", "coding", "no-such-category"),
+    (None, "beginner", "pro"),
+    (None, "online"),
+    ((None, None), (0, 20000), (10000, None)),
+))
+
+
+def count(catalog, **filters):
+    return catalog.select(per_page=1, **filters).total
+
+
+@pytest.mark.parametrize("category,level,format,price", COMBOS)
+def test_facet_counts_match_select(main, client, category, level, format, price):
+    catalog = main.get_catalog()
+    price_min, price_max = price
+    filters = dict(category=category, level=level, format=format, price_min=price_min, price_max=price_max)
+    facets = catalog.facets(**filters)
+    assert facets["total"] == count(catalog, **filters)
+    for facet, codes in (("category", catalog.category_codes), ("level", catalog.level_codes),
+                         ("format", catalog.format_codes)):
+        for value in codes:
+            if value:
+                # Вариант фасета заменяет его собственный фильтр, остальные действуют
+                assert facets[facet][value] == count(catalog, **{**filters, facet: value}), (facet, value)
+
+
+@pytest.mark.parametrize("category,level,format", [(None, None, None), ("design", None, None), (None, "beginner", "online")])
+def test_price_histogram_ignores_price_filter(main, client, category, level, format):
+    catalog = main.get_catalog()
+    facets = catalog.facets(category=category, level=level, format=format, price_min=1, price_max=2)
+    courses = catalog.select(category=category, level=level, format=format, per_page=1000).courses
+    prices = [row.price_from for row in courses if row.price_from is not None]
+    expected = [0] * len(main.PRICE_BUCKETS)
+    for price in prices:
+        expected[bisect_right(main.PRICE_BUCKETS, price) - 1] += 1
+    assert [bucket["count"] for bucket in facets["price"]["histogram"]] == expected
+    assert facets["price"]["min"] == min(prices, default=None)
+    assert facets["price"]["max"] == max(prices, default=None)
+
+
+def test_tag_filter_applies_to_every_facet(main, client):
+    catalog = main.get_catalog()
+    tag = max(catalog.tag_index, key=lambda slug: len(catalog.tag_index[slug]))
+    facets = catalog.facets(tags=[tag], level="beginner")
+    assert facets["total"] == count(catalog, tags=[tag], level="beginner")
+    for value in catalog.level_codes:
+        if value:
+            assert facets["level"][value] == count(catalog, tags=[tag], level=value)
+
+
+def test_api_facets_matches_snapshot(main, client):
+    body = client.get("/api/facets", params={"category": "design", "level": "beginner"}).json()
+    assert body == main.get_catalog().facets(category="design", level="beginner")
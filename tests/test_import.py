@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from conftest import ADMIN_TOKEN
+
+
+def post_import(client, name: str, body: str):
+    response = client.post(
+        "/api/admin/import/courses", params={"token": ADMIN_TOKEN}, files={"file": (name, body.encode())}
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_import_requires_token(client):
+    response = client.post("/api/admin/import/courses", params={"token": "wrong"}, files={"file": ("c.csv", b"")})
+    assert response.status_code == 403
+
+
+def test_import_csv_reports_bad_rows(client):
+    report = post_import(client, "courses.csv", "\n".join([
+        "slug,title,level,price_from,is_published",
+        "imp-ok,Импорт без ошибок,beginner,12.0,1",
+        "imp-inf,Бесконечность,,inf,",
+        "imp-huge,Переполнение,,1e999,",
+        "imp-frac,Дробная цена,,12.5,",
+        "imp-big,Больше INTEGER,,1e30,",
+        "imp-nan,Не число,,nan,",
+        "imp-neg,Отрицательная,,-5,",
+        "imp-text,Текст,,дорого,",
+        ",Без slug,,,",
+        "imp-notitle,,,,",
+        "imp-level,Уровень,expert,,",
+        "imp-pub,Публикация,,,может быть",
+    ]))
+    assert report["rows"] == 12
+    assert (report["inserted"], report["updated"], report["errors"]) == (1, 0, 11)
+    errors = {row["line"]: row["error"] for row in report["error_rows"]}
+    assert sorted(errors) == list(range(3, 14))
+    for line in (3, 4, 5, 7):
+        assert "целым числом" in errors[line]
+    assert "больше" in errors[6]
+    assert "отрицательной" in errors[8]
+    assert "не число" in errors[9]
+    assert "slug" in errors[10]
+    assert "title" in errors[11]
+    assert "level" in errors[12]
+    assert "is_published" in errors[13]
+
+    course = client.get("/api/course/imp-ok").json()
+    assert course["price_from"] == 12
+    assert client.get("/api/course/imp-big").status_code == 404
+
+
+@pytest.mark.parametrize("price", ["1e30", "1e999", "12.5", "-1"])
+def test_import_jsonl_number_prices_are_row_errors(client, price):
+    report = post_import(client, "courses.jsonl", "\n".join([
+        json.dumps({"slug": "jsonl-ok", "title": "JSONL"}),
+        f'{{"slug": "jsonl-bad", "title": "JSONL", "price_from": {price}}}',
+        "{не json",
+    ]))
+    assert report["errors"] == 2
+    assert [row["line"] for row in report["error_rows"]] == [2, 3]
+    assert report["error_rows"][0]["slug"] == "jsonl-bad"
+
+
+def test_import_upserts_by_slug_and_refreshes_catalog(client):
+    post_import(client, "courses.csv", "slug,title,price_from\nimp-upsert,Старое название,100\n")
+    assert client.get("/api/course/imp-upsert").json()["title"] == "Старое название"
+    report = post_import(client, "courses.csv", "slug,title,price_from\nimp-upsert,Новое название,200\n")
+    assert (report["inserted"], report["updated"]) == (0, 1)
+    course = client.get("/api/course/imp-upsert").json()
+    assert (course["title"], course["price_from"]) == ("Новое название", 200)
@@ -0,0 +1,136 @@
+import re
+
+import pytest
+from fastapi import HTTPException
+
+SORTS = ("popular", "new", "price_asc", "price_desc", "trending")
+
+
+def test_cursor_roundtrip(main):
+    cursor = main.encode_cursor("price_asc", 15000.0, 7)
+    assert main.decode_cursor(cursor, "price_asc") == (15000.0, 7)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "WyJwb3B1bGFyIl0"])
+def test_decode_cursor_rejects_garbage(main, cursor):
+    with pytest.raises(HTTPException) as error:
+        main.decode_cursor(cursor, "popular")
+    assert error.value.status_code == 400
+
+
+def test_decode_cursor_rejects_other_sort(main):
+    with pytest.raises(HTTPException) as error:
+        main.decode_cursor(main.encode_cursor("new", 1.0, 1), "popular")
+    assert error.value.status_code == 400
+
+
+def walk_pages(client, sort, per_page):
+    slugs, page = [], 1
+    while True:
+        body = client.get("/api/courses", params={"sort": sort, "page": page, "per_page": per_page}).json()
+        slugs += [course["slug"] for course in body["courses"]]
+        if page >= body["total_pages"]:
+            return slugs
+        page += 1
+
+
+def walk_cursor(client, sort, per_page, **params):
+    slugs = []
+    while True:
+        body = client.get("/api/courses", params={"sort": sort, "per_page": per_page, **params}).json()
+        slugs += [course["slug"] for course in body["courses"]]
+        if body["next_cursor"] is None:
+            return slugs, body
+        params["cursor"] = body["next_cursor"]
+
+
+@pytest.mark.parametrize("sort", SORTS)
+def test_api_cursor_walk_matches_pages(client, sort):
+    pages = walk_pages(client, sort, per_page=4)
+    cursor_slugs, _ = walk_cursor(client, sort, per_page=4)
+    assert len(pages) > 4
+    assert cursor_slugs == pages
+    assert len(set(cursor_slugs)) == len(cursor_slugs)
+
+
+def test_api_cursor_with_filter_and_total(client):
+    pages = [
+        course["slug"]
+        for course in client.get("/api/courses", params={"category": "design", "per_page": 100}).json()["courses"]
+    ]
+    slugs, last = walk_cursor(client, "popular", per_page=1, category="design", with_total="true")
+    assert slugs == pages
+    assert last["total"] == len(pages)
+    assert last["page"] is None
+
+
+def test_api_cursor_last_page_has_no_next(client):
+    body = client.get("/api/courses", params={"per_page": 100}).json()
+    assert body["next_cursor"] is None
+
+
+def cursor_pages(catalog, per_page, **filters):
+    """Страницы select() вперед по next_cursor: [(cursor, page), ...]"""
+    pages, cursor = [], None
+    while True:
+        page = catalog.select(per_page=per_page, cursor=cursor, **filters)
+        pages.append((cursor, page))
+        if page.next_cursor is None:
+            return pages
+        cursor = page.next_cursor
+
+
+@pytest.mark.parametrize("filters", [{"sort": "price_asc"}, {"sort": "new", "level": "beginner"}])
+def test_prev_cursor_walks_back_through_same_pages(main, client, filters):
+    catalog = main.get_catalog()
+    pages = cursor_pages(catalog, 3, **filters)
+    assert len(pages) > 2
+    for (_, previous), (cursor, page) in zip(pages, pages[1:]):
+        back = catalog.select(per_page=3, cursor=page.prev_cursor or None, **filters)
+        assert [row.id for row in back.courses] == [row.id for row in previous.courses]
+    assert pages[0][1].prev_cursor is None
+    assert pages[1][1].prev_cursor == ""
+
+
+def test_cursor_page_offset_matches_page_numbers(main, client):
+    catalog = main.get_catalog()
+    for number, (_, page) in enumerate(cursor_pages(catalog, 4, sort="popular", category="design"), 1):
+        assert page.offset == (number - 1) * 4
+        numbered = catalog.select(per_page=4, page=number, sort="popular", category="design")
+        assert numbered.offset == page.offset
+        assert numbered.total_pages == page.total_pages
+
+
+def links(html, kind):
+    return [link.replace("&amp;", "&") for link in re.findall(rf'href="(\?{kind}=[^"]*)"', html)]
+
+
+def test_html_numbered_pages_then_cursor(main, client, monkeypatch, request):
+    first = client.get("/courses", params={"sort": "price_asc"}).text
+    assert links(first, "page") == ["?page=2&sort=price_asc"]
+    second = client.get("/courses?page=2&sort=price_asc").text
+    assert "Страница 2 из" in second
+    assert links(second, "page")[0] == "?page=1&sort=price_asc"
+
+    # Глубже HTML_PAGE_DEPTH - по курсору, с номером страницы и ссылкой назад
+    monkeypatch.setattr(main, "HTML_PAGE_DEPTH", 1)
+    main.page_cache.pages.clear()
+    request.addfinalizer(main.page_cache.pages.clear)
+    first = client.get("/courses", params={"sort": "price_desc"}).text
+    [link] = links(first, "cursor")
+    second = client.get("/courses" + link).text
+    assert "В начало" in second
+    assert "Страница 2 из" in second
+    [back, *forward] = links(second, "cursor")
+    assert back.startswith("?cursor=&")
+    assert all(next_link != link for next_link in forward)
+
+
+def test_html_empty_cursor_is_first_page(client):
+    response = client.get("/courses", params={"cursor": ""})
+    assert response.status_code == 200
+    assert links(response.text, "page") == links(client.get("/courses").text, "page")
+
+
+def test_html_invalid_cursor_is_400(client):
+    assert client.get("/courses", params={"cursor": "garbage"}).status_code == 400
@@ -0,0 +1,86 @@
+"""FairQueuePool: соединение-писатель выдается в порядке ожидания, ожидание ограничено timeout"""
+import sqlite3
+import threading
+import time
+
+import pytest
+from sqlalchemy import exc
+
+
+def make_pool(main, timeout=5.0):
+    return main.FairQueuePool(
+        lambda: sqlite3.connect(":memory:", check_same_thread=False), pool_size=1, max_overflow=0, timeout=timeout
+    )
+
+
+def wait_for_waiters(pool, count):
+    deadline = time.monotonic() + 5
+    while len(pool._waiters) < count:
+        assert time.monotonic() < deadline, "поток не встал в очередь"
+        time.sleep(0.001)
+
+
+def test_connections_are_handed_out_in_wait_order(main):
+    pool = make_pool(main)
+    order = []
+
+    def writer(name, repeat=1):
+        for _ in range(repeat):
+            connection = pool.connect()
+            order.append(name)
+            connection.close()
+
+    held = pool.connect()
+    threads = []
+    for k, name in enumerate(["greedy", "a", "b", "c"]):
+        # greedy сразу просит соединение снова - и встает в конец очереди
+        threads.append(threading.Thread(target=writer, args=(name, 3 if name == "greedy" else 1)))
+        threads[-1].start()
+        wait_for_waiters(pool, k + 1)
+    held.close()
+    for thread in threads:
+        thread.join()
+    assert order == ["greedy", "a", "b", "c", "greedy", "greedy"]
+
+
+def test_busy_writer_does_not_starve_others(main):
+    pool = make_pool(main, timeout=2.0)
+    stop = threading.Event()
+
+    def greedy():
+        while not stop.is_set():
+            connection = pool.connect()
+            time.sleep(0.001)
+            connection.close()
+
+    threads = [threading.Thread(target=greedy) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    try:
+        waits = []
+        for _ in range(20):
+            started = time.monotonic()
+            pool.connect().close()
+            waits.append(time.monotonic() - started)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    assert max(waits) < 0.5
+
+
+def test_timeout_leaves_pool_usable(main):
+    pool = make_pool(main, timeout=0.1)
+    held = pool.connect()
+    started = time.monotonic()
+    with pytest.raises(exc.TimeoutError):
+        pool.connect()
+    assert 0.1 <= time.monotonic() - started < 2
+    assert not pool._waiters
+    held.close()
+    # Разрешение после таймаута не потеряно и не удвоено
+    first = pool.connect()
+    with pytest.raises(exc.TimeoutError):
+        pool.connect()
+    first.close()
+    pool.connect().close()
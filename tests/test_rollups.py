@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+from conftest import ADMIN_TOKEN, course_id, last_click_id, utcnow
+
+
+def test_rollup_counts_each_click_once_in_its_ts_bucket(main, client, settled, add_clicks):
+    slug = "stable-diffusion"
+    ts = (utcnow() - timedelta(days=3)).replace(hour=10, minute=30)
+    add_clicks(course_id(main, slug), ts, n=3)
+    assert main.rollup_clicks(lag_seconds=0) == 3
+    assert main.rollup_clicks(lag_seconds=0) == 0
+
+    response = client.get("/api/admin/stats", params={
+        "token": ADMIN_TOKEN, "grain": "hour", "course": slug,
+        "from": (ts - timedelta(hours=1)).isoformat(), "to": (ts + timedelta(hours=1)).isoformat(),
+    })
+    rows = response.json()["rows"]
+    assert rows == [{"bucket": ts.replace(minute=0, second=0, microsecond=0).isoformat(), "clicks": 3}]
+    assert response.json()["rolled_up_to_click_id"] == last_click_id(main)
+
+
+def test_claim_click_batch_takes_settled_clicks_once(main, client, settled, add_clicks):
+    calls = []
+
+    def on_batch(connection, last_id, new_last_id, rows):
+        calls.append((last_id, new_last_id, rows))
+        return len(rows)
+
+    def claim(lag_seconds):
+        return main.claim_click_batch("claim-test", ("course_id",), on_batch, 2, lag_seconds)
+
+    # Отметка "claim-test" создается с нуля - сначала догоняем уже записанные клики
+    while claim(0)[1]:
+        pass
+    head = last_click_id(main)
+    target = course_id(main, "figma-ai")
+    ts = utcnow() - timedelta(hours=2)
+    add_clicks(target, ts, n=3)
+    calls.clear()
+
+    assert claim(60) == (head, None)  # клики только что записаны - еще не осели
+    assert claim(0) == (head, 2)  # пачка ограничена batch_size
+    assert claim(0) == (head + 2, 1)
+    assert claim(0) == (head + 3, None)
+    assert [(last_id, new_last_id) for last_id, new_last_id, _ in calls] == [(head, head + 2), (head + 2, head + 3)]
+    rows = [row for _, _, batch in calls for row in batch]
+    assert [click_id for click_id, _, _ in rows] == [head + 1, head + 2, head + 3]
+    assert all(click_ts == ts and course == target for _, click_ts, course in rows)
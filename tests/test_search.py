@@ -0,0 +1,40 @@
+"""Индекс courses_fts не расходится с courses, даже если курс записан до init_search_index"""
+from sqlalchemy import text
+
+
+def fts_rowids(main) -> set:
+    with main.fresh_engine.connect() as connection:
+        return set(connection.execute(text("SELECT rowid FROM courses_fts")).scalars())
+
+
+def course_ids(main) -> set:
+    with main.fresh_engine.connect() as connection:
+        return set(connection.execute(text("SELECT id FROM courses")).scalars())
+
+
+def test_course_written_before_init_is_indexed(main, client, monkeypatch):
+    monkeypatch.setattr(main, "SEARCH_BACKEND", None)
+    with main.SessionLocal() as db:
+        course = main.Course(slug="fts-late", title="Квантовая кулинария", provider="Тест",
+                             category_slug="programming", tags="fts", short_desc="Индекс без init")
+        db.add(course)
+        db.commit()
+        course_id = course.id
+    try:
+        assert main.SEARCH_BACKEND == "fts5"
+        assert course_id in fts_rowids(main)
+        with main.ReadSessionLocal() as db:
+            assert main.search_course_ids(db, "квантовая") == [course_id]
+    finally:
+        with main.SessionLocal() as db:
+            db.delete(db.get(main.Course, course_id))
+            db.commit()
+    assert course_id not in fts_rowids(main)
+
+
+def test_init_rebuilds_drifted_index(main, client):
+    with main.engine.begin() as connection:
+        connection.execute(text("DELETE FROM courses_fts WHERE rowid = (SELECT max(rowid) FROM courses_fts)"))
+    assert fts_rowids(main) != course_ids(main)
+    main.init_search_index()
+    assert fts_rowids(main) == course_ids(main)
@@ -0,0 +1,77 @@
+"""Клики и пересортировка снимка из нескольких потоков"""
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+
+def snapshot(main, n=200):
+    courses = [
+        SimpleNamespace(**{**dict.fromkeys(main.COURSE_FIELDS), "id": i, "slug": f"c{i}", "clicks": 0})
+        for i in range(1, n + 1)
+    ]
+    return main.CatalogSnapshot(courses)
+
+
+def run_threads(count, target):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_clicks_are_not_lost(main):
+    catalog = snapshot(main)
+
+    def click():
+        for course_id in range(1, 201):
+            catalog.record_click(course_id)
+
+    run_threads(8, click)
+    assert list(catalog.clicks) == [8] * 200
+    assert all(row.clicks == 8 for row in catalog.rows)
+
+
+def test_sort_order_is_consistent_during_resorts(main, monkeypatch):
+    monkeypatch.setattr(main, "CATALOG_RESORT_SECONDS", 0)
+    catalog = snapshot(main)
+    stop = threading.Event()
+    errors = []
+
+    def click():
+        course_id = 0
+        while not stop.is_set():
+            catalog.record_click(course_id % 200 + 1)
+            course_id += 7
+
+    def read():
+        try:
+            for _ in range(300):
+                current = catalog.sort_order("popular")
+                assert all(current.positions[i] == position for position, i in enumerate(current.order))
+                page = catalog.select(sort="popular", per_page=20)
+                assert len({row.id for row in page.courses}) == 20
+                # Курсор - от того же поколения порядка, что и сама страница
+                _, tiebreak = main.decode_cursor(page.next_cursor, "popular")
+                assert tiebreak == page.courses[-1].id
+        except AssertionError as error:
+            errors.append(error)
+
+    clicker = threading.Thread(target=click)
+    clicker.start()
+    try:
+        run_threads(4, read)
+    finally:
+        stop.set()
+        clicker.join()
+    assert errors == []
+
+
+@pytest.mark.parametrize("sort", ["popular", "trending"])
+def test_resort_picks_up_clicks(main, monkeypatch, sort):
+    monkeypatch.setattr(main, "CATALOG_RESORT_SECONDS", 0)
+    catalog = snapshot(main, n=10)
+    for _ in range(3):
+        catalog.record_click(7)
+    assert catalog.select(sort=sort, per_page=1).courses[0].id == 7
@@ -0,0 +1,46 @@
+"""Старт без миграций (AUTO_MIGRATE=0): отдельный процесс со своей пустой базой"""
+import json
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+SCRIPT = """
+import json, threading
+from fastapi.testclient import TestClient
+import main
+
+def threads():
+    return sorted(t.name for t in threading.enumerate() if t.name in {"catalog-watcher", "trending", "related-courses"})
+
+result = {}
+with TestClient(main.app) as client:
+    result["before"] = [client.get("/readyz").status_code, threads()]
+    main.migrate_database()  # python main.py migrate из соседнего процесса
+    result["after"] = [client.get("/readyz").status_code, threads(), main.SEARCH_BACKEND]
+    client.get("/readyz")
+    result["again"] = threads()
+print(json.dumps(result))
+"""
+
+
+def test_jobs_start_once_schema_is_migrated_after_boot(tmp_path):
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{tmp_path / 'late.db'}",
+        AUTO_MIGRATE="0",
+        AUTO_SEED="0",
+        TEMPLATE_CACHE_DIR="",
+        CATALOG_POLL_SECONDS="1",
+        TRENDING_SECONDS="60",
+        RELATED_SECONDS="300",
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT], cwd=ROOT, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    assert result["before"] == [503, []]
+    jobs = ["catalog-watcher", "related-courses", "trending"]
+    assert result["after"] == [200, jobs, "fts5"]
+    assert result["again"] == jobs
@@ -0,0 +1,53 @@
+"""SuggestIndex.top совпадает с перебором всех ключей"""
+import random
+
+import pytest
+
+
+def brute_top(entries, weights, prefix, limit):
+    best = {}
+    for (key, kind, ref), weight in zip(entries, weights):
+        if key.startswith(prefix):
+            best[(kind, ref)] = max(best.get((kind, ref), weight), weight)
+    ranked = sorted(best.items(), key=lambda item: -item[1])
+    return [(kind, ref, weight) for (kind, ref), weight in ranked[:limit]]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_top_matches_brute_force(main, seed):
+    rng = random.Random(seed)
+    refs = list(range(300))
+    # Вес - у ref (как у курса или тега), все веса разные - порядок однозначен
+    weight_of = dict(zip(refs, rng.sample(range(10_000), len(refs))))
+    entries = sorted(
+        ("".join(rng.choice("абвг") for _ in range(rng.randint(1, 6))), ref % 2, ref)
+        for ref in refs for _ in range(rng.randint(1, 3))
+    )
+    weights = [weight_of[ref] for _, _, ref in entries]
+    index = main.SuggestIndex(entries, weights)
+    prefixes = {key[:n] for key, _, _ in entries for n in range(1, 4)} | {"", "д", "абвгабвг"}
+    for prefix in sorted(prefixes):
+        for limit in (1, 5, 20):
+            assert index.top(prefix, limit) == brute_top(entries, weights, prefix, limit), (prefix, limit)
+
+
+def test_catalog_index_matches_brute_force(main, client):
+    catalog = main.get_catalog()
+    index = main.SuggestIndex.build(catalog)
+    prefixes = {key[:n] for key in index.keys for n in (1, 2, 3)}
+    for prefix in sorted(prefixes):
+        found = index.top(prefix, 8)
+        expected = brute_top(index.entries, index.weights, prefix, len(index.entries))
+        # Равные веса могут идти в любом порядке - сравниваем веса и вес каждой находки
+        assert [weight for _, _, weight in found] == [weight for _, _, weight in expected[:8]], prefix
+        weight_of = {(kind, ref): weight for kind, ref, weight in expected}
+        assert all(weight_of[(kind, ref)] == weight for kind, ref, weight in found), prefix
+
+
+def test_incremental_build_matches_full(main, client):
+    catalog = main.get_catalog()
+    full = main.SuggestIndex.build(catalog)
+    changed = {row.id for row in catalog.rows[::3]}
+    incremental = main.SuggestIndex.build(catalog, full, changed)
+    assert incremental.entries == full.entries
+    assert list(incremental.weights) == list(full.weights)
@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+import pytest
+
+from conftest import course_id, utcnow
+
+
+def test_trending_from_other_worker_reaches_snapshot(main, settled, add_clicks):
+    target = course_id(main, "ai-photo")
+    add_clicks(target, utcnow(), n=5)
+    # Пачку забрал другой воркер: этот перечитывает рейтинги, раз отметка ушла вперед
+    scores = main.trending_batch(lag_seconds=0)[2]
+    main.refresh_trending()
+    catalog = main.get_catalog()
+    assert catalog.trending[catalog.index[target]] == pytest.approx(scores[target])
+
+
+def test_trending_decays_with_click_age(main, settled, add_clicks):
+    old, fresh = course_id(main, "seo-ai"), course_id(main, "smm-ai")
+    half_life = timedelta(hours=main.TRENDING_HALF_LIFE_HOURS)
+    now = utcnow()
+    # 4 клика два периода полураспада назад весят как 1 сегодняшний
+    add_clicks(old, now - 2 * half_life, n=4)
+    add_clicks(fresh, now, n=2)
+    scores = main.trending_batch(lag_seconds=0)[2]
+    assert main.trending_now(scores[old], now) == pytest.approx(1, rel=1e-3)
+    assert main.trending_now(scores[fresh], now) == pytest.approx(2, rel=1e-3)